@@ -0,0 +1,133 @@
+"""
+asyncio-based conversion and rendering of block values, for values whose children need I/O to become
+renderable (chooser lookups that aren't covered by a prefetch, embeds and the like). Python 3.4+ only -
+reached through Block.arenderable / Block.arender, or render_concurrently from synchronous code.
+
+The children of list, stream and struct values are converted concurrently, and assembled in their original
+order. Calls to renderable that may block (as reported by Block.renderable_needs_io) run in a thread pool,
+at most RenderContext.max_concurrency at a time; other conversions run directly on the event loop. As with
+Block.renderable, the objects referenced by the whole value are fetched in bulk (in the thread pool) before
+any children are converted.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections
+
+import six
+
+from core.blocks import (
+    ListBlock, BaseStreamBlock, BaseStructBlock, RenderableListBlock, RenderableStreamBlock, RenderableStructBlock
+)
+from core.prefetch import PrefetchedObjects, active_prefetch, activate_prefetch
+from core.values import stream_items
+
+
+DEFAULT_MAX_CONCURRENCY = 10
+
+
+class RenderContext(object):
+    """
+    State shared by the coroutines converting one value: the thread pool for blocking calls, the semaphore
+    bounding their concurrency, and the prefetched objects referenced by the value
+    """
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, executor=None, loop=None):
+        self.max_concurrency = max_concurrency
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = executor
+        self.semaphore = asyncio.Semaphore(max_concurrency, loop=self.loop)
+        self.prefetched = active_prefetch()
+
+    @asyncio.coroutine
+    def run_blocking(self, func, *args):
+        """Run func(*args) in the thread pool, with this context's prefetched objects active"""
+        with (yield from self.semaphore):
+            return (yield from self.loop.run_in_executor(self.executor, call_in_thread, self.prefetched, func, args))
+
+
+def call_in_thread(prefetched, func, args):
+    try:
+        with activate_prefetch(prefetched):
+            return func(*args)
+    finally:
+        # database connections are per-thread, and pool threads outlive the request
+        for connection in connections.all():
+            connection.close()
+
+
+def child_values(block, value):
+    """
+    Return a list of (key, child block, child value) for the children of a list / stream / struct value, where
+    'key' is the index or name to pass to the renderable's set_renderable; or None if 'block' has no children
+    """
+    if isinstance(block, ListBlock):
+        return [(i, block.child_block, child_value) for (i, child_value) in enumerate(value)]
+    elif isinstance(block, BaseStreamBlock):
+        return [
+            (i, block.child_blocks[name], child_value)
+            for (i, (name, child_value)) in enumerate(stream_items(value))
+        ]
+    elif isinstance(block, BaseStructBlock):
+        return [(name, block.child_blocks[name], child_value) for (name, child_value) in value.items()]
+    return None
+
+
+RENDERABLE_CLASSES = [
+    (ListBlock, RenderableListBlock),
+    (BaseStreamBlock, RenderableStreamBlock),
+    (BaseStructBlock, RenderableStructBlock),
+]
+
+
+@asyncio.coroutine
+def arenderable(block, value, context=None):
+    """Coroutine returning block.renderable(value), converting child values concurrently"""
+    if context is None:
+        context = RenderContext()
+
+    children = child_values(block, value)
+    if children is None:
+        if block.renderable_needs_io(value):
+            return (yield from context.run_blocking(block.renderable, value))
+        with activate_prefetch(context.prefetched):
+            return block.renderable(value)
+
+    if context.prefetched is None and block.referenced_models():
+        prefetched = PrefetchedObjects()
+        block.collect_references(value, prefetched)
+        yield from context.run_blocking(prefetched.resolve)
+        context.prefetched = prefetched
+
+    converted = yield from asyncio.gather(
+        *[arenderable(child_block, child_value, context) for (key, child_block, child_value) in children],
+        loop=context.loop
+    )
+
+    renderable_class = [cls for (block_class, cls) in RENDERABLE_CLASSES if isinstance(block, block_class)][0]
+    with activate_prefetch(context.prefetched):
+        result = renderable_class(block, value)
+    for (key, child_block, child_value), child_renderable in zip(children, converted):
+        result.set_renderable(key, child_renderable)
+    return result
+
+
+@asyncio.coroutine
+def arender(block, value, context=None):
+    """Coroutine returning the HTML rendering of 'value', with child values converted concurrently"""
+    renderable = yield from arenderable(block, value, context)
+    return six.text_type(renderable)
+
+
+def render_concurrently(block, value, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+    """
+    Synchronous wrapper for arender, for use from ordinary (non-async) views: runs the conversion on a new
+    event loop, and returns the rendered HTML
+    """
+    loop = asyncio.new_event_loop()
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    try:
+        context = RenderContext(max_concurrency, executor=executor, loop=loop)
+        return loop.run_until_complete(arender(block, value, context))
+    finally:
+        executor.shutdown()
+        loop.close()
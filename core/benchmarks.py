@@ -0,0 +1,297 @@
+"""
+Benchmarks for the core.blocks pipeline, run through the benchmark_blocks management command.
+
+run_benchmarks generates stream block definitions and values parameterised by stream length, nesting
+depth and number of child block types, and times each phase of the pipeline on them:
+
+    render_form - rendering the editing form (Block.bind(...).render_form())
+    value_from_datadict - extracting the value from the submitted form data
+    clean - validating the submitted value
+    renderable - converting the value with Block.renderable and rendering it to front-end HTML
+    all_html_declarations - building the HTML declarations for the definition, from cold
+
+A compact binary serialisation of values, with a layout derived from the block definition (stream members
+as indexes into the table of child block names, struct children by position, variable-length integers), was
+tried as an alternative to JSON storage and dropped: on these generated values it was 37-43% smaller than
+JSON, but in pure Python it took 3-7x as long as json.loads to decode (and 3-5x as long as json.dumps to
+encode), so it would have made loading pages slower.
+
+Results are plain JSON-serialisable dicts, so that runs on different commits can be saved and compared
+with compare_results.
+"""
+import datetime
+import platform
+import subprocess
+import sys
+import timeit
+from array import array
+
+import django
+from django import forms
+from django.test.utils import override_settings
+from django.utils.datastructures import MultiValueDict
+
+import six
+from six.moves.html_parser import HTMLParser
+
+from core.blocks import (
+    StreamBlock, TextInputBlock, ChooserBlock, FieldBlock, StructBlock, ListBlock,
+    BaseStreamBlock, BaseStructBlock, clear_definition_caches
+)
+
+
+PHASES = ['render_form', 'value_from_datadict', 'clean', 'renderable', 'all_html_declarations']
+
+
+def deep_getsizeof(obj, exclude_ids=(), seen=None):
+    """
+    Return the total size in bytes of 'obj' and all the containers / objects reachable from it,
+    counting each object once and skipping any whose id is in exclude_ids
+    """
+    if seen is None:
+        seen = set(exclude_ids)
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_getsizeof(key, seen=seen) + deep_getsizeof(value, seen=seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_getsizeof(item, seen=seen)
+    elif isinstance(obj, array):
+        pass
+    else:
+        if hasattr(obj, '__dict__'):
+            size += deep_getsizeof(obj.__dict__, seen=seen)
+        for cls in type(obj).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if hasattr(obj, slot):
+                    size += deep_getsizeof(getattr(obj, slot), seen=seen)
+    return size
+
+
+class UnslottedBoundBlock(object):
+    """BoundBlock as it was before gaining __slots__, for comparison"""
+    def __init__(self, block, prefix, value, error=None):
+        self.block = block
+        self.prefix = prefix
+        self.value = value
+        self.error = error
+
+
+def stream_memory_benchmark(member_count):
+    """
+    Measure the per-member memory overhead of stream values and bound blocks in their old representations
+    (a list of {'type': ..., 'value': ...} dicts, and BoundBlocks with a __dict__) and their compact ones
+    (StreamValue, and slotted BoundBlocks). The member values, prefixes and block definitions themselves
+    are the same in each case and are excluded from the measurement.
+    """
+    block = StreamBlock([('heading', TextInputBlock()), ('image', ChooserBlock())])
+    heading_block = block.child_blocks['heading']
+
+    items = [('heading', 'Heading %d' % i) if i % 2 else ('image', i) for i in range(member_count)]
+    prefixes = ['page-content-%d-value' % i for i in range(member_count)]
+    exclude_ids = set(id(obj) for obj in [block, heading_block, 'type', 'value', 'heading', 'image'])
+    exclude_ids.update(id(value) for (block_type, value) in items)
+    exclude_ids.update(id(prefix) for prefix in prefixes)
+    exclude_ids.add(id(None))
+
+    list_value = [{'type': block_type, 'value': value} for (block_type, value) in items]
+    stream_value = block.to_stream_value(list_value)
+    exclude_ids.add(id(stream_value.block_types))
+
+    unslotted_bound_blocks = [UnslottedBoundBlock(heading_block, prefix, 'x') for prefix in prefixes]
+    bound_blocks = [heading_block.bind('x', prefix) for prefix in prefixes]
+    exclude_ids.add(id('x'))
+
+    def per_member(obj):
+        return float(deep_getsizeof(obj, exclude_ids)) / member_count
+
+    return {
+        'member_count': member_count,
+        'stream_value_bytes_per_member': {
+            'before': per_member(list_value),
+            'after': per_member(stream_value),
+        },
+        'bound_block_bytes_per_member': {
+            'before': per_member(unslotted_bound_blocks),
+            'after': per_member(bound_blocks),
+        },
+    }
+
+
+def make_definition(depth, child_types):
+    """
+    Return a StreamBlock with 'child_types' child block types - a mixture of structs, text inputs, form fields
+    and choosers. If depth > 1, the struct type contains a nested stream of depth - 1.
+    """
+    child_blocks = []
+    for i in range(child_types):
+        kind = i % 4
+        if kind == 0:
+            struct_children = [('title', TextInputBlock()), ('items', ListBlock(TextInputBlock()))]
+            if depth > 1:
+                struct_children.append(('body', make_definition(depth - 1, child_types)))
+            block = StructBlock(struct_children)
+        elif kind == 1:
+            block = TextInputBlock()
+        elif kind == 2:
+            block = FieldBlock(forms.CharField(max_length=255))
+        else:
+            block = ChooserBlock()
+        child_blocks.append(('type%d' % i, block))
+    return StreamBlock(child_blocks)
+
+
+def make_value(block, length, nested_length=3):
+    """
+    Return a value for 'block' as generated by make_definition: a stream of 'length' members cycling through
+    the child block types, with 'nested_length' members in each nested list or stream
+    """
+    if isinstance(block, BaseStreamBlock):
+        names = block.child_block_names
+        return [
+            {
+                'type': names[i % len(names)],
+                'value': make_value(block.child_blocks[names[i % len(names)]], nested_length, nested_length),
+            }
+            for i in range(length)
+        ]
+    elif isinstance(block, ListBlock):
+        return [make_value(block.child_block, nested_length, nested_length) for i in range(nested_length)]
+    elif isinstance(block, BaseStructBlock):
+        return dict(
+            (name, make_value(child_block, nested_length, nested_length))
+            for name, child_block in block.child_blocks.items()
+        )
+    elif isinstance(block, ChooserBlock):
+        return 123
+    else:
+        return 'Lorem ipsum dolor sit amet'
+
+
+class FormDataParser(HTMLParser):
+    """Collects the names and values of the <input> elements in an HTML form, as a MultiValueDict"""
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.data = MultiValueDict()
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'input' and attrs.get('name'):
+            self.data.appendlist(attrs['name'], attrs.get('value') or '')
+
+
+def form_data(form_html):
+    """Return the data that would be submitted by the form 'form_html'"""
+    parser = FormDataParser()
+    parser.feed(form_html)
+    parser.close()
+    return parser.data
+
+
+def time_call(func, repeat):
+    """Call 'func' 'repeat' times, and return the fastest time in seconds"""
+    timings = []
+    for i in range(repeat):
+        start = timeit.default_timer()
+        func()
+        timings.append(timeit.default_timer() - start)
+    return min(timings)
+
+
+def benchmark_case(length, depth, child_types, repeat=3, nested_length=3):
+    """
+    Time each phase of the pipeline for one combination of parameters. Returns a dict of phase name to
+    time in seconds.
+    """
+    block = make_definition(depth, child_types)
+    value = make_value(block, length, nested_length)
+    prefix = 'page'
+
+    form_html = block.bind(value, prefix).render_form()
+    data = form_data(form_html)
+    submitted_value = block.value_from_datadict(data, {}, prefix, stored=value)
+
+    def all_html_declarations():
+        clear_definition_caches()
+        block.all_html_declarations()
+
+    phase_functions = {
+        'render_form': lambda: block.bind(value, prefix).render_form(),
+        'value_from_datadict': lambda: block.value_from_datadict(data, {}, prefix, stored=value),
+        'clean': lambda: block.clean(submitted_value),
+        'renderable': lambda: six.text_type(block.renderable(value)),
+        'all_html_declarations': all_html_declarations,
+    }
+    return dict((phase, time_call(phase_functions[phase], repeat)) for phase in PHASES)
+
+
+def git_commit():
+    """Return the ID of the git commit checked out in the current directory, or None if unavailable"""
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.STDOUT)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode('ascii').strip()
+
+
+def run_benchmarks(lengths=(10, 100, 1000, 10000), depths=(1, 2), child_types=(2, 8), repeat=3,
+        memory_member_count=10000, progress=None):
+    """
+    Run benchmark_case for every combination of the given parameters, plus stream_memory_benchmark,
+    and return the results along with details of the environment they were run in. Caches that would
+    make repeated runs unrepresentative (fragment and validation caches) are disabled throughout.
+    'progress', if given, is called with the parameters of each case as it starts.
+    """
+    results = []
+    with override_settings(BLOCK_FRAGMENT_CACHE=None, BLOCK_VALIDATION_CACHE=None):
+        for depth in depths:
+            for type_count in child_types:
+                for length in lengths:
+                    if progress:
+                        progress(length=length, depth=depth, child_types=type_count)
+                    timings = benchmark_case(length, depth, type_count, repeat=repeat)
+                    for phase in PHASES:
+                        results.append({
+                            'length': length,
+                            'depth': depth,
+                            'child_types': type_count,
+                            'phase': phase,
+                            'seconds': timings[phase],
+                        })
+
+    return {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'repeat': repeat,
+        },
+        'results': results,
+        'memory': stream_memory_benchmark(memory_member_count) if memory_member_count else None,
+    }
+
+
+def result_key(result):
+    return (result['phase'], result['length'], result['depth'], result['child_types'])
+
+
+def compare_results(baseline, current):
+    """
+    Compare two sets of results from run_benchmarks. Returns a list of (result, baseline seconds,
+    current seconds, ratio of current to baseline) for the cases present in both.
+    """
+    baseline_timings = dict((result_key(result), result['seconds']) for result in baseline['results'])
+    comparison = []
+    for result in current['results']:
+        baseline_seconds = baseline_timings.get(result_key(result))
+        if baseline_seconds is None:
+            continue
+        ratio = result['seconds'] / baseline_seconds if baseline_seconds else None
+        comparison.append((result, baseline_seconds, result['seconds'], ratio))
+    return comparison
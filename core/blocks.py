@@ -1,17 +1,41 @@
 import re
+import json
+import types
+import hashlib
+import functools
+import weakref
 from collections import OrderedDict
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:  # Python 2
+    from collections import Mapping, Sequence
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models.query import QuerySet
+from django.db.models.sql.datastructures import EmptyResultSet
+from django.core.urlresolvers import reverse
 from django.utils.html import format_html, format_html_join
 from django.utils.safestring import mark_safe
 from django.utils.text import capfirst
-from django.utils.encoding import python_2_unicode_compatible
+from django.utils.encoding import python_2_unicode_compatible, force_text
+from django.utils.functional import Promise
 from django.template.loader import render_to_string
 from django.forms import Media
+from django.forms.widgets import MEDIA_TYPES
 from django.forms.utils import ErrorList
 
 import six
 
+from core.prefix_view import PrefixView
+from core.values import StreamValue, stream_items, BlockJSONEncoder
+from core.compiled_templates import CompiledTemplate, CompiledSequenceTemplate, PlaceholderBoundBlock, placeholder
+from core.fragment_cache import render_fragment, render_fragment_chunks, value_fingerprint
+from core.streaming import defer_rendering, stream_template
+from core.prefetch import active_prefetch, activate_prefetch, prefetch_references
+from core.validation import get_validation_cache, clean_member
+from core.metrics import metered, metered_chunks, count_members, this_block
+
 # helpers for Javascript expression formatting
 
 def indent(string, depth=1):
@@ -31,12 +55,166 @@ def js_dict(d):
     ]
     return "{\n%s\n}" % ',\n'.join(dict_items)
 
+def compiled_forms_enabled():
+    """
+    Whether the form HTML for list / stream blocks should be built through the pre-compiled
+    templates in core.compiled_templates, rather than going through render_to_string for every member.
+    Projects that customise the block_forms templates beyond plain {{ var }} substitution of
+    the per-member values should leave COMPILED_BLOCK_FORMS off.
+    """
+    return getattr(settings, 'COMPILED_BLOCK_FORMS', False)
+
+def definition_cached(method):
+    """
+    Decorator for argument-less Block methods whose result depends only on the block definition
+    (media, HTML declarations, JS initializers and the like). Block definitions are not expected to
+    change after construction, so the result is computed on the first call and then returned from
+    the cache on that block instance until clear_definition_caches() is called.
+    """
+    @functools.wraps(method)
+    def wrapper(self):
+        cache = self._definition_cache
+        try:
+            generation, result = cache[method]
+            if generation == Block.definition_cache_generation:
+                return result
+        except KeyError:
+            pass
+
+        result = method(self)
+        cache[method] = (Block.definition_cache_generation, result)
+        return result
+
+    # the undecorated method, for core.instrumentation to time the computation rather than the cache lookup
+    wrapper.uncached = method
+    return wrapper
+
+# all block definitions in this process, and an index of them by definition_prefix (built on demand,
+# as definition prefixes can only be computed once a block's definition is complete)
+_block_definitions = weakref.WeakSet()
+_block_definitions_by_prefix = weakref.WeakValueDictionary()
+# the top-level block definitions in use by this process - those of model fields, views and the like
+_root_definitions = weakref.WeakSet()
+
+def get_block_definition(definition_prefix):
+    """
+    Return a block definition with the given definition_prefix, or None if there is none in this process.
+    (If there are several, they are structurally identical, so it doesn't matter which one is returned.)
+    """
+    block = _block_definitions_by_prefix.get(definition_prefix)
+    if block is None:
+        for block in list(_block_definitions):
+            _block_definitions_by_prefix[block.definition_prefix] = block
+        block = _block_definitions_by_prefix.get(definition_prefix)
+    return block
+
+def all_block_definitions():
+    """
+    Return a list of all block definitions in this process
+    """
+    return list(_block_definitions)
+
+def register_root_definition(block):
+    """
+    Record 'block' as a top-level block definition in use by this process, whose definition is complete -
+    as opposed to one that may yet be made a child of another block. Returns 'block'.
+    """
+    _root_definitions.add(block)
+    return block
+
+def root_block_definitions():
+    """
+    Return a list of the block definitions registered with register_root_definition
+    """
+    return list(_root_definitions)
+
+def clear_definition_caches():
+    """
+    Invalidate the results of all @definition_cached methods, on all block definitions. Only needed
+    when something that those results depend on has changed at runtime - e.g. templates or settings
+    being overridden in tests.
+    """
+    Block.definition_cache_generation += 1
+
+def class_path(cls):
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+SIMPLE_TYPES = six.string_types + six.integer_types + (float, bool, type(None))
+REGEX_TYPE = type(re.compile(''))
+
+def fingerprint_value(value):
+    """
+    Return a JSON-serialisable description of 'value', an option of a block or form field: simple values
+    as they are, lazy strings translated, lists / tuples / dicts / stream values item by item, regular
+    expressions by their pattern and flags, querysets by their model and SQL (without running them),
+    objects that can be deconstructed (such as validators) by their deconstructed form, classes and
+    functions by their path, and anything else by its class and repr - or just its class, if its repr is
+    the default one (which includes its address, and so would differ between processes).
+    """
+    if isinstance(value, SIMPLE_TYPES):
+        return value
+    elif isinstance(value, Promise):
+        return force_text(value)
+    elif isinstance(value, (list, tuple)):
+        return [fingerprint_value(item) for item in value]
+    elif isinstance(value, dict):
+        return sorted(
+            [[fingerprint_value(key), fingerprint_value(item)] for key, item in value.items()],
+            key=lambda pair: repr(pair[0])
+        )
+    elif isinstance(value, StreamValue):
+        return fingerprint_value(value.as_list())
+    elif isinstance(value, REGEX_TYPE):
+        return ['regex', value.pattern, value.flags]
+    elif isinstance(value, QuerySet):
+        try:
+            sql = six.text_type(value.query)
+        except EmptyResultSet:
+            sql = None
+        return ['queryset', class_path(value.model), sql]
+    elif isinstance(value, (type, types.FunctionType)):
+        return ['callable', class_path(value)]
+    elif hasattr(value, 'deconstruct'):
+        path, args, kwargs = value.deconstruct()
+        return [path, fingerprint_value(list(args)), fingerprint_value(kwargs)]
+    elif type(value).__repr__ is object.__repr__:
+        return [class_path(value.__class__)]
+    else:
+        return [class_path(value.__class__), repr(value)]
+
+def field_fingerprint_components(field):
+    """
+    Return a JSON-serialisable description of a form field's configuration: its class and attributes
+    (including choices and validators), and its widget's class and attributes - except creation_counter,
+    which depends on the order in which fields were created rather than their configuration, and the
+    widget's choices, which are taken from the field (and for a ModelChoiceField, are an iterator over a
+    queryset that would be run by describing it).
+    """
+    widget = field.widget
+    return [
+        class_path(field.__class__),
+        class_path(widget.__class__),
+        fingerprint_value(dict(
+            (name, value) for name, value in field.__dict__.items()
+            if name not in ('creation_counter', 'widget')
+        )),
+        fingerprint_value(dict(
+            (name, value) for name, value in widget.__dict__.items()
+            if name != 'choices'
+        )),
+    ]
+
 # =========================================
 # Top-level superclasses and helper objects
 # =========================================
 
 class Block(object):
     creation_counter = 0
+    definition_cache_generation = 0
+
+    # whether the front-end rendering of this block may be stored in the fragment cache
+    # (see core.fragment_cache and fragments_cacheable)
+    cache_fragments = True
 
     """
     Setting a 'dependencies' list serves as a shortcut for the common case where a complex block type
@@ -48,6 +226,10 @@ class Block(object):
     """
     dependencies = set()
 
+    # set by freeze(), after which the definition may not be modified
+    frozen = False
+
+    @definition_cached
     def all_blocks(self):
         """
         Return a set consisting of self and all block objects that are direct or indirect dependencies
@@ -56,17 +238,38 @@ class Block(object):
         result = set([self])
         for dep in self.dependencies:
             result |= dep.all_blocks()
-        return result
+        return frozenset(result)
+
+    @definition_cached
+    def nesting_depth(self):
+        """Return the number of levels of blocks nested within this one, as found through 'dependencies'"""
+        if not self.dependencies:
+            return 0
+        return 1 + max(dep.nesting_depth() for dep in self.dependencies)
 
+    @definition_cached
     def all_media(self):
+        # merge into a single Media object, rather than building a new one for each block with +=
         media = Media()
         for block in self.all_blocks():
-            media += block.media
+            block_media = block.media
+            for name in MEDIA_TYPES:
+                getattr(media, 'add_' + name)(getattr(block_media, '_' + name, None))
         return media
 
+    @definition_cached
     def all_html_declarations(self):
-        declarations = filter(bool, [block.html_declarations() for block in self.all_blocks()])
-        return mark_safe('\n'.join(declarations))
+        # structurally identical definitions share a definition_prefix, and so must only be declared once
+        declarations = {}
+        for block in self.all_blocks():
+            declarations.setdefault(block.definition_prefix, block.html_declarations())
+        return mark_safe('\n'.join(filter(bool, declarations.values())))
+
+    def __new__(cls, *args, **kwargs):
+        # keep the constructor arguments, for deconstruct()
+        obj = super(Block, cls).__new__(cls)
+        obj._constructor_args = (args, kwargs)
+        return obj
 
     def __init__(self, **kwargs):
         if 'default' in kwargs:
@@ -76,10 +279,93 @@ class Block(object):
         # Increase the creation counter, and save our local copy.
         self.creation_counter = Block.creation_counter
         Block.creation_counter += 1
-        self.definition_prefix = 'blockdef-%d' % self.creation_counter
+        _block_definitions.add(self)
+
+        self._definition_cache = {}
+
+    def deconstruct(self):
+        """
+        Return a (path, args, kwargs) tuple from which this block definition can be reconstructed, as used by
+        Django migrations to serialise fields (such as core.fields.StreamField) that take a block definition.
+        Child blocks passed to the constructor are deconstructed in turn by the migration writer.
+        """
+        args, kwargs = self._constructor_args
+        return (class_path(self.__class__), args, kwargs)
+
+    def fingerprint_components(self):
+        """
+        Return a list of JSON-serialisable values which together describe this block definition -
+        two blocks with equal fingerprint_components should be interchangeable, and will be treated as
+        such by caches. Subclasses with additional options or child blocks must extend this list.
+        """
+        return [
+            class_path(self.__class__),
+            getattr(self, 'name', None),
+            fingerprint_value(self.label),
+            fingerprint_value(self.default),
+        ]
+
+    @definition_cached
+    def definition_fingerprint(self):
+        """
+        Return a hash of fingerprint_components, identifying this block definition independently of
+        the process it was created in - suitable for use in keys for caches shared between processes,
+        which remain valid across deploys for as long as the definition is unchanged.
+        """
+        serialised = json.dumps(self.fingerprint_components(), sort_keys=True, cls=BlockJSONEncoder)
+        return hashlib.sha1(serialised.encode('utf-8')).hexdigest()
+
+    def finalise(self):
+        """
+        Compute everything derived from this block definition (fingerprint, media, HTML declarations,
+        Javascript initializer and so on) that would otherwise be computed on first use. Subclasses with
+        further definition-level state must extend this.
+        """
+        self.definition_fingerprint()
+        self.all_blocks()
+        self.all_media()
+        self.html_declarations()
+        self.all_html_declarations()
+        self.js_initializer()
+        self.new_member_template_versions()
+        self.referenced_models()
+        self.fragments_cacheable()
+        self.templates_fingerprint()
+
+    def freeze(self):
+        """
+        Finalise this block definition, and prevent any further changes to it: renaming it, or setting
+        any of its attributes
+        """
+        self.finalise()
+        self.frozen = True
+
+    def unfreeze(self):
+        """Allow changes to this block definition again, after freeze()"""
+        object.__setattr__(self, 'frozen', False)
+
+    def __setattr__(self, name, value):
+        if self.frozen:
+            raise RuntimeError("Cannot modify block definition %s, as it has been frozen" % self.definition_prefix)
+        super(Block, self).__setattr__(name, value)
+
+    @property
+    def definition_prefix(self):
+        """
+        The prefix for element IDs and the like in this block definition's HTML declarations and Javascript.
+        This is derived from definition_fingerprint, so that it is the same for the same definition in
+        every process, and is shared by structurally identical definitions.
+        """
+        return 'blockdef-%s' % self.definition_fingerprint()[:12]
 
     def set_name(self, name):
+        if self.frozen and name == getattr(self, 'name', None):
+            return  # a shared block being added under the same name elsewhere changes nothing
+        if self.frozen:
+            raise RuntimeError("Cannot rename block definition %s, as it has been frozen" % self.definition_prefix)
         self.name = name
+        # the name is part of the definition, so discard anything that has been derived from it
+        self._definition_cache.clear()
 
         # if we don't have a label already, generate one from name
         if self.label is None:
@@ -92,12 +378,11 @@ class Block(object):
     def html_declarations(self):
         """
         Return an HTML fragment to be rendered on the form page once per block definition -
-        as opposed to once per occurrence of the block. For example, the block definition
-            ListBlock(label="Shopping list", TextInput(label="Product"))
-        needs to output a <script type="text/template"></script> block containing the HTML for
-        a 'product' text input, to that these can be dynamically added to the list. This
-        template block must only occur once in the page, even if there are multiple 'shopping list'
-        blocks on the page.
+        as opposed to once per occurrence of the block - such as a <script type="text/template"></script>
+        block containing HTML to be inserted dynamically. This must only occur once in the page, even if
+        there are multiple occurrences of the block on the page. (Templates that are only needed in
+        response to user actions, such as the HTML for new list members, are better served through
+        new_member_templates, so that they don't add to the weight of every page.)
 
         Any element IDs used in this HTML fragment must begin with definition_prefix.
         (More precisely, they must either be definition_prefix itself, or begin with definition_prefix
@@ -105,6 +390,35 @@ class Block(object):
         """
         return ''
 
+    def new_member_templates(self):
+        """
+        Return a dict, keyed by child name, of the HTML for a new member of this block (as used when
+        adding an item to a list or stream) - with the prefix '__PREFIX__', to be replaced dynamically
+        when adding the member. These are served by the core.views.new_member_template view, and fetched
+        by the block's Javascript the first time a member of that type is added.
+        """
+        return {}
+
+    @definition_cached
+    def new_member_template_versions(self):
+        """
+        Return a dict of hashes of the new_member_templates HTML, used to version their URLs
+        """
+        return dict(
+            (name, hashlib.sha1(html.encode('utf-8')).hexdigest())
+            for name, html in self.new_member_templates().items()
+        )
+
+    def new_member_template_url(self, child_name):
+        """
+        Return the URL of the new_member_templates HTML for 'child_name'. This includes the version of
+        the HTML, so that it can be cached indefinitely.
+        """
+        url = reverse('block_new_member_template', kwargs={
+            'definition_id': self.definition_prefix, 'child_name': child_name,
+        })
+        return '%s?v=%s' % (url, self.new_member_template_versions()[child_name])
+
     def js_initializer(self):
         """
         Returns a Javascript expression string, or None if this block does not require any
@@ -117,16 +431,27 @@ class Block(object):
         """
         return None
 
-    def render_form(self, value, prefix=''):
+    def render_form(self, value, prefix='', error=None, from_stored=True):
         """
-        Render the HTML for this block with 'value' as its content.
+        Render the HTML for this block with 'value' as its content, along with the errors in the
+        ValidationError 'error' if given. 'from_stored' is false if 'value' is not the stored value that
+        submissions of the form are read against (see value_from_prefix_view) - e.g. it was read from a
+        submission that failed validation - so that the form must not refer to members of the stored value.
         """
         raise NotImplementedError('%s.render_form' % self.__class__)
 
     def value_from_datadict(self, data, files, prefix):
         raise NotImplementedError('%s.value_from_datadict' % self.__class__)
 
-    def bind(self, value, prefix, error=None):
+    def value_from_prefix_view(self, node, files):
+        """
+        Equivalent of value_from_datadict, taking the submitted data as a PrefixView (see core.prefix_view)
+        for this block's prefix; container blocks use this to pass each child its own subtree of the data.
+        Blocks that don't override this fall back on value_from_datadict.
+        """
+        return self.value_from_datadict(node.data, files, node.prefix)
+
+    def bind(self, value, prefix, error=None, from_stored=True):
         """
         Return a BoundBlock which represents the association of this block definition with a value
         and a prefix (and optionally, a ValidationError to be rendered).
@@ -134,7 +459,7 @@ class Block(object):
         bound_block.render() rather than blockdef.render(value, prefix) which can't be called from
         within a template.
         """
-        return BoundBlock(self, prefix, value, error=error)
+        return BoundBlock(self, prefix, value, error=error, from_stored=from_stored)
 
     def prototype_block(self):
         """
@@ -142,7 +467,7 @@ class Block(object):
         (new list items, for example). This will have a prefix of '__PREFIX__' (to be dynamically replaced with
         a real prefix when it's inserted into the page) and a value equal to the block's default value.
         """
-        return self.bind(self.default, '__PREFIX__')
+        return self.bind(self.default, '__PREFIX__', from_stored=False)
 
     def clean(self, value):
         """
@@ -167,16 +492,409 @@ class Block(object):
         """
         return value
 
+    def renderable_needs_io(self, value):
+        """
+        Whether renderable(value) may block on I/O (such as database or network lookups) that isn't covered
+        by the active prefetch. The asyncio rendering path runs such calls in a thread pool, so that they
+        can proceed concurrently.
+        """
+        return False
+
+    def arenderable(self, value, context=None):
+        """
+        asyncio coroutine equivalent of renderable: child values of lists, streams and structs are converted
+        concurrently, with calls to renderable that need I/O running in a thread pool. 'context' is a
+        core.async_rendering.RenderContext, which bounds the concurrency; if not given, a new one is created.
+        Python 3.4+ only.
+        """
+        from core.async_rendering import arenderable
+        return arenderable(self, value, context)
+
+    def arender(self, value, context=None):
+        """
+        asyncio coroutine returning the HTML rendering of 'value', via arenderable. Python 3.4+ only.
+        """
+        from core.async_rendering import arender
+        return arender(self, value, context)
+
+    def collect_references(self, value, collector):
+        """
+        Register any database objects referenced by 'value' (such as the IDs stored by chooser blocks)
+        with the core.prefetch.PrefetchedObjects 'collector', so that they can be fetched in bulk when first
+        needed. Blocks with child blocks must pass this on to their children (those with referenced_models).
+        """
+        pass
+
+    @definition_cached
+    def fragments_cacheable(self):
+        """
+        Whether the front-end rendering of values of this block may be stored in the fragment cache: only if
+        this block and all of its child blocks allow it (cache_fragments), and none of them renders objects
+        referenced by the value, whose current state is not part of the cache key
+        """
+        return all(block.cache_fragments for block in self.all_blocks()) and not self.referenced_models()
+
+    @definition_cached
+    def templates_fingerprint(self):
+        """
+        Return a digest of the templates used in rendering this block and its child blocks, for inclusion in
+        fragment cache keys
+        """
+        from core.fragment_cache import templates_fingerprint
+        return templates_fingerprint(set(
+            block.template for block in self.all_blocks() if getattr(block, 'template', None)
+        ))
+
+    @definition_cached
+    def referenced_models(self):
+        """
+        Return the set of models that values of this block (including its child blocks) may reference
+        """
+        return frozenset(
+            block.target_model for block in self.all_blocks()
+            if getattr(block, 'target_model', None) is not None
+        )
+
 
 class BoundBlock(object):
-    def __init__(self, block, prefix, value, error=None):
+    __slots__ = ['block', 'prefix', 'value', 'error', 'from_stored']
+
+    def __init__(self, block, prefix, value, error=None, from_stored=True):
         self.block = block
         self.prefix = prefix
         self.value = value
         self.error = error
+        self.from_stored = from_stored
 
+    @metered('render_form', lambda bound_block: bound_block.block)
     def render_form(self):
-        return self.block.render_form(self.value, self.prefix, error=self.error)
+        return self.block.render_form(self.value, self.prefix, error=self.error, from_stored=self.from_stored)
+
+
+class LazyRenderableList(Sequence):
+    """
+    Base class for the renderable versions of sequence values: a read-only sequence which initially holds
+    the raw child values, and converts each one to its renderable version (via make_renderable) the first
+    time it is accessed, so that templates only pay for the members they actually use.
+    This is deliberately not a list subclass, since list's C implementation (as used by list(), sorted(),
+    ==, + and so on) would read the raw values directly.
+    """
+    __slots__ = ['_values', '_converted', 'prefetched']
+
+    def __init__(self, raw_values):
+        self._values = list(raw_values)
+        self._converted = bytearray(len(self._values))
+        count_members(len(self._values))
+        # objects referenced by the value, for use by the child blocks' renderable methods
+        self.prefetched = active_prefetch()
+
+    def make_renderable(self, index, raw_value):
+        raise NotImplementedError('%s.make_renderable' % self.__class__)
+
+    def set_renderable(self, index, value):
+        """Supply the already-converted renderable version of the child value at 'index'"""
+        self._values[index] = value
+        self._converted[index] = 1
+
+    def _get(self, index):
+        value = self._values[index]
+        if not self._converted[index]:
+            with activate_prefetch(self.prefetched):
+                value = self.make_renderable(index, value)
+            self._values[index] = value
+            self._converted[index] = 1
+        return value
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get(i) for i in range(*index.indices(len(self)))]
+        return self._get(index)
+
+    def __getslice__(self, start, end):
+        # Python 2 only
+        return self.__getitem__(slice(start, end))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._get(i)
+
+    def __reversed__(self):
+        for i in reversed(range(len(self))):
+            yield self._get(i)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LazyRenderableList)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def copy(self):
+        """Return a plain list of the renderable values"""
+        return list(self)
+
+    def __repr__(self):
+        return '[%s]' % ', '.join(repr(item) for item in self)
+
+
+def render_list_chunks(items):
+    """
+    Yield the string rendering of the LazyRenderableList 'items' (i.e. its repr, as for a plain list of the
+    renderable values) in chunks, one member at a time
+    """
+    yield '['
+    for i, item in enumerate(items):
+        yield ', %r' % (item,) if i else repr(item)
+    yield ']'
+
+
+class RejectedValue(list):
+    """
+    Stands in for the value of a list or stream block whose submitted members were not read, because the
+    submission was malformed or exceeded a size limit. Behaves as an empty list; the block's clean method
+    raises 'error' for it, so that the submission is reported like any other validation error.
+    """
+    def __init__(self, error):
+        super(RejectedValue, self).__init__()
+        self.error = error
+
+
+def submitted_member_count(block, node):
+    """
+    Return the number of members submitted for the list / stream 'block' under the PrefixView 'node', raising
+    ValidationError if it is invalid or too large to be read: more than remain in the submission's member
+    budget. This is checked before any members are read, so the cost of rejecting a submission doesn't depend
+    on the count it claims. The count is not checked against max_num, as the submitted members include
+    deleted ones - any number of which may have been added and deleted again while editing; max_num applies
+    to the remaining members, in clean.
+    """
+    try:
+        count = int(node.child_value('count'))
+    except (KeyError, ValueError, TypeError):
+        count = -1
+    if count < 0:
+        raise ValidationError("Invalid submission: the number of items is missing or invalid", code='invalid_count')
+
+    reserve_submitted_members(block, node, count)
+    return count
+
+
+def reserve_submitted_members(block, node, count):
+    """
+    Raise ValidationError if 'count' members submitted for the list / stream 'block' under the PrefixView 'node'
+    are too many to be read, as per submitted_member_count; otherwise use them up from the member budget
+    """
+    if not node.budget.consume(count):
+        raise ValidationError("Invalid submission: too many items", code='too_many_members')
+    count_members(count)
+
+
+def submitted_delta(block, node):
+    """
+    Return the members of a delta submission for the list / stream 'block' under the PrefixView 'node', or None
+    if the submission is a full one.
+
+    In a delta submission, the browser only sends the fields of the members that were added or changed. The
+    'members' field lists all members of the new value in order, as comma-separated tokens: 's<N>' for
+    member N of the stored value, unchanged, and 'm<K>' for the member submitted under the prefix
+    '{prefix}-K'. Deleted members are left out. The result is a list of (submitted, index) tuples, one for
+    each token; ValidationError is raised if the tokens are invalid or too many. Since 's' tokens (and the
+    ids of submitted members) refer to the stored value, they are only accepted along with the 'version'
+    of the stored value that the form was rendered from (see require_stored_version).
+    """
+    members = node.child('members').get_value()
+    if members is None:
+        return None
+
+    tokens = members.split(',') if members else []
+    reserve_submitted_members(block, node, len(tokens))
+
+    delta = []
+    for token in tokens:
+        try:
+            index = int(token[1:])
+        except ValueError:
+            index = -1
+        if token[:1] not in ('s', 'm') or index < 0:
+            raise ValidationError("Invalid submission: the list of items is invalid", code='invalid_members')
+        delta.append((token[0] == 'm', index))
+    return delta
+
+
+def submitted_member_id(member):
+    """
+    Return the index in the stored value of the list / stream member whose PrefixView is 'member', as
+    submitted in its 'id' field, or None if it has none (because it was added in the form, or the form was
+    not rendered from the stored value)
+    """
+    try:
+        return int(member.child_value('id'))
+    except (KeyError, ValueError, TypeError):
+        return None
+
+
+def stored_member(stored, index):
+    """Return item 'index' of the list 'stored', or None if 'index' is None or out of range"""
+    if index is not None and 0 <= index < len(stored):
+        return stored[index]
+    return None
+
+
+def submitted_member_deleted(member):
+    """
+    Return whether the list / stream member whose PrefixView is 'member' was deleted in the form, as submitted
+    in its 'deleted' field; raise ValidationError if it is missing
+    """
+    try:
+        return bool(member.child_value('deleted'))
+    except KeyError:
+        raise ValidationError("Invalid submission: the deleted state of an item is missing", code='invalid_deleted')
+
+
+def submitted_member_order(member):
+    """
+    Return the position of the list / stream member whose PrefixView is 'member', as submitted in its
+    'order' field; raise ValidationError if it is missing or invalid
+    """
+    try:
+        return int(member.child_value('order'))
+    except (KeyError, ValueError, TypeError):
+        raise ValidationError("Invalid submission: the order of the items is missing or invalid", code='invalid_order')
+
+
+def check_member_count(block, value):
+    """
+    Raise ValidationError if the list / stream value 'value' has fewer than min_num or more than max_num
+    members. The error has a (blank) error for each member in its params, as the block's render_form expects.
+    """
+    count = len(value)
+    if block.max_num is not None and count > block.max_num:
+        message = "Ensure there are no more than %d items (it has %d)" % (block.max_num, count)
+        code = 'max_num'
+    elif block.min_num is not None and count < block.min_num:
+        message = "Ensure there are at least %d items (it has %d)" % (block.min_num, count)
+        code = 'min_num'
+    else:
+        return
+    raise ValidationError(message, code=code, params=[None] * count)
+
+
+def render_unloaded_member(prefix, index):
+    """
+    Render the placeholder for a member of a windowed list / stream that has not been loaded into the form:
+    just the hidden fields that sequence.js maintains for every member, plus the index of the member in the
+    stored value, so that value_from_prefix_view can restore it from there.
+    """
+    return format_html(
+        '<li id="{0}-container" class="unloaded-member">'
+        '<input type="hidden" id="{0}-deleted" name="{0}-deleted" value="">'
+        '<input type="hidden" id="{0}-order" name="{0}-order" value="{1}">'
+        '<input type="hidden" id="{0}-stored" name="{0}-stored" value="{1}">'
+        '</li>',
+        prefix, index
+    )
+
+
+def stored_member_index(member):
+    """
+    Return the index in the stored value of the unloaded list / stream member whose PrefixView is 'member',
+    or None if the member was loaded into the form (or added to it)
+    """
+    stored_index = member.child('stored').get_value()
+    if stored_index is None:
+        return None
+    try:
+        return int(stored_index)
+    except (TypeError, ValueError):
+        return -1
+
+
+def unrestorable_member_error():
+    return ValidationError(
+        "Invalid submission: an item that was not loaded could not be found in the stored value",
+        code='invalid_stored_member'
+    )
+
+
+def windowed_member_count(block, value, from_stored=True):
+    """
+    Return the number of members of the list / stream value 'value' to render in full in the form for 'block':
+    all of them, unless the block has a window_size and the value is longer than that, in which case the rest
+    are rendered as placeholders (see render_unloaded_member) to be loaded on demand. Values other than the
+    stored value (such as those of forms with errors) are always rendered in full, as their members don't
+    correspond to those of the stored value.
+    """
+    if block.window_size is None or not from_stored:
+        return len(value)
+    return min(block.window_size, len(value))
+
+
+def render_stored_version(block, value, prefix):
+    """
+    Render the hidden field holding the version (see stored_version) of the stored value 'value' that the
+    form for the list / stream 'block' was rendered from, so that the members referring to its members (by
+    their ids, placeholders or delta tokens) can be checked against the stored value when they are loaded or
+    submitted
+    """
+    return format_html(
+        '<input type="hidden" id="{0}-version" name="{0}-version" value="{1}">', prefix, block.stored_version(value)
+    )
+
+
+def stale_stored_value_error():
+    return ValidationError(
+        "The stored value has changed since this form was loaded; please reload the page",
+        code='stale_stored_value'
+    )
+
+
+def check_stored_version(block, node, stored):
+    """
+    Raise ValidationError if the form for the list / stream 'block' under the PrefixView 'node' was rendered
+    from a stored value other than 'stored' (as submitted in its 'version' field, if it has one)
+    """
+    version = node.child('version').get_value()
+    if version is not None and version != block.stored_version(stored):
+        raise stale_stored_value_error()
+
+
+def require_stored_version(node):
+    """
+    Raise ValidationError if the submission for the list / stream under the PrefixView 'node' refers to
+    members of the stored value, but has no 'version' field to check that value against (as
+    check_stored_version does)
+    """
+    if node.child('version').get_value() is None:
+        raise stale_stored_value_error()
+
+
+def submitted_stored_member(node, member, stored):
+    """
+    Return the member of the list 'stored' that the form of the list / stream member whose PrefixView is
+    'member' was rendered from, as per submitted_member_id, or None. Raises ValidationError if there is one
+    but the version of the stored value was not submitted under the PrefixView 'node' of the list / stream.
+    """
+    index = submitted_member_id(member)
+    if index is not None:
+        require_stored_version(node)
+    return stored_member(stored, index)
+
+
+def sequence_error_html(error):
+    """
+    Return the HTML for the error messages of the list / stream as a whole - as opposed to errors within its
+    members - in the ValidationError 'error' given to render_form. These are the errors with a code.
+    """
+    if error is None or not error.code:
+        return ''
+    return str(ErrorList([error.message]))
 
 
 # ==========
@@ -186,7 +904,7 @@ class BoundBlock(object):
 class TextInputBlock(Block):
     default = ''
 
-    def render_form(self, value, prefix='', error=None):
+    def render_form(self, value, prefix='', error=None, from_stored=True):
         if self.label:
             return format_html(
                 """<label for="{prefix}">{label}</label> <input type="text" name="{prefix}" id="{prefix}" value="{value}">""",
@@ -201,6 +919,9 @@ class TextInputBlock(Block):
     def value_from_datadict(self, data, files, prefix):
         return data.get(prefix, '')
 
+    def value_from_prefix_view(self, node, files):
+        return node.get_value('')
+
 
 # ===========
 # Field block
@@ -213,7 +934,10 @@ class FieldBlock(Block):
         super(FieldBlock, self).__init__(**kwargs)
         self.field = field
 
-    def render_form(self, value, prefix='', error=None):
+    def fingerprint_components(self):
+        return super(FieldBlock, self).fingerprint_components() + [field_fingerprint_components(self.field)]
+
+    def render_form(self, value, prefix='', error=None, from_stored=True):
         widget = self.field.widget
 
         widget_html = widget.render(prefix, value, {'id': prefix})
@@ -246,6 +970,17 @@ class FieldBlock(Block):
 class ChooserBlock(Block):
     default = None
 
+    def __init__(self, target_model=None, **kwargs):
+        super(ChooserBlock, self).__init__(**kwargs)
+        # the model whose IDs are chosen; if None, the renderable value is the ID itself
+        self.target_model = target_model
+
+    def fingerprint_components(self):
+        target_model = self.target_model
+        return super(ChooserBlock, self).fingerprint_components() + [
+            '%s.%s' % (target_model._meta.app_label, target_model._meta.model_name) if target_model else None
+        ]
+
     @property
     def media(self):
         return Media(js=['js/blocks/chooser.js'])
@@ -253,7 +988,7 @@ class ChooserBlock(Block):
     def js_initializer(self):
         return "Chooser('%s')" % self.definition_prefix
 
-    def render_form(self, value, prefix='', error=None):
+    def render_form(self, value, prefix='', error=None, from_stored=True):
         if self.label:
             return format_html(
                 """<label>{label}</label> <input type="button" id="{prefix}-button" value="Choose a thing">""",
@@ -268,6 +1003,28 @@ class ChooserBlock(Block):
     def value_from_datadict(self, data, files, prefix):
         return 123
 
+    def collect_references(self, value, collector):
+        if self.target_model is not None and value is not None:
+            collector.add(self.target_model, value)
+
+    def renderable_needs_io(self, value):
+        if self.target_model is None or value is None:
+            return False
+        prefetched = active_prefetch()
+        return prefetched is None or not prefetched.is_resolved(self.target_model)
+
+    def renderable(self, value):
+        if self.target_model is None or value is None:
+            return value
+
+        prefetched = active_prefetch()
+        if prefetched is not None and prefetched.covers(self.target_model):
+            return prefetched.get(self.target_model, value)
+
+        # not part of a prefetched value, so look up the object individually
+        return self.target_model._default_manager.in_bulk([value]).get(
+            self.target_model._meta.pk.to_python(value))
+
 
 # ===========
 # StructBlock
@@ -294,6 +1051,7 @@ class BaseStructBlock(Block):
 
         self.dependencies = set(self.child_blocks.values())
 
+    @definition_cached
     def js_initializer(self):
         # skip JS setup entirely if no children have js_initializers
         if not self.child_js_initializers:
@@ -301,14 +1059,20 @@ class BaseStructBlock(Block):
 
         return "StructBlock(%s)" % js_dict(self.child_js_initializers)
 
+    def fingerprint_components(self):
+        return super(BaseStructBlock, self).fingerprint_components() + [
+            self.template,
+            [[name, block.definition_fingerprint()] for name, block in self.child_blocks.items()],
+        ]
+
     @property
     def media(self):
         return Media(js=['js/blocks/struct.js'])
 
-    def render_form(self, value, prefix='', error=None):
+    def render_form(self, value, prefix='', error=None, from_stored=True):
         child_renderings = [
             block.render_form(value.get(name, block.default), prefix="%s-%s" % (prefix, name),
-                error=error.params.get(name) if error else None)
+                error=error.params.get(name) if error else None, from_stored=from_stored)
             for name, block in self.child_blocks.items()
         ]
 
@@ -322,12 +1086,18 @@ class BaseStructBlock(Block):
         else:
             return format_html("<ul>{0}</ul>", list_items)
 
-    def value_from_datadict(self, data, files, prefix):
+    @metered('value_from_datadict', this_block)
+    def value_from_datadict(self, data, files, prefix, stored=None):
+        return self.value_from_prefix_view(PrefixView.build(data, prefix, stored), files)
+
+    def value_from_prefix_view(self, node, files):
+        stored = node.stored if isinstance(node.stored, dict) else {}
         return dict([
-            (name, block.value_from_datadict(data, files, '%s-%s' % (prefix, name)))
+            (name, block.value_from_prefix_view(node.child(name, stored.get(name)), files))
             for name, block in self.child_blocks.items()
         ])
 
+    @metered('clean', this_block)
     def clean(self, value):
         result = {}
         errors = {}
@@ -344,20 +1114,101 @@ class BaseStructBlock(Block):
 
         return result
 
+    def collect_references(self, value, collector):
+        for name, val in value.items():
+            child_block = self.child_blocks[name]
+            if child_block.referenced_models():
+                child_block.collect_references(val, collector)
+
+    @metered('renderable', this_block)
     def renderable(self, value):
-        return RenderableStructBlock(self, [
-            (name, self.child_blocks[name].renderable(val))
-            for name, val in value.items()
-        ])
+        with prefetch_references(self, value):
+            return RenderableStructBlock(self, value)
 
 @python_2_unicode_compatible  # ensures that the output of __str__ doesn't lose its 'safe' flag
-class RenderableStructBlock(dict):
-    def __init__(self, block, *args):
-        super(RenderableStructBlock, self).__init__(*args)
+class RenderableStructBlock(Mapping):
+    """
+    A read-only mapping of the renderable versions of the struct's child values. These are converted from
+    the raw values on first access, so that templates only pay for the children they actually use.
+    This is deliberately not a dict subclass, since dict's C implementation (as used by dict(), ==, copy
+    and so on) would read the raw values directly.
+    """
+    __slots__ = ['block', 'value', '_values', '_unconverted', 'prefetched']
+
+    def __init__(self, block, value):
         self.block = block
+        self.value = value  # the original (non-renderable) value, used as the fragment cache key
+        self._values = dict(value)
+        self._unconverted = set(self._values)
+        # objects referenced by the value, for use by the child blocks' renderable methods
+        self.prefetched = active_prefetch()
+
+    def __getitem__(self, key):
+        value = self._values[key]
+        if key in self._unconverted:
+            with activate_prefetch(self.prefetched):
+                value = self.block.child_blocks[key].renderable(value)
+            self._values[key] = value
+            self._unconverted.discard(key)
+        return value
+
+    def set_renderable(self, key, value):
+        """Supply the already-converted renderable version of the child value 'key'"""
+        self._values[key] = value
+        self._unconverted.discard(key)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __contains__(self, key):
+        return key in self._values
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def keys(self):
+        return list(self._values)
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def iteritems(self):
+        # Python 2 only
+        for key in self:
+            yield (key, self[key])
 
+    def itervalues(self):
+        # Python 2 only
+        for key in self:
+            yield self[key]
+
+    def copy(self):
+        """Return a plain dict of the renderable values"""
+        return dict(self.items())
+
+    def __repr__(self):
+        return '{%s}' % ', '.join('%r: %r' % (key, value) for (key, value) in self.items())
+
+    @metered('render')
     def __str__(self):
-        return render_to_string(self.block.template, {'self': self})
+        return defer_rendering(self) or render_fragment(self.block, self.value,
+            lambda: render_to_string(self.block.template, {'self': self}))
+
+    @metered_chunks('render')
+    def render_chunks(self):
+        """
+        Yield the HTML rendering of this block in chunks, streaming any block values output by the template
+        """
+        return render_fragment_chunks(self.block, self.value,
+            lambda: stream_template(self.block.template, {'self': self}))
 
 
 class DeclarativeSubBlocksMetaclass(type):
@@ -406,9 +1257,16 @@ class StructBlock(six.with_metaclass(DeclarativeSubBlocksMetaclass, BaseStructBl
 
 class ListBlock(Block):
     default = []
+    form_template = 'core/block_forms/list.html'
+    member_form_template = 'core/block_forms/list_member.html'
 
-    def __init__(self, child_block, **kwargs):
+    def __init__(self, child_block, max_num=None, min_num=None, window_size=None, lazy_initialization=False,
+            **kwargs):
         super(ListBlock, self).__init__(**kwargs)
+        self.max_num = max_num
+        self.min_num = min_num
+        self.window_size = window_size
+        self.lazy_initialization = lazy_initialization
 
         if isinstance(child_block, type):
             # child_block was passed as a class, so convert it to a block instance
@@ -419,77 +1277,219 @@ class ListBlock(Block):
         self.dependencies = set([self.child_block])
         self.child_js_initializer = self.child_block.js_initializer()
 
+    def fingerprint_components(self):
+        return super(ListBlock, self).fingerprint_components() + [
+            self.max_num,
+            self.min_num,
+            self.window_size,
+            self.lazy_initialization,
+            self.form_template,
+            self.member_form_template,
+            self.child_block.definition_fingerprint(),
+        ]
+
     @property
     def media(self):
         return Media(js=['js/blocks/sequence.js', 'js/blocks/list.js'])
 
-    def render_list_member(self, value, prefix, index, error=None):
+    def finalise(self):
+        super(ListBlock, self).finalise()
+        if compiled_forms_enabled():
+            self.compiled_form_templates()
+
+    @definition_cached
+    def compiled_form_templates(self):
+        """
+        Return the compiled equivalents of form_template and member_form_template
+        """
+        return {
+            'list': CompiledSequenceTemplate(self.form_template, {
+                'label': self.label,
+                'prefix': placeholder('prefix'),
+                'count': placeholder('count'),
+            }),
+            'member': CompiledTemplate(self.member_form_template, {
+                'prefix': placeholder('prefix'),
+                'child': PlaceholderBoundBlock(self.child_block),
+                'index': placeholder('index'),
+                'member_id': placeholder('member_id'),
+            }),
+        }
+
+    def render_list_member(self, value, prefix, index, error=None, member_id='', from_stored=True):
         """
         Render the HTML for a single list item in the form. This consists of an <li> wrapper, hidden fields
         to manage ID/deleted state, delete/reorder buttons, and the child block's own form HTML.
+        'member_id' is the index of the item in the stored value, if it was rendered from there.
         """
-        child = self.child_block.bind(value, prefix="%s-value" % prefix, error=error)
-        return render_to_string('core/block_forms/list_member.html', {
+        if compiled_forms_enabled():
+            return self.compiled_form_templates()['member'].render(
+                prefix=prefix, index=index, member_id=member_id,
+                child_html=self.child_block.render_form(
+                    value, prefix="%s-value" % prefix, error=error, from_stored=from_stored)
+            )
+
+        child = self.child_block.bind(value, prefix="%s-value" % prefix, error=error, from_stored=from_stored)
+        return render_to_string(self.member_form_template, {
             'prefix': prefix,
             'child': child,
             'index': index,
+            'member_id': member_id,
         })
 
-    def html_declarations(self):
-        # generate the HTML to be used when adding a new item to the list;
-        # this is the output of render_list_member as rendered with the prefix '__PREFIX__'
-        # (to be replaced dynamically when adding the new item) and the child block's default value
-        # as its value.
-        list_member_html = self.render_list_member(self.child_block.default, '__PREFIX__', '')
+    @definition_cached
+    def new_member_templates(self):
+        # the HTML to be used when adding a new item to the list is the output of render_list_member
+        # as rendered with the prefix '__PREFIX__' and the child block's default value as its value.
+        return {'child': self.render_list_member(self.child_block.default, '__PREFIX__', '', from_stored=False)}
 
+    @definition_cached
+    def html_declarations(self):
+        # the HTML to be used when adding a new item to the list is fetched from new_member_template_url
+        # when needed; we just declare where to find it
         return format_html(
-            '<script type="text/template" id="{0}-newmember">{1}</script>',
-            self.definition_prefix, list_member_html
+            '<script type="text/template" id="{0}-newmember" data-url="{1}"></script>',
+            self.definition_prefix, self.new_member_template_url('child')
         )
 
+    @definition_cached
     def js_initializer(self):
         opts = {'definitionPrefix': "'%s'" % self.definition_prefix}
 
         if self.child_js_initializer:
             opts['childInitializer'] = self.child_js_initializer
+        if self.lazy_initialization:
+            opts['lazy'] = 'true'
 
         return "ListBlock(%s)" % js_dict(opts)
 
-    def render_form(self, value, prefix='', error=None):
+    def stored_version(self, value):
+        """Return a token identifying the stored value 'value', as checked by check_stored_version"""
+        return value_fingerprint(self, list(value)) or ''
+
+    def render_list_members(self, value, prefix, start):
+        """
+        Return a list of (index, HTML) pairs for the forms of the next window_size members of 'value' from
+        index 'start' - i.e. the members of a windowed form that are loaded on demand
+        """
+        return [
+            (i, self.render_list_member(child_val, "%s-%d" % (prefix, i), i, member_id=i))
+            for (i, child_val) in enumerate(value[start:start + self.window_size], start)
+        ]
+
+    def render_form(self, value, prefix='', error=None, from_stored=True):
+        # a value with errors has been read from a submission, rather than being the stored value
+        from_stored = from_stored and error is None
+        loaded_count = windowed_member_count(self, value, from_stored)
+        count_members(loaded_count)
         list_members_html = [
             self.render_list_member(child_val, "%s-%d" % (prefix, i), i,
-                error=error.params[i] if error else None)
+                error=error.params[i] if error else None, member_id=i if from_stored else '',
+                from_stored=from_stored)
+            if i < loaded_count else render_unloaded_member("%s-%d" % (prefix, i), i)
             for (i, child_val) in enumerate(value)
         ]
 
-        return render_to_string('core/block_forms/list.html', {
-            'label': self.label,
-            'prefix': prefix,
-            'list_members_html': list_members_html,
-        })
+        if compiled_forms_enabled():
+            form_html = self.compiled_form_templates()['list'].render(
+                list_members_html, prefix=prefix, count=len(list_members_html)
+            )
+        else:
+            form_html = render_to_string(self.form_template, {
+                'label': self.label,
+                'prefix': prefix,
+                'count': len(list_members_html),
+                'list_members_html': list_members_html,
+            })
+
+        if from_stored:
+            form_html = mark_safe(form_html + render_stored_version(self, value, prefix))
+        error_html = sequence_error_html(error)
+        return mark_safe(error_html + form_html) if error_html else form_html
+
+    @metered('value_from_datadict', this_block)
+    def value_from_datadict(self, data, files, prefix, stored=None):
+        return self.value_from_prefix_view(PrefixView.build(data, prefix, stored), files)
+
+    def value_from_prefix_view(self, node, files):
+        stored = node.stored if isinstance(node.stored, list) else []
+        try:
+            check_stored_version(self, node, stored)
+            delta = submitted_delta(self, node)
+            if delta is None:
+                count = submitted_member_count(self, node)
+        except ValidationError as e:
+            return RejectedValue(e)
+
+        if delta is not None:
+            return self.value_from_delta(node, files, delta, stored)
 
-    def value_from_datadict(self, data, files, prefix):
-        count = int(data['%s-count' % prefix])
         values_with_indexes = []
         for i in range(0, count):
-            if data['%s-%d-deleted' % (prefix, i)]:
-                continue
-            values_with_indexes.append(
-                (
-                    data['%s-%d-order' % (prefix, i)],
-                    self.child_block.value_from_datadict(data, files, '%s-%d-value' % (prefix, i))
-                )
-            )
+            member = node.child(i)
+            try:
+                if submitted_member_deleted(member):
+                    continue
+
+                stored_index = stored_member_index(member)
+                if stored_index is None:
+                    child_value = self.read_member(node, member, files, stored)
+                else:
+                    require_stored_version(node)
+                    if not 0 <= stored_index < len(stored):
+                        raise unrestorable_member_error()
+                    child_value = stored[stored_index]
+
+                order = submitted_member_order(member)
+            except ValidationError as e:
+                return RejectedValue(e)
+            values_with_indexes.append((order, child_value))
 
-        values_with_indexes.sort()
+        values_with_indexes.sort(key=lambda item: item[0])
         return [v for (i, v) in values_with_indexes]
 
+    def read_member(self, node, member, files, stored):
+        """
+        Return the value of the list item submitted under the PrefixView 'member' of the list's PrefixView
+        'node', with the item of 'stored' that its form was rendered from (if any) as the stored value of its
+        child block
+        """
+        return self.child_block.value_from_prefix_view(
+            member.child('value', submitted_stored_member(node, member, stored)), files
+        )
+
+    def value_from_delta(self, node, files, delta, stored):
+        """
+        Return the list value described by the delta submission 'delta' (as returned by submitted_delta),
+        taking the unchanged items from 'stored'
+        """
+        result = []
+        for (submitted, index) in delta:
+            try:
+                if submitted:
+                    result.append(self.read_member(node, node.child(index), files, stored))
+                    continue
+                require_stored_version(node)
+                if index >= len(stored):
+                    raise unrestorable_member_error()
+            except ValidationError as e:
+                return RejectedValue(e)
+            result.append(stored[index])
+        return result
+
+    @metered('clean', this_block)
     def clean(self, value):
+        if isinstance(value, RejectedValue):
+            raise value.error
+        count_members(len(value))
+        check_member_count(self, value)
+
         result = []
         errors = []
+        validation_cache = get_validation_cache()
         for child_val in value:
             try:
-                result.append(self.child_block.clean(child_val))
+                result.append(clean_member(self.child_block, child_val, validation_cache))
             except ValidationError as e:
                 errors.append(e)
             else:
@@ -502,11 +1502,37 @@ class ListBlock(Block):
 
         return result
 
+    def collect_references(self, value, collector):
+        if self.child_block.referenced_models():
+            for item in value:
+                self.child_block.collect_references(item, collector)
+
+    @metered('renderable', this_block)
     def renderable(self, value):
-        return [
-            self.child_block.renderable(item)
-            for item in value
-        ]
+        with prefetch_references(self, value):
+            return RenderableListBlock(self, value)
+
+@python_2_unicode_compatible
+class RenderableListBlock(LazyRenderableList):
+    """
+    A list of the child block's renderable values
+    """
+    __slots__ = ['block']
+
+    def __init__(self, block, value):
+        super(RenderableListBlock, self).__init__(value)
+        self.block = block
+
+    def make_renderable(self, index, raw_value):
+        return self.block.child_block.renderable(raw_value)
+
+    @metered('render')
+    def __str__(self):
+        return defer_rendering(self, safe=False) or repr(self)
+
+    @metered_chunks('render')
+    def render_chunks(self):
+        return render_list_chunks(self)
 
 
 # ===========
@@ -515,9 +1541,16 @@ class ListBlock(Block):
 
 class BaseStreamBlock(Block):
     default = []
+    form_template = 'core/block_forms/stream.html'
+    member_form_template = 'core/block_forms/stream_member.html'
 
-    def __init__(self, local_blocks=None, **kwargs):
+    def __init__(self, local_blocks=None, max_num=None, min_num=None, window_size=None, lazy_initialization=False,
+            **kwargs):
         super(BaseStreamBlock, self).__init__(**kwargs)
+        self.max_num = max_num
+        self.min_num = min_num
+        self.window_size = window_size
+        self.lazy_initialization = lazy_initialization
 
         self.child_blocks = self.base_blocks.copy()  # create a local (shallow) copy of base_blocks so that it can be supplemented by local_blocks
         if local_blocks:
@@ -527,31 +1560,93 @@ class BaseStreamBlock(Block):
 
         self.dependencies = set(self.child_blocks.values())
 
-    def render_list_member(self, block_type_name, value, prefix, index, error=None):
+        # the block type table shared by all StreamValues of this block
+        self.child_block_names = tuple(self.child_blocks.keys())
+        self.child_block_indexes = dict((name, i) for (i, name) in enumerate(self.child_block_names))
+
+    def fingerprint_components(self):
+        return super(BaseStreamBlock, self).fingerprint_components() + [
+            self.max_num,
+            self.min_num,
+            self.window_size,
+            self.lazy_initialization,
+            self.form_template,
+            self.member_form_template,
+            [[name, block.definition_fingerprint()] for name, block in self.child_blocks.items()],
+        ]
+
+    def finalise(self):
+        super(BaseStreamBlock, self).finalise()
+        if compiled_forms_enabled():
+            self.compiled_form_templates()
+
+    @definition_cached
+    def compiled_form_templates(self):
+        """
+        Return the compiled equivalents of form_template and member_form_template (one per child
+        block type)
+        """
+        return {
+            'stream': CompiledSequenceTemplate(self.form_template, {
+                'label': self.label,
+                'prefix': placeholder('prefix'),
+                'count': placeholder('count'),
+                'child_blocks': self.child_blocks.values(),
+                'header_menu_prefix': placeholder('header_menu_prefix'),
+            }),
+            'members': dict([
+                (name, CompiledTemplate(self.member_form_template, {
+                    'child_blocks': self.child_blocks.values(),
+                    'block_type_name': name,
+                    'prefix': placeholder('prefix'),
+                    'child': PlaceholderBoundBlock(child_block),
+                    'index': placeholder('index'),
+                    'member_id': placeholder('member_id'),
+                }))
+                for name, child_block in self.child_blocks.items()
+            ]),
+        }
+
+    def render_list_member(self, block_type_name, value, prefix, index, error=None, member_id='',
+            from_stored=True):
         """
         Render the HTML for a single list item. This consists of an <li> wrapper, hidden fields
         to manage ID/deleted state/type, delete/reorder buttons, and the child block's own HTML.
+        'member_id' is the index of the item in the stored value, if it was rendered from there.
         """
         child_block = self.child_blocks[block_type_name]
-        child = child_block.bind(value, prefix="%s-value" % prefix, error=error)
-        return render_to_string('core/block_forms/stream_member.html', {
+
+        if compiled_forms_enabled():
+            return self.compiled_form_templates()['members'][block_type_name].render(
+                prefix=prefix, index=index, member_id=member_id,
+                child_html=child_block.render_form(
+                    value, prefix="%s-value" % prefix, error=error, from_stored=from_stored)
+            )
+
+        child = child_block.bind(value, prefix="%s-value" % prefix, error=error, from_stored=from_stored)
+        return render_to_string(self.member_form_template, {
             'child_blocks': self.child_blocks.values(),
             'block_type_name': block_type_name,
             'prefix': prefix,
             'child': child,
             'index': index,
+            'member_id': member_id,
         })
 
+    @definition_cached
+    def new_member_templates(self):
+        return dict(
+            (name, self.render_list_member(name, child_block.default, '__PREFIX__', '', from_stored=False))
+            for name, child_block in self.child_blocks.items()
+        )
+
+    @definition_cached
     def html_declarations(self):
         return format_html_join(
-            '\n', '<script type="text/template" id="{0}-newmember-{1}">{2}</script>',
+            '\n', '<script type="text/template" id="{0}-newmember-{1}" data-url="{2}"></script>',
             [
-                (
-                    self.definition_prefix,
-                    name,
-                    self.render_list_member(name, child_block.default, '__PREFIX__', '')
-                )
-                for name, child_block in self.child_blocks.items()
+                (self.definition_prefix, name, self.new_member_template_url(name))
+                for name in self.child_blocks
             ]
         )
 
@@ -559,6 +1654,7 @@ class BaseStreamBlock(Block):
     def media(self):
         return Media(js=['js/blocks/sequence.js', 'js/blocks/stream.js'])
 
+    @definition_cached
     def js_initializer(self):
         # compile a list of info dictionaries, one for each available block type
         child_blocks = []
@@ -579,54 +1675,159 @@ class BaseStreamBlock(Block):
             'definitionPrefix': "'%s'" % self.definition_prefix,
             'childBlocks': '[\n%s\n]' % ',\n'.join(child_blocks),
         }
+        if self.lazy_initialization:
+            opts['lazy'] = 'true'
 
         return "StreamBlock(%s)" % js_dict(opts)
 
-    def render_form(self, value, prefix='', error=None):
+    def to_stream_value(self, value):
+        """
+        Return 'value' (either a StreamValue or a list of {'type': ..., 'value': ...} dicts) as a StreamValue
+        """
+        if isinstance(value, StreamValue):
+            return value
+        return StreamValue.from_items(self.child_block_names, stream_items(value), self.child_block_indexes)
+
+    def stored_version(self, value):
+        """Return a token identifying the stored value 'value', as checked by check_stored_version"""
+        return value_fingerprint(self, stream_items(value)) or ''
+
+    def render_list_members(self, value, prefix, start):
+        """
+        Return a list of (index, HTML) pairs for the forms of the next window_size members of 'value' from
+        index 'start' - i.e. the members of a windowed form that are loaded on demand
+        """
+        return [
+            (i, self.render_list_member(block_type_name, child_val, "%s-%d" % (prefix, i), i, member_id=i))
+            for (i, (block_type_name, child_val))
+            in enumerate(stream_items(value)[start:start + self.window_size], start)
+        ]
+
+    def render_form(self, value, prefix='', error=None, from_stored=True):
+        # a value with errors has been read from a submission, rather than being the stored value
+        from_stored = from_stored and error is None
+        loaded_count = windowed_member_count(self, value, from_stored)
+        count_members(loaded_count)
         list_members_html = [
-            self.render_list_member(member['type'], member['value'], "%s-%d" % (prefix, i), i,
-                error=error.params[i] if error else None)
-            for (i, member) in enumerate(value)
+            self.render_list_member(block_type_name, child_val, "%s-%d" % (prefix, i), i,
+                error=error.params[i] if error else None, member_id=i if from_stored else '',
+                from_stored=from_stored)
+            if i < loaded_count else render_unloaded_member("%s-%d" % (prefix, i), i)
+            for (i, (block_type_name, child_val)) in enumerate(stream_items(value))
         ]
 
-        return render_to_string('core/block_forms/stream.html', {
-            'label': self.label,
-            'prefix': prefix,
-            'list_members_html': list_members_html,
-            'child_blocks': self.child_blocks.values(),
-            'header_menu_prefix': '%s-before' % prefix,
-        })
+        if compiled_forms_enabled():
+            form_html = self.compiled_form_templates()['stream'].render(
+                list_members_html, prefix=prefix, count=len(list_members_html),
+                header_menu_prefix='%s-before' % prefix
+            )
+        else:
+            form_html = render_to_string(self.form_template, {
+                'label': self.label,
+                'prefix': prefix,
+                'count': len(list_members_html),
+                'list_members_html': list_members_html,
+                'child_blocks': self.child_blocks.values(),
+                'header_menu_prefix': '%s-before' % prefix,
+            })
+
+        if from_stored:
+            form_html = mark_safe(form_html + render_stored_version(self, value, prefix))
+        error_html = sequence_error_html(error)
+        return mark_safe(error_html + form_html) if error_html else form_html
+
+    @metered('value_from_datadict', this_block)
+    def value_from_datadict(self, data, files, prefix, stored=None):
+        return self.value_from_prefix_view(PrefixView.build(data, prefix, stored), files)
+
+    def value_from_prefix_view(self, node, files):
+        stored_value = node.stored if isinstance(node.stored, (list, StreamValue)) else []
+        stored = stream_items(stored_value)
+        try:
+            check_stored_version(self, node, stored_value)
+            delta = submitted_delta(self, node)
+            if delta is None:
+                count = submitted_member_count(self, node)
+        except ValidationError as e:
+            return RejectedValue(e)
+
+        if delta is not None:
+            return self.value_from_delta(node, files, delta, stored)
 
-    def value_from_datadict(self, data, files, prefix):
-        count = int(data['%s-count' % prefix])
         values_with_indexes = []
         for i in range(0, count):
-            if data['%s-%d-deleted' % (prefix, i)]:
-                continue
-            block_type_name = data['%s-%d-type' % (prefix, i)]
-            child_block = self.child_blocks[block_type_name]
-
-            values_with_indexes.append(
-                (
-                    data['%s-%d-order' % (prefix, i)],
-                    block_type_name,
-                    child_block.value_from_datadict(data, files, '%s-%d-value' % (prefix, i))
-                )
-            )
+            member = node.child(i)
+            try:
+                if submitted_member_deleted(member):
+                    continue
+
+                stored_index = stored_member_index(member)
+                if stored_index is None:
+                    block_type_name, child_value = self.read_member(node, member, files, stored)
+                else:
+                    require_stored_version(node)
+                    if not 0 <= stored_index < len(stored):
+                        raise unrestorable_member_error()
+                    block_type_name, child_value = stored[stored_index]
+
+                order = submitted_member_order(member)
+            except ValidationError as e:
+                return RejectedValue(e)
+            values_with_indexes.append((order, block_type_name, child_value))
 
-        values_with_indexes.sort()
+        values_with_indexes.sort(key=lambda item: item[0])
         return [{'type': t, 'value': v} for (i, t, v) in values_with_indexes]
 
+    def read_member(self, node, member, files, stored):
+        """
+        Return a (block type name, value) tuple for the stream member submitted under the PrefixView
+        'member' of the stream's PrefixView 'node', with the member of 'stored' that its form was rendered
+        from (if any, and of the same type) as the stored value of its child block. Raises ValidationError if
+        its type is missing or unknown.
+        """
+        try:
+            block_type_name = member.child_value('type')
+            child_block = self.child_blocks[block_type_name]
+        except (KeyError, TypeError):
+            raise ValidationError("Invalid submission: the type of an item is missing or unknown", code='invalid_type')
+        stored_type, stored_value = submitted_stored_member(node, member, stored) or (None, None)
+        return block_type_name, child_block.value_from_prefix_view(
+            member.child('value', stored_value if stored_type == block_type_name else None), files
+        )
+
+    def value_from_delta(self, node, files, delta, stored):
+        """
+        Return the stream value described by the delta submission 'delta' (as returned by submitted_delta),
+        taking the unchanged members from 'stored'
+        """
+        items = []
+        for (submitted, index) in delta:
+            try:
+                if submitted:
+                    items.append(self.read_member(node, node.child(index), files, stored))
+                    continue
+                require_stored_version(node)
+                if index >= len(stored):
+                    raise unrestorable_member_error()
+            except ValidationError as e:
+                return RejectedValue(e)
+            items.append(stored[index])
+        return [{'type': t, 'value': v} for (t, v) in items]
+
+    @metered('clean', this_block)
     def clean(self, value):
+        if isinstance(value, RejectedValue):
+            raise value.error
+        count_members(len(value))
+        check_member_count(self, value)
+
         result = []
         errors = []
-        for child_val in value:
-            child_block = self.child_blocks[child_val['type']]
+        validation_cache = get_validation_cache()
+        for block_type_name, child_val in stream_items(value):
+            child_block = self.child_blocks[block_type_name]
             try:
-                result.append({
-                    'type': child_val['type'],
-                    'value': child_block.clean(child_val['value']),
-                })
+                result.append((block_type_name, clean_member(child_block, child_val, validation_cache)))
             except ValidationError as e:
                 errors.append(e)
             else:
@@ -637,13 +1838,43 @@ class BaseStreamBlock(Block):
             # which only involves the 'params' list
             raise ValidationError('Validation error in StreamBlock', params=errors)
 
-        return result
+        return [{'type': t, 'value': v} for (t, v) in result]
 
+    def collect_references(self, value, collector):
+        for block_type_name, child_val in stream_items(value):
+            child_block = self.child_blocks[block_type_name]
+            if child_block.referenced_models():
+                child_block.collect_references(child_val, collector)
+
+    @metered('renderable', this_block)
     def renderable(self, value):
-        return [
-            self.child_blocks[item['type']].renderable(item['value'])
-            for item in value
-        ]
+        with prefetch_references(self, value):
+            return RenderableStreamBlock(self, value)
+
+@python_2_unicode_compatible
+class RenderableStreamBlock(LazyRenderableList):
+    """
+    A list of the renderable values of the stream's members, with their block type names available as
+    block_types
+    """
+    __slots__ = ['block', 'block_types']
+
+    def __init__(self, block, value):
+        value = block.to_stream_value(value)
+        super(RenderableStreamBlock, self).__init__(value.values)
+        self.block = block
+        self.block_types = [value.block_types[i] for i in value.type_indexes]
+
+    def make_renderable(self, index, raw_value):
+        return self.block.child_blocks[self.block_types[index]].renderable(raw_value)
+
+    @metered('render')
+    def __str__(self):
+        return defer_rendering(self, safe=False) or repr(self)
+
+    @metered_chunks('render')
+    def render_chunks(self):
+        return render_list_chunks(self)
 
 class StreamBlock(six.with_metaclass(DeclarativeSubBlocksMetaclass, BaseStreamBlock)):
     pass
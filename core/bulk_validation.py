@@ -0,0 +1,171 @@
+"""
+Validation of stored StreamField values against the current block definition - e.g. to find the values
+that no longer pass clean() after a change to the definition. Used by the validate_streamblocks
+management command.
+
+Values are read in batches of raw JSON (see core.value_migrations.raw_value_batches) and validated in a pool
+of worker processes, each batch as one task. Workers only receive the stored JSON, and don't query the
+database themselves. For each failing row, the errors are reported as a list of (path, messages) pairs,
+where the path is the sequence of struct child names and list / stream indexes leading to the failing block,
+taken from the nested ValidationError params built by the container blocks' clean methods.
+"""
+import multiprocessing
+import time
+from collections import deque
+
+from django.apps import apps
+from django.core.exceptions import ValidationError
+from django.db import connections
+
+from core.validation import full_validation
+from core.value_migrations import raw_value_batches
+
+
+def child_errors(error):
+    """
+    Return a list of (path component, child error) pairs for the children of a container block error,
+    or None if 'error' is not one - i.e. its params are not a list / dict of child ValidationErrors, or are
+    all blank, as for errors in the number of list / stream members
+    """
+    params = getattr(error, 'params', None)
+    if isinstance(params, dict):
+        items = params.items()
+    elif isinstance(params, list):
+        items = enumerate(params)
+    else:
+        return None
+
+    items = [(key, child_error) for (key, child_error) in items if child_error is not None]
+    if not items or not all(isinstance(child_error, ValidationError) for (key, child_error) in items):
+        return None
+    return sorted(items, key=lambda item: str(item[0]))
+
+
+def error_paths(error, path=()):
+    """
+    Return a list of (path, messages) pairs for the individual block errors within the ValidationError
+    'error', as raised by Block.clean
+    """
+    children = child_errors(error)
+    if children is None:
+        return [(path, error.messages)]
+
+    result = []
+    for key, child_error in children:
+        result += error_paths(child_error, path + (key,))
+    return result
+
+
+def validate_raw_value(field, raw_value):
+    """
+    Validate the stored JSON 'raw_value' of the StreamField 'field'; return a list of (path, messages)
+    pairs for its errors, which is empty if it is valid. Every member is validated in full, bypassing the
+    validation cache: stored values are being checked because they may no longer be valid.
+    """
+    try:
+        value = field.to_python(raw_value)
+    except (ValueError, KeyError, TypeError) as e:
+        return [((), ['Stored value could not be decoded: %s' % e])]
+
+    try:
+        with full_validation():
+            field.stream_block.clean(value)
+    except ValidationError as e:
+        return error_paths(e)
+    return []
+
+
+def validate_batch(field, rows):
+    """Validate a list of (pk, stored JSON) pairs; return a list of (pk, errors) pairs for the failing rows"""
+    failures = []
+    for pk, raw_value in rows:
+        errors = validate_raw_value(field, raw_value)
+        if errors:
+            failures.append((pk, errors))
+    return failures
+
+
+_worker_field = None
+
+
+def init_worker(app_label, model_name, field_name):
+    global _worker_field
+    _worker_field = apps.get_model(app_label, model_name)._meta.get_field(field_name)
+
+
+def validate_batch_in_worker(rows):
+    return validate_batch(_worker_field, rows)
+
+
+def validate_field(model, field_name, batch_size=500, processes=None, progress=None):
+    """
+    Validate the 'field_name' StreamField of all 'model' instances, yielding (pk, errors) pairs for the
+    failing rows.
+
+    'processes' is the size of the worker pool (by default, the number of CPUs); if it is 1, values are
+    validated in this process. 'progress', if given, is called after each batch with a dict of the number of
+    rows 'scanned' so far, the number that 'failed', and the elapsed 'seconds'.
+    """
+    field = model._meta.get_field(field_name)
+    stats = {'scanned': 0, 'failed': 0, 'seconds': 0.0}
+    start = time.time()
+    batches = raw_value_batches(model, field_name, batch_size)
+
+    def record(rows_count, failures):
+        stats['scanned'] += rows_count
+        stats['failed'] += len(failures)
+        stats['seconds'] = time.time() - start
+        if progress:
+            progress(stats)
+
+    if processes == 1:
+        for rows in batches:
+            failures = validate_batch(field, rows)
+            record(len(rows), failures)
+            for failure in failures:
+                yield failure
+        return
+
+    # Forked workers would inherit any open database connections, and a worker closing (or just discarding)
+    # its copy would end the session for every process; so close them first, leaving each process to open
+    # its own when needed
+    for connection in connections.all():
+        connection.close()
+    pool = multiprocessing.Pool(
+        processes, initializer=init_worker,
+        initargs=(model._meta.app_label, model._meta.model_name, field_name)
+    )
+    try:
+        # keep a bounded number of batches in flight, so that memory use doesn't grow with the table size
+        max_pending = 2 * (processes or multiprocessing.cpu_count())
+        pending = deque()
+        for rows in batches:
+            pending.append((len(rows), pool.apply_async(validate_batch_in_worker, (rows,))))
+            while len(pending) >= max_pending or (pending and pending[0][1].ready()):
+                rows_count, result = pending.popleft()
+                failures = result.get()
+                record(rows_count, failures)
+                for failure in failures:
+                    yield failure
+
+        while pending:
+            rows_count, result = pending.popleft()
+            failures = result.get()
+            record(rows_count, failures)
+            for failure in failures:
+                yield failure
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def stream_fields():
+    """Return a list of (model, field name) pairs for all StreamFields of all installed models"""
+    from core.fields import StreamField
+
+    return [
+        (model, field.name)
+        for model in apps.get_models()
+        for field in model._meta.local_fields
+        if isinstance(field, StreamField)
+    ]
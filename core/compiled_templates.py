@@ -0,0 +1,118 @@
+"""
+Pre-compiled versions of the form 'chrome' templates (the list / stream wrappers and their members).
+
+A template is rendered once with placeholder markers standing in for its variable parts, and the result
+is split into literal fragments; subsequent renderings are then a plain string join, with no template
+lookup or context handling. This is only valid for templates that output those variables verbatim
+(with the usual autoescaping) - any filters or conditional logic applied to a placeholder are baked in
+with the placeholder's value, which is why this mode is opt-in (see COMPILED_BLOCK_FORMS).
+"""
+import re
+
+from django.template.loader import render_to_string
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+
+PLACEHOLDER_RE = re.compile(r'\x00(\w+)\x00')
+
+
+def placeholder(name):
+    """
+    Return a marker string to be passed in a template context in place of the variable 'name'.
+    Markers are marked as safe so that they pass through autoescaping unchanged.
+    """
+    return mark_safe('\x00%s\x00' % name)
+
+
+class PlaceholderBoundBlock(object):
+    """
+    Stand-in for a BoundBlock in a template context: the block definition is real (so that
+    per-definition attributes such as child.block.name are baked in), but the rendered form
+    HTML is a placeholder.
+    """
+    def __init__(self, block, name='child_html'):
+        self.block = block
+        self.render_form = placeholder(name)
+
+
+class TemplateNotCompilable(Exception):
+    pass
+
+
+def split_fragments(rendered):
+    """
+    Split the output of a template rendered with placeholders into a list of
+    (literal, variable_name) pairs, with a final (literal, None) pair.
+    """
+    parts = PLACEHOLDER_RE.split(rendered)
+    pairs = [(parts[i], parts[i + 1]) for i in range(0, len(parts) - 1, 2)]
+    pairs.append((parts[-1], None))
+    return pairs
+
+
+def join_fragments(pairs, values):
+    output = []
+    for literal, name in pairs:
+        output.append(literal)
+        if name is not None:
+            output.append(conditional_escape(values[name]))
+    return ''.join(output)
+
+
+class CompiledTemplate(object):
+    """
+    A template that has been rendered once with placeholders in its context; render() fills
+    in the placeholders by name, applying the same escaping that {{ var }} would.
+    """
+    def __init__(self, template_name, context):
+        self.template_name = template_name
+        self.fragments = split_fragments(render_to_string(template_name, context))
+
+    def render(self, **values):
+        return mark_safe(join_fragments(self.fragments, values))
+
+
+class CompiledSequenceTemplate(object):
+    """
+    Compiled form of a sequence template (core/block_forms/sequence.html and its descendants),
+    which loops over the already-rendered HTML of its members in 'list_members_html'.
+
+    The template is rendered once with no members, and once with two placeholder members;
+    everything before the first member, between the two members, and after the last member
+    then gives us the literal text to wrap around / join between an arbitrary number of members.
+    """
+    def __init__(self, template_name, context):
+        self.template_name = template_name
+
+        empty_context = dict(context)
+        empty_context['list_members_html'] = []
+        self.empty_fragments = split_fragments(render_to_string(template_name, empty_context))
+
+        member_context = dict(context)
+        member_context['list_members_html'] = [placeholder('first_member'), placeholder('second_member')]
+        rendered = render_to_string(template_name, member_context)
+
+        try:
+            head, rest = rendered.split(placeholder('first_member'))
+            separator, tail = rest.split(placeholder('second_member'))
+        except ValueError:
+            raise TemplateNotCompilable(
+                "%s does not output each member of list_members_html exactly once" % template_name)
+        if PLACEHOLDER_RE.search(separator):
+            raise TemplateNotCompilable(
+                "%s outputs variables between members of list_members_html" % template_name)
+
+        self.head_fragments = split_fragments(head)
+        self.separator = separator
+        self.tail_fragments = split_fragments(tail)
+
+    def render(self, list_members_html, **values):
+        if not list_members_html:
+            return mark_safe(join_fragments(self.empty_fragments, values))
+
+        return mark_safe(
+            join_fragments(self.head_fragments, values)
+            + self.separator.join(list_members_html)
+            + join_fragments(self.tail_fragments, values)
+        )
@@ -0,0 +1,82 @@
+"""
+Model fields for persisting block values.
+"""
+import json
+
+from django.db import models
+
+import six
+
+from core.blocks import Block, BaseStreamBlock, StreamBlock, register_root_definition
+from core.values import BlockJSONEncoder
+
+
+class StreamFieldDescriptor(object):
+    """
+    Attribute descriptor for StreamField. Values loaded from the database (or otherwise assigned as a JSON string)
+    are held on the instance in their raw form, and only decoded into a block value when the attribute is first
+    read - so that code paths which load a row but never touch the field don't pay the cost of parsing it.
+    """
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        value = instance.__dict__[self.field.attname]
+        if isinstance(value, six.string_types):
+            value = self.field.to_python(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class StreamField(models.Field):
+    """
+    A model field storing the value of 'block_def' (a block instance, or a list of (name, block) tuples to be
+    made into a StreamBlock) as JSON
+    """
+    def __init__(self, block_def, **kwargs):
+        if isinstance(block_def, Block):
+            self.stream_block = block_def
+        else:
+            self.stream_block = StreamBlock(block_def)
+        register_root_definition(self.stream_block)
+        super(StreamField, self).__init__(**kwargs)
+
+    def get_internal_type(self):
+        return 'TextField'
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(StreamField, self).deconstruct()
+        return name, path, [self.stream_block] + list(args), kwargs
+
+    def contribute_to_class(self, cls, name):
+        super(StreamField, self).contribute_to_class(cls, name)
+        setattr(cls, self.name, StreamFieldDescriptor(self))
+
+    def to_python(self, value):
+        if not isinstance(value, six.string_types):
+            return value
+
+        value = json.loads(value) if value else self.stream_block.default
+
+        if isinstance(self.stream_block, BaseStreamBlock):
+            return self.stream_block.to_stream_value(value)
+        return value
+
+    def pre_save(self, model_instance, add):
+        # read the attribute without going through the descriptor, so that a value which hasn't been accessed
+        # since it was loaded is written back as-is rather than being decoded and re-encoded
+        return model_instance.__dict__.get(self.attname)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, six.string_types):
+            return value
+        return json.dumps(value, cls=BlockJSONEncoder)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(obj.__dict__.get(self.attname))
@@ -0,0 +1,281 @@
+"""
+Cache for the rendered front-end HTML of blocks, keyed on the content rather than on the page:
+two occurrences of the same block definition with the same value render to the same HTML,
+regardless of which page or visitor they are being rendered for.
+
+There are two tiers - a size-bounded in-process LRU cache, and optionally a Django cache backend
+shared between processes - configured through the BLOCK_FRAGMENT_CACHE setting:
+
+    BLOCK_FRAGMENT_CACHE = {
+        'MAX_ENTRIES': 1000,  # size of the in-process tier; 0 to disable it
+        'CACHE_ALIAS': 'default',  # Django cache to use as the shared tier; None to disable it
+        'TIMEOUT': 300,  # expiry time for both tiers, in seconds
+    }
+
+If BLOCK_FRAGMENT_CACHE is not set (or None), rendered HTML is not cached at all. Individual block
+classes can opt out by setting cache_fragments = False, which also excludes any block containing them.
+Blocks whose rendering depends on objects referenced by the value (such as chooser blocks with a
+target_model) are never cached, as the cache key only covers the value itself, not the objects' state.
+
+Keys include the source of the templates used by the block and its children, so that renderings made
+with an old version of a template are not served after it changes. Templates pulled in by {% include %}
+or {% extends %} are not covered: when changing those, bump the VERSION of the shared tier's cache.
+"""
+import datetime
+import decimal
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.base import TemplateDoesNotExist
+from django.template.loader import find_template_loader
+from django.test.signals import setting_changed
+from django.utils.safestring import mark_safe
+
+import six
+
+from core.values import StreamValue
+
+
+class LRUCache(object):
+    """
+    A dict-based cache holding at most max_entries items, discarding the least recently used one
+    when full. If 'timeout' is given, items also expire that many seconds after they were set.
+    """
+    def __init__(self, max_entries, timeout=None):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expiry_time, value = self._data.pop(key)
+            except KeyError:
+                return None
+            if expiry_time is not None and expiry_time <= time.time():
+                return None
+            # re-insert to mark as most recently used
+            self._data[key] = (expiry_time, value)
+            return value
+
+    def set(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expiry_time = time.time() + self.timeout if self.timeout is not None else None
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expiry_time, value)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FragmentCache(object):
+    def __init__(self, max_entries=1000, cache_alias=None, timeout=300):
+        self.local = LRUCache(max_entries, timeout)
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+
+    @property
+    def shared(self):
+        if self.cache_alias is None:
+            return None
+        return caches[self.cache_alias]
+
+    def get(self, key):
+        html = self.local.get(key)
+        if html is None and self.shared is not None:
+            html = self.shared.get(key)
+            if html is not None:
+                self.local.set(key, html)
+        return html
+
+    def set(self, key, html):
+        self.local.set(key, html)
+        if self.shared is not None:
+            self.shared.set(key, html, self.timeout)
+
+    def clear(self):
+        """Clear the in-process tier. (The shared tier is left alone, as other processes may be using it.)"""
+        self.local.clear()
+
+
+_fragment_cache = None
+
+
+def get_fragment_cache():
+    """
+    Return the FragmentCache instance configured by the BLOCK_FRAGMENT_CACHE setting, or None if
+    fragment caching is disabled.
+    """
+    global _fragment_cache
+    if _fragment_cache is None:
+        config = getattr(settings, 'BLOCK_FRAGMENT_CACHE', None)
+        if config is None:
+            return None
+        _fragment_cache = FragmentCache(
+            max_entries=config.get('MAX_ENTRIES', 1000),
+            cache_alias=config.get('CACHE_ALIAS'),
+            timeout=config.get('TIMEOUT', 300),
+        )
+    return _fragment_cache
+
+
+def reset_fragment_cache(**kwargs):
+    global _fragment_cache
+    if kwargs.get('setting', 'BLOCK_FRAGMENT_CACHE') == 'BLOCK_FRAGMENT_CACHE':
+        _fragment_cache = None
+
+setting_changed.connect(reset_fragment_cache)
+
+
+# types represented as themselves, and as a type tag and string, by typed_value. (Native strings are
+# Python 2's byte strings, which are interchangeable with unicode strings with the same text.)
+PLAIN_TYPES = (six.text_type, str, float, bool, type(None)) + six.integer_types
+TAGGED_TYPES = (datetime.date, datetime.datetime, datetime.time, decimal.Decimal, uuid.UUID)
+
+
+def typed_value(value):
+    """
+    Return a JSON-serialisable representation of 'value' that preserves the exact type of everything within
+    it, so that values which JSON would conflate - such as a date and its ISO format string, or a Decimal and
+    a float - serialise differently. Strings, integers, floats, booleans and None are represented as
+    themselves; all other values (including every list and dict) as a list of a type tag and the contents.
+    Raises TypeError for types other than those, lists, tuples, dicts with string keys, StreamValues, dates,
+    times, datetimes, Decimals and UUIDs - including subclasses of them, whose behaviour may differ.
+    """
+    value_type = type(value)
+    if value_type in PLAIN_TYPES:
+        return value
+    if value_type is list or value_type is StreamValue:
+        return ['list', [typed_value(item) for item in value]]
+    if value_type is tuple:
+        return ['tuple', [typed_value(item) for item in value]]
+    if value_type is dict:
+        items = {}
+        for key, item in value.items():
+            if type(key) is not six.text_type and type(key) is not str:
+                raise TypeError("Cannot fingerprint dict key %r" % (key,))
+            items[key] = typed_value(item)
+        return ['dict', items]
+    if value_type is six.binary_type:
+        return ['bytes', value.decode('latin-1')]
+    if value_type in TAGGED_TYPES:
+        return [value_type.__name__, value.isoformat() if hasattr(value, 'isoformat') else str(value)]
+    raise TypeError("Cannot fingerprint value of type %s" % value_type.__name__)
+
+
+def value_fingerprint(block, value):
+    """
+    Return a digest identifying 'value' as a value of the block definition 'block' - equal for any two
+    structurally identical definitions and values of identical types and content (see typed_value) - or None
+    if the value cannot be serialised to a stable representation.
+    """
+    try:
+        serialised_value = json.dumps(typed_value(value), sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+
+    digest = hashlib.sha1()
+    digest.update(block.definition_fingerprint().encode('ascii'))
+    digest.update(serialised_value.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def template_source(template_name):
+    """
+    Return the source of the template 'template_name', as found by the TEMPLATE_LOADERS, or None if it
+    can't be found
+    """
+    loaders = [find_template_loader(loader) for loader in settings.TEMPLATE_LOADERS]
+    while loaders:
+        loader = loaders.pop(0)
+        if hasattr(loader, 'loaders'):
+            # a cached loader; look in the loaders that it wraps
+            loaders[:0] = loader.loaders
+            continue
+        try:
+            return loader.load_template_source(template_name)[0]
+        except (TemplateDoesNotExist, NotImplementedError):
+            continue
+    return None
+
+
+def templates_fingerprint(template_names):
+    """Return a digest of the names and sources of the templates 'template_names'"""
+    digest = hashlib.sha1()
+    for template_name in sorted(template_names):
+        source = template_source(template_name) or ''
+        digest.update(('%s\x00%s\x00' % (template_name, source)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def fragment_key(block, value):
+    """
+    Return the cache key for the rendering of 'value' by the block definition 'block', or None
+    if the value cannot be serialised to a stable representation.
+    """
+    fingerprint = value_fingerprint(block, value)
+    if fingerprint is None:
+        return None
+    return 'blockfragment:%s:%s' % (block.templates_fingerprint(), fingerprint)
+
+
+def render_fragment(block, value, render):
+    """
+    Return the HTML for 'value' as rendered by the block definition 'block', using the fragment cache
+    where possible; 'render' is a function returning the rendered HTML, called on a cache miss.
+    """
+    cache = get_fragment_cache()
+    if cache is None or not block.fragments_cacheable():
+        return render()
+
+    key = fragment_key(block, value)
+    if key is None:
+        return render()
+
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html)
+    return mark_safe(html)
+
+
+def render_fragment_chunks(block, value, render_chunks):
+    """
+    Chunked equivalent of render_fragment: yield the HTML for 'value' in chunks, from the fragment cache
+    if possible; 'render_chunks' is a function returning an iterable of chunks, called on a cache miss.
+    """
+    cache = get_fragment_cache()
+    key = None
+    if cache is not None and block.fragments_cacheable():
+        key = fragment_key(block, value)
+
+    if key is None:
+        for chunk in render_chunks():
+            yield chunk
+        return
+
+    html = cache.get(key)
+    if html is not None:
+        yield mark_safe(html)
+        return
+
+    chunks = []
+    for chunk in render_chunks():
+        chunks.append(chunk)
+        yield chunk
+    cache.set(key, mark_safe(''.join(chunks)))
@@ -0,0 +1,155 @@
+"""
+Timing instrumentation for block methods, as displayed by core.panels.BlockTimingPanel.
+
+The first time a recording is started, the methods listed in INSTRUMENTED_METHODS on every Block subclass
+are replaced by wrappers that record the number of calls, and the cumulative and self time (i.e. excluding
+time spent in the instrumented methods of other blocks) spent in each method, per block class and
+definition. The wrappers are permanent - later recordings only add wrappers to classes defined since - and
+check a thread-local flag on each call, so recordings are per-thread: calls made on threads that are not
+recording pass straight through, at the cost of one thread-local lookup.
+
+For methods decorated with definition_cached, it is the computation on a cache miss that is timed, not the
+cache lookup.
+"""
+import functools
+import threading
+import timeit
+import types
+from contextlib import contextmanager
+
+from core.blocks import Block, class_path, definition_cached
+
+
+INSTRUMENTED_METHODS = [
+    'render_form', 'render_list_member', 'value_from_datadict', 'value_from_prefix_view', 'clean', 'renderable',
+    'html_declarations',
+]
+
+
+class BlockTimings(object):
+    """The timings recorded for one thread over the lifetime of a recording"""
+    def __init__(self):
+        # (block class path, definition prefix, method name) => [label, calls, cumulative time, self time]
+        self.stats = {}
+        # for each instrumented call in progress: [block, method name, start time, time spent in child calls]
+        self.stack = []
+
+    def is_current_call(self, block, method_name):
+        # true for a super() call from an instrumented method to its overridden version, which we treat as
+        # part of the same call
+        return bool(self.stack) and self.stack[-1][0] is block and self.stack[-1][1] == method_name
+
+    def enter(self, block, method_name):
+        frame = [block, method_name, timeit.default_timer(), 0.0]
+        self.stack.append(frame)
+        return frame
+
+    def exit(self, frame):
+        elapsed = timeit.default_timer() - frame[2]
+        self.stack.pop()
+        if self.stack:
+            self.stack[-1][3] += elapsed
+
+        block, method_name = frame[0], frame[1]
+        key = (class_path(type(block)), block.definition_prefix, method_name)
+        try:
+            stats = self.stats[key]
+        except KeyError:
+            stats = self.stats[key] = [block.label, 0, 0.0, 0.0]
+        stats[1] += 1
+        stats[2] += elapsed
+        stats[3] += elapsed - frame[3]
+
+    def results(self):
+        """Return the recorded timings as a list of dicts, in descending order of self time"""
+        results = [
+            {
+                'block_class': block_class, 'definition': definition_prefix, 'label': label, 'method': method_name,
+                'calls': calls, 'cumulative_time': cumulative_time, 'self_time': self_time,
+            }
+            for ((block_class, definition_prefix, method_name), (label, calls, cumulative_time, self_time))
+            in self.stats.items()
+        ]
+        results.sort(key=lambda result: result['self_time'], reverse=True)
+        return results
+
+    @property
+    def total_time(self):
+        return sum(stats[3] for stats in self.stats.values())
+
+
+_state = threading.local()
+
+_install_lock = threading.Lock()
+
+
+def instrument_method(func, method_name):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        timings = getattr(_state, 'timings', None)
+        if timings is None or timings.is_current_call(self, method_name):
+            return func(self, *args, **kwargs)
+
+        frame = timings.enter(self, method_name)
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            timings.exit(frame)
+    wrapper.instrumented = True
+    return wrapper
+
+
+def block_classes(cls=Block):
+    yield cls
+    for subclass in cls.__subclasses__():
+        for block_class in block_classes(subclass):
+            yield block_class
+
+
+def install_wrappers():
+    """Wrap the instrumented methods of any Block subclasses that have not been wrapped already"""
+    for cls in set(block_classes()):
+        for method_name in INSTRUMENTED_METHODS:
+            func = cls.__dict__.get(method_name)
+            if not isinstance(func, types.FunctionType) or getattr(func, 'instrumented', False):
+                continue
+            if hasattr(func, 'uncached'):
+                wrapper = definition_cached(instrument_method(func.uncached, method_name))
+                wrapper.instrumented = True
+            else:
+                wrapper = instrument_method(func, method_name)
+            setattr(cls, method_name, wrapper)
+
+
+def start_recording():
+    """
+    Start recording block timings for the current thread, and return the BlockTimings object that they
+    will be recorded to
+    """
+    with _install_lock:
+        install_wrappers()
+
+    _state.timings = BlockTimings()
+    return _state.timings
+
+
+def stop_recording():
+    """Stop recording block timings for the current thread, and return the BlockTimings object"""
+    timings = getattr(_state, 'timings', None)
+    _state.timings = None
+    return timings
+
+
+def is_recording():
+    """Return whether block timings are being recorded for the current thread"""
+    return getattr(_state, 'timings', None) is not None
+
+
+@contextmanager
+def record_timings():
+    """Record block timings for the current thread within this context, yielding the BlockTimings object"""
+    timings = start_recording()
+    try:
+        yield timings
+    finally:
+        stop_recording()
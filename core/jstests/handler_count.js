@@ -0,0 +1,243 @@
+/* Browser-free test of the event handlers that sequence.js / list.js / stream.js set up for a form.
+
+Runs the block scripts under node against a minimal stand-in for jQuery, which models just the fields
+that the scripts read (by id) and records every event handler they bind. Checks that the number of handlers
+bound on page load doesn't grow with the number of members, that with lazy initialisation, members are
+initialised on first use rather than on load, and that delta submissions include edits to nested sequences.
+Run with:
+
+    node core/jstests/handler_count.js
+
+Exits with a non-zero status if a check fails.
+*/
+var fs = require('fs');
+var path = require('path');
+var vm = require('vm');
+
+var SCRIPTS_DIR = path.join(__dirname, '..', 'static', 'js', 'blocks');
+
+function Page(fieldValues, deltaSubmissions) {
+    /* the form fields of a page, by id, and the handlers bound within it */
+    var page = {'fieldValues': fieldValues, 'handlers': [], 'disabled': {}};
+
+    function Elements(id) {
+        var elements = {'id': id, 'length': id === null ? 0 : 1};
+        var chainable = [
+            'before', 'after', 'append', 'prepend', 'replaceWith', 'insertAfter', 'hide', 'slideDown', 'fadeOut',
+            'find', 'each'
+        ];
+        chainable.forEach(function(method) {
+            elements[method] = function() { return elements; };
+        });
+
+        elements.val = function(value) {
+            if (arguments.length) {
+                page.fieldValues[id] = String(value);
+                return elements;
+            }
+            return id in page.fieldValues ? page.fieldValues[id] : '';
+        };
+        elements.attr = function(name) {
+            if (typeof(name) == 'object') {
+                /* setting the attributes of a new element; only the id is modelled */
+                id = elements.id = name.id;
+                elements.length = 1;
+                return elements;
+            }
+            return name == 'id' ? id : undefined;
+        };
+        elements.prop = function(name, value) {
+            /* only 'disabled' is modelled */
+            if (arguments.length > 1) {
+                if (name == 'disabled') page.disabled[id] = value;
+                return elements;
+            }
+            return name == 'disabled' ? !!page.disabled[id] : undefined;
+        };
+        elements.trigger = function(type) {
+            page.trigger(type, id);
+            return elements;
+        };
+        elements.on = function(events, handler) {
+            page.handlers.push({'id': id, 'events': events.split(' '), 'handler': handler});
+            return elements;
+        };
+        elements.click = function(handler) {
+            return elements.on('click', handler);
+        };
+        elements.hasClass = function() { return false; };
+        elements.is = function(selector) {
+            /* only used to test whether the form has delta submissions enabled */
+            return selector == '[data-block-delta-submissions]' && !!deltaSubmissions;
+        };
+        elements.data = function() { return undefined; };
+        elements.closest = function(selector) {
+            /* only used to find the element with an id that an event occurred in - i.e. the target itself */
+            return Elements(selector == '[id]' ? id : null);
+        };
+        elements.parentsUntil = function(list) {
+            /* the container of the member of 'list' that encloses this element, e.g. 'page-3-container' for
+            'page-3-delete' within 'page-list' */
+            var listPrefix = list.id.replace(/-list$/, '');
+            var match = /^(\d+)-/.exec(id.substr(listPrefix.length + 1));
+            var within = id.substr(0, listPrefix.length + 1) == listPrefix + '-';
+            return Elements(within && match ? listPrefix + '-' + match[1] + '-container' : null);
+        };
+        elements.last = function() { return elements; };
+        elements.offset = function() { return {'top': 0}; };
+        elements.scrollTop = function() { return 0; };
+        elements.height = function() { return 0; };
+        return elements;
+    }
+
+    page.jQuery = function(selector) {
+        if (typeof(selector) == 'string' && selector.charAt(0) == '#') {
+            return Elements(selector.substr(1));
+        }
+        if (selector && selector.id) {
+            /* an event target */
+            return Elements(selector.id);
+        }
+        return Elements(null);
+    };
+    page.jQuery.ajax = function() {
+        var promise = {};
+        promise.done = promise.fail = function() { return promise; };
+        return promise;
+    };
+
+    page.trigger = function(type, targetId) {
+        /* dispatch an event to the handlers bound on the lists that contain the target, innermost first */
+        var listBindings = page.handlers.filter(function(binding) {
+            var listPrefix = binding.id ? binding.id.replace(/-list$/, '') : null;
+            return binding.id != listPrefix && targetId.substr(0, listPrefix.length + 1) == listPrefix + '-' &&
+                binding.events.indexOf(type) != -1;
+        });
+        listBindings.sort(function(a, b) { return b.id.length - a.id.length; });
+        listBindings.forEach(function(binding) {
+            binding.handler({'type': type, 'target': {'id': targetId}});
+        });
+    };
+    page.submit = function() {
+        /* call the submit handlers bound on the form (the one element without an id) */
+        page.handlers.forEach(function(binding) {
+            if (binding.id === null && binding.events.indexOf('submit') != -1) binding.handler({'type': 'submit'});
+        });
+    };
+
+    page.run = function(scripts) {
+        var context = vm.createContext({'jQuery': page.jQuery});
+        context.window = context;
+        scripts.forEach(function(script) {
+            vm.runInContext(fs.readFileSync(path.join(SCRIPTS_DIR, script), 'utf8'), context, {'filename': script});
+        });
+        return context;
+    };
+
+    return page;
+}
+
+function streamPage(memberCount, lazy) {
+    /* set up a stream with 'memberCount' members, whose child blocks each bind a handler when initialised */
+    var fieldValues = {'page-count': String(memberCount)};
+    for (var i = 0; i < memberCount; i++) {
+        fieldValues['page-' + i + '-order'] = String(i);
+        fieldValues['page-' + i + '-type'] = i % 2 ? 'paragraph' : 'heading';
+    }
+    var page = Page(fieldValues);
+    var window = page.run(['sequence.js', 'stream.js']);
+
+    page.initializedMembers = [];
+    function childInitializer(prefix) {
+        page.initializedMembers.push(prefix);
+        page.jQuery('#' + prefix).on('change', function() {});
+    }
+    window.StreamBlock({
+        'definitionPrefix': 'blockdef-1',
+        'childBlocks': [
+            {'name': 'heading', 'initializer': childInitializer},
+            {'name': 'paragraph', 'initializer': childInitializer}
+        ],
+        'lazy': lazy
+    })('page');
+    return page;
+}
+
+function listPage(memberCount, lazy) {
+    var fieldValues = {'page-count': String(memberCount)};
+    for (var i = 0; i < memberCount; i++) {
+        fieldValues['page-' + i + '-order'] = String(i);
+    }
+    var page = Page(fieldValues);
+    var window = page.run(['sequence.js', 'list.js']);
+    window.ListBlock({'definitionPrefix': 'blockdef-2', 'lazy': lazy})('page');
+    return page;
+}
+
+function nestedListPage() {
+    /* a delta-submitted list of 3 members, each a list of 2 tags; all from the stored value */
+    var fieldValues = {'page-count': '3'};
+    for (var i = 0; i < 3; i++) {
+        fieldValues['page-' + i + '-order'] = String(i);
+        fieldValues['page-' + i + '-id'] = String(i);
+        fieldValues['page-' + i + '-value-count'] = '2';
+        for (var j = 0; j < 2; j++) {
+            fieldValues['page-' + i + '-value-' + j + '-order'] = String(j);
+            fieldValues['page-' + i + '-value-' + j + '-id'] = String(j);
+        }
+    }
+    var page = Page(fieldValues, true);
+    var window = page.run(['sequence.js', 'list.js']);
+    var tagsInitializer = window.ListBlock({'definitionPrefix': 'blockdef-3'});
+    window.ListBlock({'definitionPrefix': 'blockdef-4', 'childInitializer': tagsInitializer})('page');
+    return page;
+}
+
+var failures = 0;
+function check(condition, description) {
+    console.log((condition ? 'ok      ' : 'FAILED  ') + description);
+    if (!condition) failures++;
+}
+
+var small = streamPage(10, false), large = streamPage(1000, false);
+console.log('stream handlers on load: ' + small.handlers.length + ' for 10 members, ' +
+    large.handlers.length + ' for 1000 members');
+check(large.initializedMembers.length == 1000, 'all members of a stream are initialised on load');
+check(large.handlers.length - small.handlers.length == 990,
+    'a stream binds no handlers per member, besides those of its child blocks');
+
+small = streamPage(10, true);
+large = streamPage(1000, true);
+console.log('lazy stream handlers on load: ' + small.handlers.length + ' for 10 members, ' +
+    large.handlers.length + ' for 1000 members');
+check(large.handlers.length == small.handlers.length, 'a lazy stream binds the same handlers for any length');
+check(large.initializedMembers.length === 0, 'no members of a lazy stream are initialised on load');
+
+large.trigger('focusin', 'page-5-value');
+large.trigger('mouseover', 'page-5-value');
+check(large.initializedMembers.join() == 'page-5-value', 'a lazy stream member is initialised once, on first use');
+
+large.trigger('click', 'page-7-delete');
+check(large.fieldValues['page-7-deleted'] == '1', 'delete buttons are handled by the stream');
+check(large.fieldValues['page-8-order'] == '7', 'members after a deleted member are renumbered');
+large.trigger('click', 'page-7-delete');
+check(large.fieldValues['page-8-order'] == '7', 'deleted members are not deleted again');
+
+small = listPage(10, true);
+large = listPage(1000, true);
+console.log('lazy list handlers on load: ' + small.handlers.length + ' for 10 members, ' +
+    large.handlers.length + ' for 1000 members');
+check(large.handlers.length == small.handlers.length, 'a lazy list binds the same handlers for any length');
+large.trigger('click', 'page-0-delete');
+check(large.fieldValues['page-0-deleted'] == '1', 'delete buttons are handled by the list');
+
+var nested = nestedListPage();
+nested.trigger('click', 'page-1-value-0-delete');
+nested.submit();
+check(nested.fieldValues['page-1-value-members'] == 's1', 'a nested deletion is submitted as a delta');
+check(nested.fieldValues['page-members'] == 's0,m1,s2',
+    'the member containing a nested deletion is submitted as changed');
+check(nested.disabled['page-2-container'] && !nested.disabled['page-1-container'],
+    'only the fields of unchanged members are disabled');
+
+process.exit(failures ? 1 : 0);
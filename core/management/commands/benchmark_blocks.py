@@ -0,0 +1,72 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import run_benchmarks, compare_results
+
+
+def int_list(value):
+    return [int(item) for item in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run benchmarks for the core.blocks pipeline, optionally saving the results as JSON or comparing against "
+        "a previous run"
+    )
+
+    option_list = BaseCommand.option_list + (
+        make_option('--lengths', dest='lengths', default='10,100,1000,10000',
+            help="Comma-separated list of stream lengths to benchmark"),
+        make_option('--depths', dest='depths', default='1,2',
+            help="Comma-separated list of nesting depths to benchmark"),
+        make_option('--child-types', dest='child_types', default='2,8',
+            help="Comma-separated list of numbers of child block types to benchmark"),
+        make_option('--repeat', type='int', dest='repeat', default=3,
+            help="Number of times to run each phase; the fastest time is reported"),
+        make_option('--members', type='int', dest='members', default=10000,
+            help="Number of stream members to use for the memory benchmark; 0 to skip it"),
+        make_option('--output', dest='output',
+            help="File to write the results to, as JSON"),
+        make_option('--compare', dest='compare',
+            help="JSON results file from a previous run to compare against"),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+
+        def progress(length, depth, child_types):
+            if verbosity > 1:
+                self.stdout.write("Running length=%d depth=%d child_types=%d" % (length, depth, child_types))
+
+        results = run_benchmarks(
+            lengths=int_list(options['lengths']), depths=int_list(options['depths']),
+            child_types=int_list(options['child_types']), repeat=options['repeat'],
+            memory_member_count=options['members'], progress=progress
+        )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self.stdout.write("%-22s %6s %5s %5s %12s %12s %7s" % (
+                'phase', 'length', 'depth', 'types', 'baseline (s)', 'current (s)', 'ratio'))
+            for result, baseline_seconds, seconds, ratio in compare_results(baseline, results):
+                self.stdout.write("%-22s %6d %5d %5d %12.4f %12.4f %7s" % (
+                    result['phase'], result['length'], result['depth'], result['child_types'],
+                    baseline_seconds, seconds, '%.2f' % ratio if ratio is not None else '-'))
+        else:
+            self.stdout.write("%-22s %6s %5s %5s %12s" % ('phase', 'length', 'depth', 'types', 'time (s)'))
+            for result in results['results']:
+                self.stdout.write("%-22s %6d %5d %5d %12.4f" % (
+                    result['phase'], result['length'], result['depth'], result['child_types'], result['seconds']))
+
+        memory = results['memory']
+        if memory:
+            self.stdout.write("Memory overhead per member (%d members):" % memory['member_count'])
+            for name in ('stream_value_bytes_per_member', 'bound_block_bytes_per_member'):
+                self.stdout.write("  %s: %.1f -> %.1f bytes" % (name, memory[name]['before'], memory[name]['after']))
@@ -0,0 +1,66 @@
+from optparse import make_option
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk_validation import stream_fields, validate_field
+
+
+class Command(BaseCommand):
+    args = '[app_label.ModelName.field_name ...]'
+    help = "Validate stored StreamField values against the current block definitions, reporting the rows and block paths that fail"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+            help="Number of rows to fetch and validate per batch"),
+        make_option('--processes', type='int', dest='processes', default=None,
+            help="Number of worker processes to validate in; defaults to the number of CPUs"),
+    )
+
+    def get_fields(self, labels):
+        if not labels:
+            return stream_fields()
+
+        fields = []
+        for label in labels:
+            try:
+                app_label, model_name, field_name = label.split('.')
+                model = apps.get_model(app_label, model_name)
+                model._meta.get_field(field_name)
+            except (ValueError, LookupError) as e:
+                raise CommandError("Invalid field '%s': %s" % (label, e))
+            fields.append((model, field_name))
+        return fields
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        total_failed = 0
+
+        for model, field_name in self.get_fields(args):
+            label = '%s.%s.%s' % (model._meta.app_label, model._meta.object_name, field_name)
+            stats = {}
+
+            def progress(batch_stats):
+                stats.update(batch_stats)
+                if verbosity > 1:
+                    self.stdout.write("%s: %d rows scanned" % (label, batch_stats['scanned']))
+
+            failures = validate_field(
+                model, field_name, batch_size=options['batch_size'], processes=options['processes'],
+                progress=progress
+            )
+            for pk, errors in failures:
+                for path, messages in errors:
+                    self.stdout.write("%s %s %s: %s" % (
+                        label, pk, '.'.join(str(key) for key in path) or '-', ' '.join(messages)))
+
+            if stats:
+                rate = stats['scanned'] / stats['seconds'] if stats['seconds'] else 0
+                self.stdout.write("%s: %d rows, %d failed, %.1fs (%.0f rows/s)" % (
+                    label, stats['scanned'], stats['failed'], stats['seconds'], rate))
+                total_failed += stats['failed']
+            else:
+                self.stdout.write("%s: no rows" % label)
+
+        if total_failed:
+            raise CommandError("%d rows failed validation" % total_failed)
@@ -0,0 +1,312 @@
+"""
+Always-on metrics for block processing in production: for a sample of requests, record the number of
+list / stream members handled (in the busiest phase) and the nesting depth of the block definitions
+handled, the number of bytes in the response, and the time spent in each phase of block processing, into
+in-process histograms that are periodically passed to an exporter.
+
+Configured through the BLOCK_METRICS setting:
+
+    BLOCK_METRICS = {
+        'SAMPLE_RATE': 0.01,  # fraction of requests to measure
+        'EXPORT_INTERVAL': 60,  # minimum number of seconds between exports
+        'EXPORTER': 'core.metrics.LogExporter',  # import path of the MetricsExporter subclass to use
+        'OPTIONS': {},  # keyword arguments for the exporter
+    }
+
+and enabled by core.middleware.BlockMetricsMiddleware. If BLOCK_METRICS is not set (or None), the middleware
+removes itself, and the entry points decorated with metered() cost one thread-local lookup per call.
+
+Phases are timed at the outermost decorated call only: a clean of a whole page counts once, not once per
+nested block. Values are never walked for the sake of measurement: list and stream blocks report the
+member counts that they already have in hand (through count_members), so members that are never
+processed - such as those of a lazily converted value that the template doesn't output - aren't counted,
+and depth comes from the block definition. Unsampled requests do no recording at all.
+"""
+import bisect
+import functools
+import json
+import logging
+import threading
+import time
+import timeit
+
+from django.conf import settings
+from django.test.signals import setting_changed
+from django.utils.module_loading import import_string
+
+
+def exponential_bounds(start, factor, count):
+    return [start * factor ** i for i in range(count)]
+
+# upper bounds of the histogram buckets for each kind of metric
+LATENCY_BOUNDS = exponential_bounds(0.0001, 2, 18)  # 0.1ms to ~13s
+COUNT_BOUNDS = exponential_bounds(1, 2, 18)  # 1 to 131072
+BYTES_BOUNDS = exponential_bounds(1024, 2, 16)  # 1KB to 32MB
+
+
+class Histogram(object):
+    """
+    A histogram of observed values, counted into buckets with the given upper bounds (plus an overflow
+    bucket for values above the last bound)
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = None
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        bucket = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[bucket] += 1
+            self.count += 1
+            self.total += value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket containing the given percentile (as a fraction), or None if empty"""
+        if not self.count:
+            return None
+        threshold = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= threshold:
+                return bound
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'buckets': [
+                [bound, count] for (bound, count) in zip(self.bounds + [None], self.counts) if count
+            ],
+        }
+
+
+class MetricsRegistry(object):
+    """The set of histograms recorded by this process, along with the exporter to pass them to"""
+    def __init__(self, sample_rate=0.01, export_interval=60, exporter=None):
+        self.sample_rate = sample_rate
+        self.export_interval = export_interval
+        self.exporter = exporter
+        self.histograms = {}
+        self.last_export = time.time()
+        self._lock = threading.Lock()
+
+    def histogram(self, name, bounds):
+        try:
+            return self.histograms[name]
+        except KeyError:
+            with self._lock:
+                return self.histograms.setdefault(name, Histogram(bounds))
+
+    def observe(self, name, value, bounds):
+        self.histogram(name, bounds).observe(value)
+
+    def snapshot(self, reset=False):
+        """Return the current state of all histograms as a JSON-serialisable dict, optionally starting new ones"""
+        with self._lock:
+            histograms = self.histograms
+            if reset:
+                self.histograms = {}
+        return dict((name, histogram.snapshot()) for name, histogram in histograms.items())
+
+    def export_if_due(self):
+        """Pass the histograms recorded since the last export to the exporter, if EXPORT_INTERVAL has elapsed"""
+        now = time.time()
+        if self.exporter is None or now - self.last_export < self.export_interval:
+            return
+        with self._lock:
+            if now - self.last_export < self.export_interval:
+                return  # another thread got there first
+            self.last_export = now
+        self.exporter.export(self.snapshot(reset=True))
+
+
+class MetricsExporter(object):
+    """Base class for exporters, which receive snapshots of the histograms from MetricsRegistry.snapshot"""
+    def export(self, snapshot):
+        raise NotImplementedError('%s.export' % self.__class__)
+
+
+class LogExporter(MetricsExporter):
+    """Writes each snapshot as a JSON log message"""
+    def __init__(self, logger='core.metrics', level=logging.INFO):
+        self.logger = logging.getLogger(logger)
+        self.level = level
+
+    def export(self, snapshot):
+        self.logger.log(self.level, "block metrics: %s", json.dumps(snapshot, sort_keys=True))
+
+
+class FileExporter(MetricsExporter):
+    """Appends each snapshot to the file at 'path', as one line of JSON"""
+    def __init__(self, path):
+        self.path = path
+
+    def export(self, snapshot):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps({'time': time.time(), 'metrics': snapshot}, sort_keys=True) + '\n')
+
+
+_registry = None
+
+
+def get_metrics_registry():
+    """
+    Return the MetricsRegistry configured by the BLOCK_METRICS setting, or None if metrics are disabled
+    """
+    global _registry
+    if _registry is None:
+        config = getattr(settings, 'BLOCK_METRICS', None)
+        if config is None:
+            return None
+        exporter_class = import_string(config.get('EXPORTER', 'core.metrics.LogExporter'))
+        _registry = MetricsRegistry(
+            sample_rate=config.get('SAMPLE_RATE', 0.01),
+            export_interval=config.get('EXPORT_INTERVAL', 60),
+            exporter=exporter_class(**config.get('OPTIONS', {})),
+        )
+    return _registry
+
+
+def reset_metrics_registry(**kwargs):
+    global _registry
+    if kwargs.get('setting', 'BLOCK_METRICS') == 'BLOCK_METRICS':
+        _registry = None
+
+setting_changed.connect(reset_metrics_registry)
+
+
+class RequestMetrics(object):
+    """The measurements taken for one sampled request"""
+    def __init__(self, registry):
+        self.registry = registry
+        self.start_time = timeit.default_timer()
+        self.phase_times = {}
+        self.phase_members = {}
+        self.depth = 0
+        # the phase of the outermost metered call in progress, if any
+        self.phase = None
+
+    def record_phase(self, phase, elapsed):
+        self.phase_times[phase] = self.phase_times.get(phase, 0) + elapsed
+
+    def count_members(self, count):
+        self.phase_members[self.phase] = self.phase_members.get(self.phase, 0) + count
+
+    def record_depth(self, block):
+        self.depth = max(self.depth, block.nesting_depth())
+
+    @property
+    def members(self):
+        """The largest number of list / stream members handled in any one phase"""
+        return max(self.phase_members.values()) if self.phase_members else 0
+
+    def finish(self, response_bytes):
+        registry = self.registry
+        registry.observe('request_seconds', timeit.default_timer() - self.start_time, LATENCY_BOUNDS)
+        for phase, elapsed in self.phase_times.items():
+            registry.observe('phase_seconds.%s' % phase, elapsed, LATENCY_BOUNDS)
+        if self.members:
+            registry.observe('members', self.members, COUNT_BOUNDS)
+        if self.depth:
+            registry.observe('depth', self.depth, COUNT_BOUNDS)
+        if response_bytes is not None:
+            registry.observe('bytes_rendered', response_bytes, BYTES_BOUNDS)
+        registry.export_if_due()
+
+
+_state = threading.local()
+
+
+def active_metrics():
+    """Return the RequestMetrics for the sampled request being processed by this thread, if any"""
+    return getattr(_state, 'metrics', None)
+
+
+def activate_metrics(metrics):
+    _state.metrics = metrics
+
+
+def count_members(count):
+    """
+    Called by list and stream blocks with the number of members they are handling (as already known to
+    them), to be counted towards the current phase of a sampled request
+    """
+    metrics = getattr(_state, 'metrics', None)
+    if metrics is not None:
+        metrics.count_members(count)
+
+
+def this_block(block):
+    return block
+
+
+def metered(phase, get_block=None):
+    """
+    Decorator for the entry-point methods of blocks: times the outermost call within a sampled request as
+    'phase', and if 'get_block' is given - a function taking 'self' and returning the block definition being
+    processed - records the nesting depth of that definition
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            metrics = getattr(_state, 'metrics', None)
+            if metrics is None or metrics.phase is not None:
+                return func(self, *args, **kwargs)
+
+            metrics.phase = phase
+            start = timeit.default_timer()
+            try:
+                result = func(self, *args, **kwargs)
+            finally:
+                metrics.phase = None
+            metrics.record_phase(phase, timeit.default_timer() - start)
+
+            if get_block is not None:
+                metrics.record_depth(get_block(self))
+            return result
+        return wrapper
+    return decorator
+
+
+def metered_chunks(phase):
+    """
+    Decorator for functions and methods that return an iterable of rendered chunks, such as the generators
+    behind streaming responses: times the production of each chunk within a sampled request as 'phase',
+    excluding any time that the caller spends between chunks
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            iterator = iter(func(*args, **kwargs))
+            while True:
+                metrics = getattr(_state, 'metrics', None)
+                if metrics is None or metrics.phase is not None:
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        break
+                else:
+                    metrics.phase = phase
+                    start = timeit.default_timer()
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        break
+                    finally:
+                        metrics.phase = None
+                        metrics.record_phase(phase, timeit.default_timer() - start)
+                yield chunk
+        return wrapper
+    return decorator
@@ -0,0 +1,56 @@
+import random
+
+from django.core.exceptions import MiddlewareNotUsed
+
+from core.metrics import get_metrics_registry, RequestMetrics, activate_metrics, active_metrics
+
+
+def counted_content(content, metrics):
+    """
+    Wrap the streaming content of a response so that the request's metrics remain active while it is
+    rendered, and are recorded once it has been fully sent
+    """
+    size = 0
+    iterator = iter(content)
+    try:
+        while True:
+            activate_metrics(metrics)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                activate_metrics(None)
+            size += len(chunk)
+            yield chunk
+    finally:
+        metrics.finish(size)
+
+
+class BlockMetricsMiddleware(object):
+    """
+    Records block metrics (see core.metrics) for a random sample of requests, as configured by the
+    BLOCK_METRICS setting
+    """
+    def __init__(self):
+        if get_metrics_registry() is None:
+            raise MiddlewareNotUsed
+
+    def process_request(self, request):
+        registry = get_metrics_registry()
+        if registry is not None and random.random() < registry.sample_rate:
+            activate_metrics(RequestMetrics(registry))
+        else:
+            activate_metrics(None)
+
+    def process_response(self, request, response):
+        metrics = active_metrics()
+        if metrics is None:
+            return response
+        activate_metrics(None)
+
+        if response.streaming:
+            response.streaming_content = counted_content(response.streaming_content, metrics)
+        else:
+            metrics.finish(len(response.content))
+        return response
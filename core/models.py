@@ -1,3 +1,10 @@
 from django.db import models
 
-# Create your models here.
+
+class ValueMigrationCheckpoint(models.Model):
+    """
+    The progress of a value migration (see core.value_migrations.DatabaseCheckpoint): the last primary key
+    processed, as JSON
+    """
+    name = models.CharField(max_length=255, unique=True)
+    last_pk = models.TextField()
@@ -0,0 +1,40 @@
+"""
+django-debug-toolbar panel showing where time is spent in block methods. To use it, add
+'core.panels.BlockTimingPanel' to DEBUG_TOOLBAR_PANELS.
+"""
+from django.utils.translation import ugettext_lazy as _
+
+from debug_toolbar.panels import Panel
+
+from core.instrumentation import start_recording, stop_recording
+
+
+class BlockTimingPanel(Panel):
+    title = _("Blocks")
+    template = 'core/debug_toolbar/block_timings.html'
+
+    def __init__(self, *args, **kwargs):
+        super(BlockTimingPanel, self).__init__(*args, **kwargs)
+        self.timings = None
+
+    @property
+    def nav_subtitle(self):
+        if self.timings is None:
+            return ''
+        return _("%(time).2fms in blocks") % {'time': self.timings.total_time * 1000}
+
+    def enable_instrumentation(self):
+        self.timings = start_recording()
+
+    def disable_instrumentation(self):
+        stop_recording()
+
+    def process_response(self, request, response):
+        results = self.timings.results() if self.timings else []
+        for result in results:
+            result['cumulative_ms'] = result['cumulative_time'] * 1000
+            result['self_ms'] = result['self_time'] * 1000
+        self.record_stats({
+            'timings': results,
+            'total_ms': self.timings.total_time * 1000 if self.timings else 0,
+        })
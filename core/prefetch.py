@@ -0,0 +1,100 @@
+"""
+Bulk resolution of the objects referenced by a block value (e.g. the IDs stored by chooser blocks),
+so that rendering a value tree costs one query per referenced model rather than one per reference.
+
+When a container block's renderable() is called outside of any prefetch context, it makes a
+PrefetchedObjects for the value available to the renderable() methods of the blocks within it through
+active_prefetch(). Renderable containers hold on to it, so that children converted lazily at template
+rendering time still see it.
+
+Nothing is walked or fetched up front: the first time an object of a given model is asked for, the whole
+value is walked via Block.collect_references (once), and the referenced objects of that model are fetched
+in a single query. Rendering that never reaches a reference - because the template doesn't output that
+part of the value, or its fragment comes from the fragment cache - costs no walk and no query.
+"""
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class PrefetchedObjects(object):
+    """
+    The objects referenced by a value, fetched in bulk. If 'block' and 'value' are given, the references in
+    'value' (as a value of 'block') are collected on first use, and the objects of each of the block's
+    referenced models are fetched on first use of that model; otherwise references are registered with add()
+    and fetched with resolve().
+    """
+    def __init__(self, block=None, value=None):
+        self.ids = defaultdict(set)
+        self.objects = {}
+        self.models = block.referenced_models() if block is not None else frozenset()
+        self._uncollected = [(block, value)] if block is not None else []
+
+    def add(self, model, pk):
+        """Register a reference to the 'model' instance with primary key 'pk'"""
+        self.ids[model].add(model._meta.pk.to_python(pk))
+
+    def collect(self):
+        """Register the references in the value passed to the constructor, if not done already"""
+        while self._uncollected:
+            block, value = self._uncollected.pop()
+            block.collect_references(value, self)
+
+    def resolve(self, models=None):
+        """Fetch all registered objects (or those of the given models), with one query per model"""
+        self.collect()
+        if models is None:
+            models = set(self.models) | set(self.ids)
+        for model in models:
+            if model not in self.objects:
+                ids = self.ids.get(model)
+                self.objects[model] = model._default_manager.in_bulk(list(ids)) if ids else {}
+
+    def is_resolved(self, model):
+        return model in self.objects
+
+    def covers(self, model):
+        """Whether references to 'model' are looked up through this object (now or on demand)"""
+        return model in self.models or model in self.objects
+
+    def get(self, model, pk):
+        """Return the prefetched 'model' instance with primary key 'pk', or None if it doesn't exist"""
+        if model not in self.objects:
+            self.resolve([model])
+        return self.objects[model].get(model._meta.pk.to_python(pk))
+
+
+_state = threading.local()
+
+
+def active_prefetch():
+    """Return the PrefetchedObjects for the value currently being made renderable, if any"""
+    return getattr(_state, 'prefetched', None)
+
+
+@contextmanager
+def activate_prefetch(prefetched):
+    """Make 'prefetched' the active PrefetchedObjects within this context"""
+    previous = active_prefetch()
+    _state.prefetched = prefetched
+    try:
+        yield prefetched
+    finally:
+        _state.prefetched = previous
+
+
+@contextmanager
+def prefetch_references(block, value):
+    """
+    Within this context, the objects referenced by 'value' (as a value of 'block') are available through
+    active_prefetch(), to be fetched on demand. If there is already an active prefetch - i.e. 'value' is part
+    of a larger value that has been prefetched - or the block definition contains no references, this does
+    nothing.
+    """
+    if active_prefetch() is not None or not block.referenced_models():
+        yield active_prefetch()
+        return
+
+    prefetched = PrefetchedObjects(block, value)
+    with activate_prefetch(prefetched):
+        yield prefetched
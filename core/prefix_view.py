@@ -0,0 +1,97 @@
+"""
+Views of submitted form data by prefix, for use by Block.value_from_prefix_view.
+
+Block form fields are named by joining the prefixes of the nested blocks with '-' (e.g.
+'page-content-3-value-name'). A PrefixView represents the subtree of the submitted data under
+one such prefix, so that container blocks can hand each child its own node rather than formatting
+field names and probing the data themselves.
+
+These are views rather than an up-front index of the data: building a tree of the submitted keys in one
+pass was measured at 1.3x (flat streams) to 2.8x (three levels of nesting) the time of reading the same
+values through views, as indexing has to split every key - including those no block reads - while a view
+formats one string and does one hash lookup per value read. Values are read from the underlying dict
+directly, bypassing the per-lookup overhead of MultiValueDict.__getitem__.
+
+All views derived from one PrefixView.build call share a MemberBudget, limiting the total number of list /
+stream members that will be read from the submission (across all blocks within it, and including deleted
+members) to the BLOCK_MAX_SUBMITTED_MEMBERS setting, if set.
+
+A node may also carry the stored value (if known) of the block it is read by - i.e. the value that the form
+was originally rendered from - so that list / stream members that were never loaded into a windowed editing
+form can be restored from it.
+"""
+from django.conf import settings
+from django.utils.datastructures import MultiValueDict
+
+
+class MemberBudget(object):
+    """The number of list / stream members that may still be read from a submission (None for no limit)"""
+    __slots__ = ['remaining']
+
+    def __init__(self, remaining=None):
+        self.remaining = remaining
+
+    def consume(self, count):
+        """Use up 'count' members of the budget; return False (using none) if there are not enough left"""
+        if self.remaining is None:
+            return True
+        if count > self.remaining:
+            return False
+        self.remaining -= count
+        return True
+
+
+class PrefixView(object):
+    __slots__ = ['data', 'prefix', 'multivalued', 'budget', 'stored']
+
+    def __init__(self, data, prefix, multivalued=None, budget=None, stored=None):
+        self.data = data
+        self.prefix = prefix
+        if multivalued is None:
+            multivalued = isinstance(data, MultiValueDict)
+        self.multivalued = multivalued
+        self.budget = budget if budget is not None else MemberBudget()
+        self.stored = stored
+
+    @classmethod
+    def build(cls, data, prefix, stored=None):
+        """
+        Return the node for 'prefix' in the submitted data 'data', with 'stored' as its stored value
+        """
+        return cls(
+            data, prefix, budget=MemberBudget(getattr(settings, 'BLOCK_MAX_SUBMITTED_MEMBERS', None)), stored=stored
+        )
+
+    def child(self, part, stored=None):
+        """
+        Return the node for the subtree named 'part' (a field name component, or the integer index of a list /
+        stream member) under this one, with 'stored' as its stored value
+        """
+        return PrefixView(self.data, '%s-%s' % (self.prefix, part), self.multivalued, self.budget, stored)
+
+    def _lookup(self, key):
+        if self.multivalued:
+            # as per MultiValueDict.__getitem__, the value for a key is the last item in its list
+            values = dict.__getitem__(self.data, key)
+            return values[-1] if values else []
+        return self.data[key]
+
+    @property
+    def value(self):
+        """The submitted value for this node's prefix; raises KeyError if there is none"""
+        return self._lookup(self.prefix)
+
+    def get_value(self, default=None):
+        if self.multivalued:
+            values = dict.get(self.data, self.prefix)
+            if values is None:
+                return default
+            return values[-1] if values else []
+        return self.data.get(self.prefix, default)
+
+    def child_value(self, part):
+        """
+        Shortcut for self.child(part).value - the submitted value for a (leaf) child node such as a hidden field.
+        Raises KeyError if there is none.
+        """
+        return self._lookup('%s-%s' % (self.prefix, part))
@@ -0,0 +1,77 @@
+"""
+Resolution of form field prefixes to the parts of a block value that they belong to.
+
+Block forms name their fields by joining the names of the blocks along the path to them with '-': struct
+children by name, and list / stream members by index followed by 'value' (e.g. 'page-content-3-value-name'
+for the 'name' child of the fourth member of the 'content' stream of the 'page' struct). resolve_prefix
+walks such a path through a block definition and a value, so that part of a form can be rendered without
+rendering the rest of it. Resolving a prefix only looks at the blocks and values along its path, so the cost
+of rendering part of a form is proportional to the size of that part rather than of the whole form.
+
+Member indexes are positions in the value that the form was rendered from, so the value passed to
+resolve_prefix must be that same value - e.g. the stored value of the page being edited.
+"""
+from django.core.exceptions import ValidationError
+
+from core.blocks import BaseStructBlock, ListBlock, BaseStreamBlock
+from core.prefix_view import PrefixView
+from core.values import StreamValue
+
+
+def resolve_prefix(block, value, root_prefix, prefix):
+    """
+    Return a (block, value) tuple for the part of 'value' (a value of 'block', rendered in a form with the
+    prefix 'root_prefix') that is rendered with the prefix 'prefix'. Raises LookupError if there is no such part.
+    """
+    if prefix == root_prefix:
+        return block, value
+    if not prefix.startswith(root_prefix + '-'):
+        raise LookupError("%s is not within %s" % (prefix, root_prefix))
+
+    path = prefix[len(root_prefix) + 1:].split('-')
+    try:
+        while path:
+            if isinstance(block, BaseStructBlock):
+                name = path.pop(0)
+                block = block.child_blocks[name]
+                value = value.get(name, block.default)
+
+            elif isinstance(block, (ListBlock, BaseStreamBlock)):
+                index = int(path.pop(0))
+                if index < 0 or path[:1] != ['value']:
+                    raise LookupError
+                path.pop(0)
+
+                if isinstance(block, ListBlock):
+                    block, value = block.child_block, value[index]
+                elif isinstance(value, StreamValue):
+                    block, value = block.child_blocks[value.get_block_type(index)], value.values[index]
+                else:
+                    block, value = block.child_blocks[value[index]['type']], value[index]['value']
+
+            else:
+                raise LookupError
+    except (LookupError, ValueError, TypeError, AttributeError):
+        raise LookupError("%s does not identify a block within %s" % (prefix, root_prefix))
+
+    return block, value
+
+
+def render_subtree_form(block, value, root_prefix, prefix, data=None, files=None):
+    """
+    Return the form HTML (as returned by render_form) for the part of 'value' that is rendered with the prefix
+    'prefix', as per resolve_prefix. If 'data' is given, it is submitted form data containing that part of
+    the form: the part's value is read from it instead (with the value resolved from 'value' as the stored
+    value), validated, and rendered along with any errors.
+    """
+    block, value = resolve_prefix(block, value, root_prefix, prefix)
+
+    error = None
+    if data is not None:
+        value = block.value_from_prefix_view(PrefixView.build(data, prefix, value), files or {})
+        try:
+            block.clean(value)
+        except ValidationError as e:
+            error = e
+
+    return block.render_form(value, prefix, error, from_stored=data is None)
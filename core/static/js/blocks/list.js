@@ -3,28 +3,33 @@
         /* contents of 'opts':
             definitionPrefix (required)
             childInitializer (optional) - JS initializer function for each child
+            lazy (optional) - if true, initialise members on first use rather than on page load
         */
-        var listMemberTemplate = $('#' + opts.definitionPrefix + '-newmember').text();
+        /* URL of the HTML template to be used when adding a new list member */
+        var newMemberUrl = $('#' + opts.definitionPrefix + '-newmember').data('url');
 
         return function(elementPrefix) {
             var sequence = Sequence({
                 'prefix': elementPrefix,
+                'lazy': opts.lazy,
                 'onInitializeMember': function(sequenceMember) {
                     /* initialize child block's JS behaviour */
                     if (opts.childInitializer) {
                         opts.childInitializer(sequenceMember.prefix + '-value');
                     }
-
-                    /* initialise delete button */
-                    $('#' + sequenceMember.prefix + '-delete').click(function() {
+                },
+                'memberControls': {
+                    'delete': function(sequenceMember) {
                         sequenceMember.delete();
-                    });
+                    }
                 }
             });
 
             /* initialize 'add' button */
             $('#' + elementPrefix + '-add').click(function() {
-                sequence.insertMemberAtEnd(listMemberTemplate);
+                fetchMemberTemplate(newMemberUrl).done(function(template) {
+                    sequence.insertMemberAtEnd(template);
+                });
             });
         };
     };
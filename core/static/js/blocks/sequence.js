@@ -3,14 +3,55 @@ These assume the presence of a container element named "{prefix}-container" for
 certain hidden fields such as "{prefix}-deleted" as defined in sequence_member.html, but make no assumptions
 about layout or visible controls within the block. 
 For example, they don't assume the presence of a 'delete' button - it's up to the specific subclass
-(list.js / stream.js) to attach this to the SequenceMember.delete method.
+(list.js / stream.js) to attach this to the SequenceMember.delete method, by passing it in opts.memberControls:
+a lookup of functions to be called with the member when one of its controls is clicked, by the control's id
+minus the member's prefix (e.g. 'delete' for "{prefix}-delete").
+
+Events within the members are handled by a single handler on the "{prefix}-list" element, rather than by
+handlers on each member. With opts.lazy set, members present when the page is loaded are not initialised (by
+opts.onInitializeMember) until they are first focused, hovered or touched - so the cost of setting up the
+form doesn't grow with the number of members.
+
+Members of a windowed list / stream beyond its window are rendered as placeholders (with the class
+'unloaded-member'), which are replaced by the real member forms - fetched a page at a time from the URL
+given by the data-block-members-url attribute of an enclosing element - as they are scrolled into view.
+Requests for members carry the version of the stored value in the "{prefix}-version" field; if the stored
+value has changed since the form was rendered, the server responds with 409 Conflict, and no more members
+are loaded (and submitting the form will fail with an error asking for the page to be reloaded).
+
+Within a form with the data-block-delta-submissions attribute, only the members that have been added or
+changed are submitted: on submit, the fields of unchanged and deleted members are disabled, and a
+"{prefix}-members" field lists the members of the new value in order - 's<N>' for the unchanged member N of
+the stored value (as given by the member's "{prefix}-id" or "{prefix}-stored" field), 'm<K>' for the
+member whose fields are submitted under "{prefix}-K". The server rebuilds the value from the stored one.
+A member counts as changed when a 'change' or 'input' event occurs within it: a sequence nested within a
+member triggers 'change' on its count field whenever a member is inserted or deleted, and scripts that set
+field values with .val() (which fires no events) must trigger 'change' themselves.
 */
 (function($) {
+    /* HTML templates for new sequence members, as served by the new_member_template view, are fetched the
+    first time they are needed and memoised here by URL. fetchMemberTemplate returns a promise of the HTML.
+    */
+    var memberTemplates = {};
+    window.fetchMemberTemplate = function(url) {
+        if (!memberTemplates[url]) {
+            memberTemplates[url] = $.ajax({'url': url, 'dataType': 'text'}).fail(function() {
+                /* allow the request to be retried */
+                delete memberTemplates[url];
+            });
+        }
+        return memberTemplates[url];
+    };
+
     window.SequenceMember = function(sequence, prefix) {
         var self = {};
         self.prefix = prefix;
         self.container = $('#' + self.prefix + '-container');
+        self.loaded = !self.container.hasClass('unloaded-member');
+        self.initialized = false;
         var indexField = $('#' + self.prefix + '-order');
+        /* whether any of the member's fields has been edited since the form was rendered */
+        self.changed = false;
 
         self.delete = function() {
             sequence.deleteMember(self);
@@ -37,6 +78,21 @@ For example, they don't assume the presence of a 'delete' button - it's up to th
         self.setIndex = function(i) {
             indexField.val(i);
         };
+        self.getStoredIndex = function() {
+            /* the index of this member in the stored value, or '' if it is not from there */
+            var storedField = $('#' + self.prefix + (self.loaded ? '-id' : '-stored'));
+            return storedField.length ? storedField.val() : '';
+        };
+        self.load = function(html) {
+            /* replace the placeholder for an unloaded member with its form HTML, keeping its current position */
+            var index = self.getIndex();
+            var elem = $(html);
+            self.container.replaceWith(elem);
+            self.container = elem;
+            indexField = $('#' + self.prefix + '-order');
+            self.setIndex(index);
+            self.loaded = true;
+        };
 
         return self;
     };
@@ -46,6 +102,7 @@ For example, they don't assume the presence of a 'delete' button - it's up to th
         var countField = $('#' + opts.prefix + '-count');
         /* NB countField includes deleted items; for the count of non-deleted items, use members.length */
         var members = [];
+        var deletedMembers = [];
 
         self.getCount = function() {
             return parseInt(countField.val(), 10);
@@ -57,15 +114,93 @@ For example, they don't assume the presence of a 'delete' button - it's up to th
             countField.val(newIndex + 1);
             return opts.prefix + '-' + newIndex;
         }
-        function postInsertMember(newMember) {
+        function initializeMember(member) {
             /* run any supplied initializer functions */
+            member.initialized = true;
             if (opts.onInitializeMember) {
-                opts.onInitializeMember(newMember);
+                opts.onInitializeMember(member);
             }
+        }
+        function markChanged() {
+            /* mark the member of any enclosing sequence that this sequence is part of as changed */
+            countField.trigger('change');
+        }
+        function postInsertMember(newMember) {
+            membersByContainerId[newMember.prefix + '-container'] = newMember;
+            initializeMember(newMember);
 
             newMember._markAdded();
+            markChanged();
         }
 
+        /* delta submissions */
+        var form = list.closest('form');
+        var deltaSubmissions = form.is('[data-block-delta-submissions]');
+
+        /* event handling for all members */
+        var membersByContainerId = {};
+
+        function memberForElement(elem) {
+            /* the member is the child of the list that contains elem */
+            var ancestors = $(elem).parentsUntil(list);
+            var container = ancestors.length ? ancestors.last() : $(elem);
+            return membersByContainerId[container.attr('id')] || null;
+        }
+
+        function handleMemberEvent(e) {
+            var member = memberForElement(e.target);
+            if (!member || !member.loaded) return;
+
+            if (e.type == 'change' || e.type == 'input') {
+                member.changed = true;
+                return;
+            }
+            if (!member.initialized) {
+                initializeMember(member);
+            }
+            if (e.type == 'click' && opts.memberControls) {
+                var controlId = $(e.target).closest('[id]').attr('id') || '';
+                var memberControlPrefix = member.prefix + '-';
+                if (controlId.substr(0, memberControlPrefix.length) == memberControlPrefix) {
+                    var control = opts.memberControls[controlId.substr(memberControlPrefix.length)];
+                    if (control) control(member);
+                }
+            }
+        }
+
+        function prepareDeltaSubmission() {
+            /* a sequence within an unchanged member of an enclosing sequence is not submitted at all */
+            if (countField.prop('disabled')) return;
+
+            var tokens = [];
+            for (var i = 0; i < members.length; i++) {
+                var member = members[i];
+                var storedIndex = member.getStoredIndex();
+                if (member.changed || storedIndex === '') {
+                    tokens.push('m' + member.prefix.substr(opts.prefix.length + 1));
+                    $('#' + member.prefix + '-order, #' + member.prefix + '-deleted').prop('disabled', true);
+                } else {
+                    tokens.push('s' + storedIndex);
+                    member.container.find(':input').prop('disabled', true);
+                }
+            }
+            for (var j = 0; j < deletedMembers.length; j++) {
+                deletedMembers[j].container.find(':input').prop('disabled', true);
+            }
+            countField.prop('disabled', true);
+            $('<input type="hidden">').attr({'id': opts.prefix + '-members', 'name': opts.prefix + '-members'})
+                .val(tokens.join(',')).insertAfter(countField);
+        }
+
+        if (deltaSubmissions) {
+            /* bound before the members are initialised, so that enclosing sequences are prepared first */
+            form.on('submit', prepareDeltaSubmission);
+        }
+        var memberEvents = 'click';
+        if (opts.lazy) memberEvents += ' focusin mouseover touchstart';
+        if (deltaSubmissions) memberEvents += ' change input';
+        list.on(memberEvents, handleMemberEvent);
+
         self.insertMemberBefore = function(otherMember, template) {
             newMemberPrefix = getNewMemberPrefix();
 
@@ -156,19 +291,79 @@ For example, they don't assume the presence of a 'delete' button - it's up to th
             }
             /* remove from the 'members' list */
             members.splice(index, 1);
+            delete membersByContainerId[member.prefix + '-container'];
+            deletedMembers.push(member);
             member._markDeleted();
+            markChanged();
         };
 
         /* initialize initial list members */
+        var unloadedMembers = [];
         for (var i = 0; i < self.getCount(); i++) {
             var memberPrefix = opts.prefix + '-' + i;
             var sequenceMember = SequenceMember(self, memberPrefix);
             members[i] = sequenceMember;
-            if (opts.onInitializeMember) {
-                opts.onInitializeMember(sequenceMember);
+            membersByContainerId[memberPrefix + '-container'] = sequenceMember;
+            if (!sequenceMember.loaded) {
+                unloadedMembers.push(sequenceMember);
+            } else if (!opts.lazy) {
+                initializeMember(sequenceMember);
             }
         }
 
+        /* load the members of a windowed sequence as they come into view */
+        var membersUrl = list.closest('[data-block-members-url]').data('block-members-url');
+        var loadingMembers = false;
+
+        function loadMembersInView() {
+            if (loadingMembers || !unloadedMembers.length) return;
+            var firstUnloaded = unloadedMembers[0];
+            var viewportBottom = $(window).scrollTop() + $(window).height();
+            if (firstUnloaded.container.offset().top > viewportBottom + 500) return;
+
+            /* unloaded members are numbered consecutively from the first one */
+            var start = parseInt(firstUnloaded.prefix.substr(opts.prefix.length + 1), 10);
+            loadingMembers = true;
+            $.ajax({
+                'url': membersUrl, 'dataType': 'json',
+                'data': {'prefix': opts.prefix, 'start': start, 'version': $('#' + opts.prefix + '-version').val()}
+            }).done(function(response) {
+                if (!response.members.length) {
+                    /* nothing more to load */
+                    unloadedMembers = [];
+                }
+                for (var i = 0; i < response.members.length; i++) {
+                    var memberPrefix = opts.prefix + '-' + response.members[i].index;
+                    for (var j = 0; j < unloadedMembers.length; j++) {
+                        var member = unloadedMembers[j];
+                        if (member.prefix == memberPrefix) {
+                            member.load(response.members[i].html);
+                            if (!opts.lazy) {
+                                initializeMember(member);
+                            }
+                            unloadedMembers.splice(j, 1);
+                            break;
+                        }
+                    }
+                }
+                loadingMembers = false;
+                /* load the next page, if that is in view too */
+                loadMembersInView();
+            }).fail(function(xhr) {
+                if (xhr.status == 409) {
+                    /* the stored value has changed, so the remaining placeholders can't be loaded */
+                    unloadedMembers = [];
+                }
+                /* otherwise, try again on the next scroll */
+                loadingMembers = false;
+            });
+        }
+
+        if (unloadedMembers.length && membersUrl) {
+            $(window).on('scroll resize', loadMembersInView);
+            loadMembersInView();
+        }
+
         return self;
     };
 })(jQuery);
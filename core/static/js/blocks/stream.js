@@ -1,20 +1,37 @@
 (function($) {
     window.StreamBlock = function(opts) {
-        /* Fetch the HTML template strings to be used when adding a new block of each type.
-        Also reorganise the opts.childBlocks list into a lookup by name
+        /* Look up the URLs of the HTML templates to be used when adding a new block of each type
+        (which are fetched when first needed). Also reorganise the opts.childBlocks list into a lookup by name
         */
-        var listMemberTemplates = {};
+        var newMemberUrls = {};
         var childBlocksByName = {};
         for (var i = 0; i < opts.childBlocks.length; i++) {
             var childBlock = opts.childBlocks[i];
             childBlocksByName[childBlock.name] = childBlock;
-            var template = $('#' + opts.definitionPrefix + '-newmember-' + childBlock.name).text();
-            listMemberTemplates[childBlock.name] = template;
+            newMemberUrls[childBlock.name] = $('#' + opts.definitionPrefix + '-newmember-' + childBlock.name).data('url');
+        }
+
+        /* the controls of each member: a delete button, and an 'append new block' button for each block type */
+        var memberControls = {
+            'delete': function(sequenceMember) {
+                sequenceMember.delete();
+            }
+        };
+        function addAppendControl(childBlock) {
+            memberControls['add-' + childBlock.name] = function(sequenceMember) {
+                fetchMemberTemplate(newMemberUrls[childBlock.name]).done(function(template) {
+                    sequenceMember.appendMember(template);
+                });
+            };
+        }
+        for (var i = 0; i < opts.childBlocks.length; i++) {
+            addAppendControl(opts.childBlocks[i]);
         }
 
         return function(elementPrefix) {
             var sequence = Sequence({
                 'prefix': elementPrefix,
+                'lazy': opts.lazy,
                 'onInitializeMember': function(sequenceMember) {
                     /* initialize child block's JS behaviour */
                     var blockTypeName = $('#' + sequenceMember.prefix + '-type').val();
@@ -23,30 +40,16 @@
                         /* the child block's own elements have the prefix '{list member prefix}-value' */
                         blockOpts.initializer(sequenceMember.prefix + '-value');
                     }
-
-                    /* initialize delete button */
-                    $('#' + sequenceMember.prefix + '-delete').click(function() {
-                        sequenceMember.delete();
-                    });
-
-                    /* initialize 'prepend new block' buttons */
-                    function initializeAppendButton(childBlock) {
-                        var template = listMemberTemplates[childBlock.name];
-                        $('#' + sequenceMember.prefix + '-add-' + childBlock.name).click(function() {
-                            sequenceMember.appendMember(template);
-                        });
-                    }
-                    for (var i = 0; i < opts.childBlocks.length; i++) {
-                        initializeAppendButton(opts.childBlocks[i]);
-                    }
-                }
+                },
+                'memberControls': memberControls
             });
 
             /* initialize header menu */
             function initializePrependButton(childBlock) {
-                var template = listMemberTemplates[childBlock.name];
                 $('#' + elementPrefix + '-before-add-' + childBlock.name).click(function() {
-                    sequence.insertMemberAtStart(template);
+                    fetchMemberTemplate(newMemberUrls[childBlock.name]).done(function(template) {
+                        sequence.insertMemberAtStart(template);
+                    });
                 });
             }
             for (var i = 0; i < opts.childBlocks.length; i++) {
@@ -0,0 +1,90 @@
+"""
+Chunked rendering of block values, for use with StreamingHttpResponse.
+
+Renderable block values (as returned by Block.renderable) provide a render_chunks() method, which yields
+their string rendering in pieces, one member at a time, with the concatenation of those pieces being
+identical to that string rendering. stream_template extends this to a whole template: while the template
+is being rendered, any renderable block values it outputs are replaced by markers, and then streamed in
+place of those markers once the template's own output is complete.
+
+A marker is only safe (i.e. exempt from autoescaping) if the value's own string rendering is, and contains
+characters that escaping alters; a marker that comes out of the template escaped is streamed with its
+chunks escaped, so that the output is the same as rendering the template in one piece. If any other
+filter mangles a marker, stream_template falls back to rendering the template in one piece.
+"""
+import re
+import threading
+
+from django.template import RequestContext
+from django.template.loader import render_to_string
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+import six
+
+from core.metrics import metered_chunks
+
+
+# a marker as output verbatim, or escaped (once) by the template
+DEFERRED_RE = re.compile(r'\x00(<|&lt;)deferred:(\d+)(?:>|&gt;)\x00')
+
+_state = threading.local()
+
+
+def defer_rendering(renderable, safe=True):
+    """
+    Called from a renderable's __str__ method: if we are currently rendering a template through
+    stream_template, register the renderable to be streamed later and return a marker string to be output
+    in its place - marked safe if 'safe' is true, i.e. if the string it stands in for would be. Otherwise,
+    return None (and the renderable should render itself as normal).
+    """
+    pending = getattr(_state, 'pending', None)
+    if pending is None:
+        return None
+
+    pending.append(renderable)
+    marker = six.text_type('\x00<deferred:%d>\x00') % (len(pending) - 1)
+    return mark_safe(marker) if safe else marker
+
+
+def render_chunks(value, escaped=False):
+    """
+    Yield the string rendering of a renderable block value in chunks, HTML-escaped if 'escaped' is true
+    """
+    for chunk in value.render_chunks():
+        yield escape(chunk) if escaped else chunk
+
+
+@metered_chunks('render')
+def stream_template(template_name, context, request=None):
+    """
+    Render template_name with 'context' (as a RequestContext if 'request' is given),
+    yielding the output in chunks.
+    """
+    def render():
+        if request is None:
+            return render_to_string(template_name, context)
+        else:
+            return render_to_string(template_name, context, context_instance=RequestContext(request))
+
+    previous_pending = getattr(_state, 'pending', None)
+    _state.pending = pending = []
+    try:
+        rendered = render()
+    finally:
+        _state.pending = previous_pending
+
+    parts = DEFERRED_RE.split(rendered)
+    literals = parts[0::3]
+    if any('\x00' in literal for literal in literals):
+        # a marker has been altered by the template - give up on streaming this template
+        yield render()
+        return
+
+    for i in range(0, len(parts), 3):
+        if parts[i]:
+            yield parts[i]
+        if i + 2 < len(parts):
+            opening, index = parts[i + 1], parts[i + 2]
+            for chunk in render_chunks(pending[int(index)], escaped=(opening != '<')):
+                yield chunk
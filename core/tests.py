@@ -5,7 +5,12 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
-from django.test import TestCase
+import sys
+import unittest
+
+from django.test import TestCase, TransactionTestCase
+
+import six
 
 
 class SimpleTest(TestCase):
@@ -14,3 +19,1894 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class TestCompiledFormRendering(TestCase):
+    def render_page(self, prefix='page'):
+        from core.blocks import clear_definition_caches
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        # definition-level results (including the new member templates) are cached, so they must be
+        # recomputed under each setting to compare the two rendering paths
+        clear_definition_caches()
+        return (
+            PAGE_DEF.bind(PAGE_DATA, prefix=prefix).render_form(),
+            PAGE_DEF.all_html_declarations(),
+            sorted(
+                (block.definition_prefix, sorted(block.new_member_templates().items()))
+                for block in PAGE_DEF.all_blocks()
+            ),
+        )
+
+    def test_compiled_output_matches_templates(self):
+        with self.settings(COMPILED_BLOCK_FORMS=False):
+            template_output = self.render_page()
+        with self.settings(COMPILED_BLOCK_FORMS=True):
+            compiled_output = self.render_page()
+
+        self.assertEqual(template_output, compiled_output)
+
+    def test_compiled_output_escapes_prefix(self):
+        with self.settings(COMPILED_BLOCK_FORMS=False):
+            template_output = self.render_page(prefix='"page"&<>')
+        with self.settings(COMPILED_BLOCK_FORMS=True):
+            compiled_output = self.render_page(prefix='"page"&<>')
+
+        self.assertEqual(template_output, compiled_output)
+
+    def test_compiled_empty_sequences(self):
+        from core.blocks import ListBlock, StreamBlock, TextInputBlock
+
+        list_block = ListBlock(TextInputBlock(), label='Things')
+        stream_block = StreamBlock([('heading', TextInputBlock())])
+        stream_block.set_name('stream')
+
+        for block in (list_block, stream_block):
+            with self.settings(COMPILED_BLOCK_FORMS=False):
+                template_output = block.render_form([], prefix='empty')
+            with self.settings(COMPILED_BLOCK_FORMS=True):
+                compiled_output = block.render_form([], prefix='empty')
+            self.assertEqual(template_output, compiled_output)
+
+
+class TestDefinitionCaching(TestCase):
+    def test_definition_level_results_are_cached(self):
+        from core.views import PAGE_DEF
+
+        self.assertIs(PAGE_DEF.all_blocks(), PAGE_DEF.all_blocks())
+        self.assertIs(PAGE_DEF.all_media(), PAGE_DEF.all_media())
+        self.assertIs(PAGE_DEF.all_html_declarations(), PAGE_DEF.all_html_declarations())
+        self.assertIs(PAGE_DEF.js_initializer(), PAGE_DEF.js_initializer())
+
+    def test_clear_definition_caches(self):
+        from core.blocks import clear_definition_caches
+        from core.views import PAGE_DEF
+
+        declarations = PAGE_DEF.all_html_declarations()
+        clear_definition_caches()
+        new_declarations = PAGE_DEF.all_html_declarations()
+
+        self.assertIsNot(declarations, new_declarations)
+        self.assertEqual(declarations, new_declarations)
+
+    def test_all_media(self):
+        from core.views import PAGE_DEF
+
+        js = PAGE_DEF.all_media()._js
+        self.assertEqual(len(js), len(set(js)))
+        self.assertEqual(set(js), set([
+            'js/blocks/sequence.js', 'js/blocks/list.js', 'js/blocks/stream.js',
+            'js/blocks/struct.js', 'js/blocks/chooser.js',
+        ]))
+
+
+FRAGMENT_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragment-tests'},
+}
+
+
+class TestFragmentCache(TestCase):
+    def setUp(self):
+        from django.core.cache import caches
+        from core.views import SpeakerBlock
+
+        self.block = SpeakerBlock()
+        self.value = {'name': 'Bono', 'job_title': 'Singer', 'nicknames': []}
+        caches['default'].clear()
+
+    def test_cached_rendering_matches_uncached(self):
+        from core.fragment_cache import get_fragment_cache
+
+        uncached_html = str(self.block.renderable(self.value))
+        with self.settings(CACHES=FRAGMENT_CACHES, BLOCK_FRAGMENT_CACHE={'MAX_ENTRIES': 10, 'CACHE_ALIAS': 'default'}):
+            first_html = str(self.block.renderable(self.value))
+            self.assertEqual(len(get_fragment_cache().local), 1)
+            second_html = str(self.block.renderable(self.value))
+            self.assertEqual(len(get_fragment_cache().local), 1)
+
+        self.assertEqual(uncached_html, first_html)
+        self.assertEqual(uncached_html, second_html)
+
+    def test_key_depends_on_value_and_definition(self):
+        from core.fragment_cache import fragment_key
+        from core.views import SpeakerBlock, ExpertSpeakerBlock
+
+        key = fragment_key(self.block, self.value)
+        self.assertEqual(key, fragment_key(SpeakerBlock(), dict(self.value)))
+        self.assertNotEqual(key, fragment_key(self.block, dict(self.value, name='Edge')))
+        self.assertNotEqual(key, fragment_key(ExpertSpeakerBlock(), self.value))
+
+    def test_shared_tier(self):
+        from core.fragment_cache import get_fragment_cache
+
+        with self.settings(CACHES=FRAGMENT_CACHES, BLOCK_FRAGMENT_CACHE={'MAX_ENTRIES': 10, 'CACHE_ALIAS': 'default'}):
+            html = str(self.block.renderable(self.value))
+            get_fragment_cache().clear()
+            self.assertEqual(str(self.block.renderable(self.value)), html)
+            # repopulated from the shared tier
+            self.assertEqual(len(get_fragment_cache().local), 1)
+
+    def test_lru_eviction(self):
+        from core.fragment_cache import LRUCache
+
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_opt_out(self):
+        from core.fragment_cache import get_fragment_cache
+        from core.views import SpeakerBlock
+
+        class UncachedSpeakerBlock(SpeakerBlock):
+            cache_fragments = False
+
+        with self.settings(BLOCK_FRAGMENT_CACHE={'MAX_ENTRIES': 10}):
+            str(UncachedSpeakerBlock().renderable(self.value))
+            self.assertEqual(len(get_fragment_cache().local), 0)
+
+    def test_blocks_containing_uncacheable_blocks_are_not_cached(self):
+        from django.contrib.auth.models import User
+        from core.blocks import StructBlock, ChooserBlock, TextInputBlock
+        from core.fragment_cache import get_fragment_cache
+
+        class UncachedTextInputBlock(TextInputBlock):
+            cache_fragments = False
+
+        opted_out = StructBlock([('name', UncachedTextInputBlock())])
+        # the rendering of a chooser depends on the current state of the chosen object
+        with_reference = StructBlock([('name', TextInputBlock()), ('user', ChooserBlock(target_model=User))])
+        self.assertFalse(opted_out.fragments_cacheable())
+        self.assertFalse(with_reference.fragments_cacheable())
+        self.assertTrue(self.block.fragments_cacheable())
+
+        with self.settings(BLOCK_FRAGMENT_CACHE={'MAX_ENTRIES': 10}):
+            str(opted_out.renderable({'name': 'Bono'}))
+            str(with_reference.renderable({'name': 'Bono', 'user': None}))
+            self.assertEqual(len(get_fragment_cache().local), 0)
+
+    def test_key_depends_on_template_source(self):
+        from core.fragment_cache import fragment_key, template_source, templates_fingerprint
+
+        self.assertTrue('{{' in template_source('demo/speaker.html'))
+        self.assertEqual(template_source('demo/no_such_template.html'), None)
+        self.assertNotEqual(
+            templates_fingerprint(['demo/speaker.html']), templates_fingerprint(['core/blocks/struct.html'])
+        )
+        self.assertTrue(self.block.templates_fingerprint() in fragment_key(self.block, self.value))
+
+    def test_local_tier_expiry(self):
+        from core.fragment_cache import LRUCache
+
+        cache = LRUCache(2, timeout=60)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache = LRUCache(2, timeout=-1)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(len(cache), 0)
+
+
+class TestStreamingRendering(TestCase):
+    def test_page_chunks_match_string_rendering(self):
+        from django.template.loader import render_to_string
+        from core.streaming import stream_template
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        page = PAGE_DEF.renderable(PAGE_DATA)
+        chunks = list(stream_template('core/show.html', {'self': page}))
+
+        self.assertTrue(len(chunks) > len(PAGE_DATA['content']))
+        self.assertEqual(''.join(chunks), render_to_string('core/show.html', {'self': page}))
+
+    def test_block_chunks_match_string_rendering(self):
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        page = PAGE_DEF.renderable(PAGE_DATA)
+        for renderable in (page, page['speakers'], page['content']):
+            self.assertEqual(''.join(renderable.render_chunks()), str(renderable))
+
+    def test_stream_rendering(self):
+        from core.blocks import StreamBlock, TextInputBlock
+
+        block = StreamBlock([('heading', TextInputBlock())])
+        html = str(block.renderable([
+            {'type': 'heading', 'value': 'Hello'},
+            {'type': 'heading', 'value': '<world>'},
+        ]))
+        self.assertEqual(html, "['Hello', '<world>']")
+
+    def test_deferred_values_escaped_as_in_string_rendering(self):
+        import os
+        import shutil
+        import tempfile
+        from django.template.loader import render_to_string
+        from core.streaming import stream_template
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        template_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, template_dir)
+        with open(os.path.join(template_dir, 'filters.html'), 'w') as f:
+            f.write(
+                '{{ self.content }}|{{ self.content|force_escape }}|{{ self.content|safe }}|'
+                '{% autoescape off %}{{ self.content }}{% endautoescape %}|'
+                '{{ self.speakers.0 }}|{{ self.speakers.0|force_escape }}|{{ self.speakers.0|upper }}'
+            )
+
+        page = PAGE_DEF.renderable(PAGE_DATA)
+        with self.settings(TEMPLATE_DIRS=[template_dir]):
+            self.assertEqual(''.join(stream_template('filters.html', {'self': page})),
+                render_to_string('filters.html', {'self': page}))
+
+    def test_chunks_with_fragment_cache(self):
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        page = PAGE_DEF.renderable(PAGE_DATA)
+        with self.settings(BLOCK_FRAGMENT_CACHE={'MAX_ENTRIES': 10}):
+            first = ''.join(page.render_chunks())
+            second = ''.join(page.render_chunks())
+
+        self.assertEqual(first, str(page))
+        self.assertEqual(second, str(page))
+
+    def test_show_view_streams(self):
+        response = self.client.get('/')
+        self.assertTrue(response.streaming)
+        self.assertIn(b'[&#39;The largest event', b''.join(response.streaming_content))
+
+    def test_render_time_recorded_while_streaming(self):
+        from core.metrics import RequestMetrics, MetricsRegistry, activate_metrics
+        from core.middleware import counted_content
+        from core.streaming import stream_template
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        metrics = RequestMetrics(MetricsRegistry())
+        page = PAGE_DEF.renderable(PAGE_DATA)
+        content = counted_content(stream_template('core/show.html', {'self': page}), metrics)
+        activate_metrics(None)
+        self.assertNotIn('render', metrics.phase_times)
+        ''.join(content)
+        self.assertIn('render', metrics.phase_times)
+
+
+class TestLazyRenderable(TestCase):
+    def get_counting_block(self):
+        from core.blocks import TextInputBlock
+
+        class CountingBlock(TextInputBlock):
+            conversions = 0
+
+            def renderable(self, value):
+                CountingBlock.conversions += 1
+                return value.upper()
+
+        return CountingBlock
+
+    def test_struct_children_converted_on_access(self):
+        from django.template import Template, Context
+        from core.blocks import StructBlock, TextInputBlock
+
+        CountingBlock = self.get_counting_block()
+        block = StructBlock([('title', TextInputBlock()), ('body', CountingBlock())])
+        page = block.renderable({'title': 'hello', 'body': 'world'})
+
+        self.assertEqual(Template('{{ self.title }}').render(Context({'self': page})), 'hello')
+        self.assertEqual(CountingBlock.conversions, 0)
+
+        self.assertEqual(page['body'], 'WORLD')
+        self.assertEqual(page.get('body'), 'WORLD')
+        self.assertEqual(dict(page.items()), {'title': 'hello', 'body': 'WORLD'})
+        self.assertEqual(CountingBlock.conversions, 1)
+
+    def test_list_members_converted_on_access(self):
+        from django.template import Template, Context
+        from core.blocks import ListBlock
+
+        CountingBlock = self.get_counting_block()
+        items = ListBlock(CountingBlock()).renderable(['a', 'b', 'c', 'd'])
+
+        self.assertEqual(len(items), 4)
+        self.assertEqual(CountingBlock.conversions, 0)
+
+        self.assertEqual(Template('{{ items|first }}').render(Context({'items': items})), 'A')
+        self.assertEqual(CountingBlock.conversions, 1)
+
+        self.assertEqual(items[1:3], ['B', 'C'])
+        self.assertEqual(list(items), ['A', 'B', 'C', 'D'])
+        self.assertEqual(list(items), ['A', 'B', 'C', 'D'])
+        self.assertEqual(CountingBlock.conversions, 4)
+
+    def test_struct_protocol_returns_renderable_values(self):
+        from core.blocks import StructBlock, TextInputBlock
+
+        CountingBlock = self.get_counting_block()
+        block = StructBlock([('title', TextInputBlock()), ('body', CountingBlock())])
+        page = block.renderable({'title': 'hello', 'body': 'world'})
+
+        self.assertTrue('body' in page)
+        self.assertFalse('missing' in page)
+        self.assertEqual(CountingBlock.conversions, 0)
+
+        self.assertEqual(dict(page), {'title': 'hello', 'body': 'WORLD'})
+        self.assertEqual(page, {'title': 'hello', 'body': 'WORLD'})
+        self.assertEqual(page.copy(), {'title': 'hello', 'body': 'WORLD'})
+        self.assertEqual(sorted(page.values()), ['WORLD', 'hello'])
+        self.assertEqual(eval(repr(page)), {'title': 'hello', 'body': 'WORLD'})
+
+    def test_list_protocol_returns_renderable_values(self):
+        import json
+        from core.blocks import ListBlock
+
+        CountingBlock = self.get_counting_block()
+        items = ListBlock(CountingBlock()).renderable(['b', 'a'])
+
+        self.assertEqual(items, ['B', 'A'])
+        self.assertNotEqual(items, ['b', 'a'])
+        self.assertEqual(sorted(items), ['A', 'B'])
+        self.assertEqual(list(items) + ['C'], ['B', 'A', 'C'])
+        self.assertEqual(items.copy(), ['B', 'A'])
+        self.assertTrue('A' in items)
+        self.assertEqual(items.index('A'), 1)
+        self.assertEqual(repr(items), repr(['B', 'A']))
+        self.assertEqual(json.dumps(list(items)), '["B", "A"]')
+
+    def test_stream_members_converted_on_access(self):
+        from core.blocks import StreamBlock, TextInputBlock
+
+        CountingBlock = self.get_counting_block()
+        block = StreamBlock([('heading', TextInputBlock()), ('shouty', CountingBlock())])
+        stream = block.renderable([
+            {'type': 'heading', 'value': 'hello'},
+            {'type': 'shouty', 'value': 'world'},
+        ])
+
+        self.assertEqual(stream[0], 'hello')
+        self.assertEqual(CountingBlock.conversions, 0)
+        self.assertEqual(stream[-1], 'WORLD')
+        self.assertEqual(stream.block_types, ['heading', 'shouty'])
+        self.assertEqual(CountingBlock.conversions, 1)
+
+
+def page_post_data():
+    from django.http import QueryDict
+
+    data = QueryDict('', mutable=True)
+    data.update({
+        'page-title': 'My lovely event',
+        'page-speakers-count': '2',
+        'page-speakers-0-deleted': '', 'page-speakers-0-order': '1',
+        'page-speakers-0-value-name': 'Tim Berners-Lee',
+        'page-speakers-0-value-job_title': 'Web developer',
+        'page-speakers-0-value-nicknames-count': '2',
+        'page-speakers-0-value-nicknames-0-deleted': '', 'page-speakers-0-value-nicknames-0-order': '0',
+        'page-speakers-0-value-nicknames-0-value': 'Timmy',
+        'page-speakers-0-value-nicknames-1-deleted': '1', 'page-speakers-0-value-nicknames-1-order': '1',
+        'page-speakers-0-value-nicknames-1-value': 'Bernie',
+        'page-speakers-1-deleted': '', 'page-speakers-1-order': '0',
+        'page-speakers-1-value-name': 'Bono',
+        'page-speakers-1-value-job_title': 'Singer',
+        'page-speakers-1-value-nicknames-count': '0',
+        'page-content-count': '2',
+        'page-content-0-deleted': '', 'page-content-0-order': '0', 'page-content-0-type': 'heading',
+        'page-content-0-value': 'Hello',
+        'page-content-1-deleted': '', 'page-content-1-order': '1', 'page-content-1-type': 'speaker',
+        'page-content-1-value-name': 'Ada',
+        'page-content-1-value-job_title': 'Mathematician',
+        'page-content-1-value-nicknames-count': '0',
+        'page-content-1-value-specialist_subject': 'Engines',
+        'page-content-1-value-another_specialist_subject': 'Numbers',
+    })
+    return data
+
+
+class TestValueFromDatadict(TestCase):
+    def test_page_value(self):
+        from core.views import PAGE_DEF
+
+        self.assertEqual(PAGE_DEF.value_from_datadict(page_post_data(), {}, 'page'), {
+            'title': 'My lovely event',
+            'speakers': [
+                {'name': 'Bono', 'job_title': 'Singer', 'nicknames': [], 'image': 123},
+                {'name': 'Tim Berners-Lee', 'job_title': 'Web developer', 'nicknames': ['Timmy'], 'image': 123},
+            ],
+            'content': [
+                {'type': 'heading', 'value': 'Hello'},
+                {'type': 'speaker', 'value': {
+                    'name': 'Ada', 'job_title': 'Mathematician', 'nicknames': [],
+                    'specialist_subject': 'Engines', 'another_specialist_subject': 'Numbers',
+                }},
+            ],
+        })
+
+    def test_prefix_view(self):
+        from core.prefix_view import PrefixView
+
+        data = page_post_data()
+        data.setlist('page-title', ['First title', 'Second title'])
+
+        for tree in (PrefixView.build(data, 'page'), PrefixView.build(data.dict(), 'page')):
+            self.assertEqual(tree.child('title').value, 'Second title')
+            self.assertEqual(tree.child('content').child(1).child_value('type'), 'speaker')
+            self.assertEqual(tree.child('content').child(1).child('value').prefix, 'page-content-1-value')
+            self.assertEqual(tree.child('missing').get_value('default'), 'default')
+            self.assertRaises(KeyError, lambda: tree.child('speakers').child(5).child_value('order'))
+
+    def test_fallback_to_value_from_datadict(self):
+        from core.blocks import Block, ListBlock
+
+        class LegacyBlock(Block):
+            def value_from_datadict(self, data, files, prefix):
+                return (prefix, data.get(prefix + '-x'))
+
+        block = ListBlock(LegacyBlock())
+        self.assertEqual(block.value_from_datadict(page_post_data(), {}, 'page-speakers'), [
+            ('page-speakers-1-value', None),
+            ('page-speakers-0-value', None),
+        ])
+
+
+class TestChooserPrefetch(TestCase):
+    def setUp(self):
+        from django.contrib.auth.models import User, Group
+        from core.blocks import ChooserBlock, ListBlock, StreamBlock, StructBlock
+
+        self.users = [User.objects.create(username='user%d' % i) for i in range(10)]
+        self.groups = [Group.objects.create(name='group%d' % i) for i in range(5)]
+
+        self.block = StreamBlock([
+            ('user', ChooserBlock(target_model=User)),
+            ('group', ChooserBlock(target_model=Group)),
+            ('team', StructBlock([('members', ListBlock(ChooserBlock(target_model=User)))])),
+        ])
+        self.value = (
+            [{'type': 'user', 'value': user.pk} for user in self.users]
+            + [{'type': 'group', 'value': group.pk} for group in self.groups]
+            + [{'type': 'team', 'value': {'members': [user.pk for user in self.users[:3]]}}] * 4
+        )
+
+    def test_one_query_per_model(self):
+        with self.assertNumQueries(2):
+            stream = self.block.renderable(self.value)
+            usernames = [user.username for user in stream[:10]]
+            group_names = [group.name for group in stream[10:15]]
+            team_usernames = [
+                [user.username for user in team['members']]
+                for team in stream[15:]
+            ]
+
+        self.assertEqual(usernames, ['user%d' % i for i in range(10)])
+        self.assertEqual(group_names, ['group%d' % i for i in range(5)])
+        self.assertEqual(team_usernames, [['user0', 'user1', 'user2']] * 4)
+
+    def test_references_fetched_on_first_use(self):
+        with self.assertNumQueries(0):
+            stream = self.block.renderable(self.value)
+            self.assertEqual(len(stream), 19)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(stream[0].username, 'user0')
+            self.assertEqual(stream[15]['members'][2].username, 'user2')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(stream[10].name, 'group0')
+
+    def test_cached_fragments_need_no_references(self):
+        from django.contrib.auth.models import User
+        from core.blocks import ChooserBlock, StructBlock, TextInputBlock
+
+        block = StructBlock([
+            ('heading', StructBlock([('text', TextInputBlock())])),
+            ('author', ChooserBlock(target_model=User)),
+        ])
+        value = {'heading': {'text': 'Hello'}, 'author': self.users[0].pk}
+        with self.settings(BLOCK_FRAGMENT_CACHE={'MAX_ENTRIES': 10}):
+            str(block.renderable(value)['heading'])
+            with self.assertNumQueries(0):
+                self.assertIn('Hello', str(block.renderable(value)['heading']))
+
+    def test_missing_object(self):
+        stream = self.block.renderable([{'type': 'user', 'value': 12345}])
+        self.assertEqual(stream[0], None)
+
+    def test_standalone_chooser(self):
+        from django.contrib.auth.models import User
+        from core.blocks import ChooserBlock
+
+        with self.assertNumQueries(1):
+            self.assertEqual(ChooserBlock(target_model=User).renderable(self.users[0].pk), self.users[0])
+
+    def test_no_queries_without_target_model(self):
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        with self.assertNumQueries(0):
+            self.assertEqual(PAGE_DEF.renderable(PAGE_DATA)['content'][1], 42)
+
+
+class TestStreamValue(TestCase):
+    def setUp(self):
+        from core.blocks import StreamBlock, TextInputBlock
+
+        self.block = StreamBlock([('heading', TextInputBlock()), ('paragraph', TextInputBlock())])
+        self.list_value = [
+            {'type': 'heading', 'value': 'Hello'},
+            {'type': 'paragraph', 'value': 'World'},
+        ]
+
+    def test_list_compatibility(self):
+        stream_value = self.block.to_stream_value(self.list_value)
+
+        self.assertEqual(stream_value, self.list_value)
+        self.assertEqual(self.list_value, stream_value)
+        self.assertFalse(stream_value != self.list_value)
+        self.assertEqual(len(stream_value), 2)
+        self.assertEqual(stream_value[1], {'type': 'paragraph', 'value': 'World'})
+        self.assertEqual(list(stream_value), self.list_value)
+        self.assertEqual(stream_value.items(), [('heading', 'Hello'), ('paragraph', 'World')])
+
+    def test_clean_accepts_stream_value(self):
+        import json
+
+        cleaned = self.block.clean(self.block.to_stream_value(self.list_value))
+        self.assertEqual(type(cleaned), list)
+        self.assertEqual(cleaned, self.list_value)
+        self.assertEqual(json.loads(json.dumps(cleaned)), self.list_value)
+        self.assertEqual(type(self.block.clean(self.list_value)), list)
+
+    def test_value_from_datadict_returns_list(self):
+        data = {
+            'body-count': '1', 'body-0-type': 'heading', 'body-0-deleted': '', 'body-0-order': '0',
+            'body-0-value': 'Hello',
+        }
+        value = self.block.value_from_datadict(data, {}, 'body')
+        self.assertEqual(type(value), list)
+        self.assertEqual(value, [{'type': 'heading', 'value': 'Hello'}])
+
+    def test_json_and_pickle(self):
+        import json
+        import pickle
+        from core.values import BlockJSONEncoder
+
+        stream_value = self.block.to_stream_value(self.list_value)
+        self.assertEqual(json.loads(json.dumps(stream_value, cls=BlockJSONEncoder)), self.list_value)
+        self.assertEqual(pickle.loads(pickle.dumps(stream_value)), stream_value)
+
+    def test_memory_benchmark(self):
+        from core.benchmarks import stream_memory_benchmark
+
+        result = stream_memory_benchmark(100)
+        for name in ('stream_value_bytes_per_member', 'bound_block_bytes_per_member'):
+            self.assertTrue(result[name]['after'] < result[name]['before'])
+
+
+from django.db import models
+from core.fields import StreamField
+from core.blocks import TextInputBlock
+
+
+class StreamFieldTestPage(models.Model):
+    title = models.CharField(max_length=255)
+    body = StreamField([('heading', TextInputBlock()), ('paragraph', TextInputBlock())])
+
+
+class TestStreamField(TestCase):
+    body_value = [
+        {'type': 'heading', 'value': 'Hello'},
+        {'type': 'paragraph', 'value': 'World'},
+    ]
+
+    def setUp(self):
+        self.page = StreamFieldTestPage.objects.create(title='Test', body=self.body_value)
+
+    def test_round_trip(self):
+        from core.values import StreamValue
+
+        page = StreamFieldTestPage.objects.get(pk=self.page.pk)
+        self.assertTrue(isinstance(page.body, StreamValue))
+        self.assertEqual(page.body, self.body_value)
+
+    def test_decoded_on_first_access(self):
+        page = StreamFieldTestPage.objects.get(pk=self.page.pk)
+        self.assertTrue(isinstance(page.__dict__['body'], six.string_types))
+        page.body
+        self.assertFalse(isinstance(page.__dict__['body'], six.string_types))
+
+    def test_unaccessed_value_saved_as_is(self):
+        page = StreamFieldTestPage.objects.get(pk=self.page.pk)
+        raw_value = page.__dict__['body']
+        page.title = 'Changed'
+        page.save()
+        self.assertTrue(page.__dict__['body'] is raw_value)
+        self.assertEqual(StreamFieldTestPage.objects.get(pk=self.page.pk).body, self.body_value)
+
+    def test_defer(self):
+        page = StreamFieldTestPage.objects.defer('body').get(pk=self.page.pk)
+        self.assertNotIn('body', page.__dict__)
+        with self.assertNumQueries(1):
+            self.assertEqual(page.body, self.body_value)
+
+        page = StreamFieldTestPage.objects.only('title').get(pk=self.page.pk)
+        self.assertEqual(page.body, self.body_value)
+
+    def test_migration_serialisation(self):
+        from django.db.migrations.writer import MigrationWriter
+        from core.blocks import ListBlock, StructBlock, TextInputBlock
+
+        field = StreamField([
+            ('heading', TextInputBlock(label='Heading')),
+            ('people', ListBlock(StructBlock([('name', TextInputBlock(default='Anon'))]), max_num=5)),
+        ], blank=True)
+        string, imports = MigrationWriter.serialize(field)
+
+        namespace = {}
+        exec('\n'.join(sorted(imports)), namespace)
+        rebuilt = eval(string, namespace)
+        self.assertEqual(rebuilt.stream_block.definition_prefix, field.stream_block.definition_prefix)
+        self.assertEqual(MigrationWriter.serialize(rebuilt)[0], string)
+
+    def test_empty_value(self):
+        page = StreamFieldTestPage.objects.create(title='Empty')
+        self.assertEqual(StreamFieldTestPage.objects.get(pk=page.pk).body, [])
+
+
+VALIDATION_CACHE = {'MAX_ENTRIES': 100}
+
+
+class TestIncrementalValidation(TestCase):
+    def setUp(self):
+        from django import forms
+        from core.blocks import FieldBlock, ListBlock, StreamBlock
+
+        self.clean_calls = []
+
+        test = self
+
+        class CountingBlock(FieldBlock):
+            def clean(self, value):
+                test.clean_calls.append(value)
+                return super(CountingBlock, self).clean(value)
+
+        self.list_block = ListBlock(CountingBlock(forms.CharField()))
+        self.stream_block = StreamBlock([('text', CountingBlock(forms.CharField(max_length=10)))])
+        self.number_list_block = ListBlock(CountingBlock(forms.IntegerField()))
+
+    def test_unchanged_members_skipped(self):
+        with self.settings(BLOCK_VALIDATION_CACHE=VALIDATION_CACHE):
+            self.assertEqual(self.list_block.clean(['one', 'two', 'three']), ['one', 'two', 'three'])
+            self.assertEqual(len(self.clean_calls), 3)
+
+            self.clean_calls = []
+            self.assertEqual(self.list_block.clean(['one', 'TWO', 'three']), ['one', 'TWO', 'three'])
+            self.assertEqual(self.clean_calls, ['TWO'])
+
+            self.clean_calls = []
+            stream_value = [{'type': 'text', 'value': 'one'}, {'type': 'text', 'value': 'two'}]
+            self.stream_block.clean(stream_value)
+            self.stream_block.clean(stream_value)
+            self.assertEqual(self.clean_calls, ['one', 'two'])
+
+    def test_cleaned_form_must_match(self):
+        with self.settings(BLOCK_VALIDATION_CACHE=VALIDATION_CACHE):
+            self.assertEqual(self.number_list_block.clean(['5']), [5])
+            self.assertEqual(self.number_list_block.clean(['5']), [5])
+            self.assertEqual(len(self.clean_calls), 2)
+            # a submission of the cleaned form of the value is known to be clean
+            self.assertEqual(self.number_list_block.clean([5]), [5])
+            self.assertEqual(len(self.clean_calls), 2)
+
+    def test_cleaned_types_not_confused_with_strings(self):
+        import datetime
+        from django import forms
+        from core.blocks import FieldBlock, ListBlock, StructBlock
+
+        date_list_block = ListBlock(FieldBlock(forms.DateField()))
+        struct_list_block = ListBlock(StructBlock([('when', FieldBlock(forms.DateField()))]))
+        with self.settings(BLOCK_VALIDATION_CACHE=VALIDATION_CACHE):
+            self.assertEqual(date_list_block.clean(['2014-01-02']), [datetime.date(2014, 1, 2)])
+            self.assertEqual(date_list_block.clean(['2014-01-02']), [datetime.date(2014, 1, 2)])
+
+            self.assertEqual(struct_list_block.clean([{'when': '2014-01-02'}]), [{'when': datetime.date(2014, 1, 2)}])
+            self.assertEqual(struct_list_block.clean([{'when': '2014-01-02'}]), [{'when': datetime.date(2014, 1, 2)}])
+
+    def test_typed_value(self):
+        import datetime
+        import decimal
+        from core.fragment_cache import typed_value
+
+        self.assertNotEqual(typed_value(datetime.date(2014, 1, 2)), typed_value('2014-01-02'))
+        self.assertNotEqual(typed_value(decimal.Decimal('1.5')), typed_value(1.5))
+        self.assertNotEqual(typed_value(['date', '2014-01-02']), typed_value(datetime.date(2014, 1, 2)))
+        self.assertNotEqual(typed_value({'a': 1}), typed_value([['a', 1]]))
+        self.assertRaises(TypeError, typed_value, object())
+
+    def test_invalid_members_revalidated(self):
+        from django.core.exceptions import ValidationError
+
+        with self.settings(BLOCK_VALIDATION_CACHE=VALIDATION_CACHE):
+            for i in range(2):
+                with self.assertRaises(ValidationError):
+                    self.list_block.clean(['one', ''])
+            self.assertEqual(self.clean_calls, ['one', '', ''])
+
+    def test_disabled(self):
+        with self.settings(BLOCK_VALIDATION_CACHE=None):
+            self.list_block.clean(['one'])
+            self.list_block.clean(['one'])
+            self.assertEqual(len(self.clean_calls), 2)
+
+
+class TestBenchmarks(TestCase):
+    def test_generated_form_round_trip(self):
+        from core.benchmarks import make_definition, make_value, form_data
+
+        block = make_definition(depth=2, child_types=4)
+        value = make_value(block, 5, nested_length=2)
+        data = form_data(block.bind(value, 'page').render_form())
+        self.assertEqual(block.clean(block.value_from_datadict(data, {}, 'page', stored=value)), value)
+
+    def test_run_and_compare(self):
+        import json
+        from core.benchmarks import run_benchmarks, compare_results, PHASES
+
+        results = json.loads(json.dumps(
+            run_benchmarks(lengths=[1, 2], depths=[1], child_types=[2], repeat=1, memory_member_count=10)
+        ))
+        self.assertEqual(len(results['results']), 2 * len(PHASES))
+
+        comparison = compare_results(results, results)
+        self.assertEqual(len(comparison), 2 * len(PHASES))
+        for result, baseline_seconds, seconds, ratio in comparison:
+            self.assertTrue(ratio is None or ratio == 1)
+
+
+class TestInstrumentation(TestCase):
+    def test_records_timings(self):
+        from core.blocks import ListBlock, TextInputBlock
+        from core.instrumentation import record_timings
+
+        block = ListBlock(TextInputBlock())
+        with record_timings() as timings:
+            block.bind(['a', 'b'], 'list').render_form()
+            block.clean(['a', 'b'])
+
+        stats = dict(
+            ((result['block_class'], result['method']), result) for result in timings.results()
+        )
+        self.assertEqual(stats[('core.blocks.ListBlock', 'render_form')]['calls'], 1)
+        self.assertEqual(stats[('core.blocks.ListBlock', 'render_list_member')]['calls'], 2)
+        self.assertEqual(stats[('core.blocks.TextInputBlock', 'render_form')]['calls'], 2)
+        self.assertEqual(stats[('core.blocks.ListBlock', 'clean')]['calls'], 1)
+
+        list_render = stats[('core.blocks.ListBlock', 'render_form')]
+        self.assertTrue(list_render['self_time'] <= list_render['cumulative_time'])
+
+    def test_wrappers_only_record_on_recording_thread(self):
+        import threading
+        from core.blocks import ListBlock, TextInputBlock
+        from core.instrumentation import record_timings
+
+        block = ListBlock(TextInputBlock())
+        with record_timings():
+            wrapper = ListBlock.__dict__['render_form']
+        with record_timings() as timings:
+            thread = threading.Thread(target=lambda: block.clean(['a']))
+            thread.start()
+            thread.join()
+        self.assertEqual(timings.results(), [])
+
+        # wrappers are installed once and left in place
+        self.assertTrue(ListBlock.__dict__['render_form'] is wrapper)
+        self.assertEqual(block.clean(['a']), ['a'])
+
+    def test_definition_cached_methods_timed_on_miss(self):
+        from core.blocks import ListBlock, TextInputBlock, clear_definition_caches
+        from core.instrumentation import record_timings
+
+        block = ListBlock(TextInputBlock())
+        with record_timings() as timings:
+            clear_definition_caches()
+            for i in range(3):
+                block.html_declarations()
+
+        stats = dict(((result['block_class'], result['method']), result) for result in timings.results())
+        self.assertEqual(stats[('core.blocks.ListBlock', 'html_declarations')]['calls'], 1)
+
+
+class RecordingExporter(object):
+    snapshots = []
+
+    def export(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+METRICS = {'SAMPLE_RATE': 1, 'EXPORT_INTERVAL': 0, 'EXPORTER': 'core.tests.RecordingExporter'}
+
+
+class TestBlockMetrics(TestCase):
+    def setUp(self):
+        RecordingExporter.snapshots = []
+
+    def test_histogram(self):
+        from core.metrics import Histogram
+
+        histogram = Histogram([1, 2, 4, 8])
+        for value in [0.5, 1.5, 3, 3, 100]:
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['count'], 5)
+        self.assertEqual(snapshot['max'], 100)
+        self.assertEqual(snapshot['p50'], 4)
+        self.assertEqual(snapshot['buckets'], [[1, 1], [2, 1], [4, 2], [None, 1]])
+
+    def test_nesting_depth(self):
+        from core.views import PAGE_DEF
+
+        # page > speakers > speaker > nicknames > nickname
+        self.assertEqual(PAGE_DEF.nesting_depth(), 4)
+        self.assertEqual(PAGE_DEF.child_blocks['title'].nesting_depth(), 0)
+
+    def test_members_counted_as_processed(self):
+        from core.metrics import MetricsRegistry, RequestMetrics, activate_metrics
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        metrics = RequestMetrics(MetricsRegistry())
+        activate_metrics(metrics)
+        try:
+            renderable = PAGE_DEF.renderable(PAGE_DATA)
+            # the speakers list is converted, but none of its members - nor their nicknames - are
+            len(renderable['speakers'])
+        finally:
+            activate_metrics(None)
+        self.assertEqual(metrics.members, 2)
+        self.assertEqual(metrics.depth, 4)
+
+        metrics = RequestMetrics(MetricsRegistry())
+        activate_metrics(metrics)
+        try:
+            PAGE_DEF.clean(PAGE_DATA)
+        finally:
+            activate_metrics(None)
+        # 2 speakers with 2 nicknames between them, plus 4 stream members
+        self.assertEqual(metrics.members, 8)
+
+    def test_sampled_request(self):
+        from django.test.client import RequestFactory
+        from core.middleware import BlockMetricsMiddleware
+        from core.views import edit
+
+        with self.settings(BLOCK_METRICS=METRICS):
+            middleware = BlockMetricsMiddleware()
+            request = RequestFactory().get('/edit/')
+            middleware.process_request(request)
+            response = middleware.process_response(request, edit(request))
+
+        self.assertEqual(len(RecordingExporter.snapshots), 1)
+        metrics = RecordingExporter.snapshots[0]
+        self.assertEqual(metrics['phase_seconds.render_form']['count'], 1)
+        self.assertEqual(metrics['members']['max'], 8)
+        self.assertEqual(metrics['bytes_rendered']['sum'], len(response.content))
+
+    def test_streamed_request(self):
+        from django.test.client import RequestFactory
+        from core.middleware import BlockMetricsMiddleware
+        from core.views import show
+
+        with self.settings(BLOCK_METRICS=METRICS):
+            middleware = BlockMetricsMiddleware()
+            request = RequestFactory().get('/')
+            middleware.process_request(request)
+            response = middleware.process_response(request, show(request))
+            self.assertEqual(RecordingExporter.snapshots, [])
+            content = b''.join(response.streaming_content)
+
+        metrics = RecordingExporter.snapshots[0]
+        self.assertEqual(metrics['bytes_rendered']['sum'], len(content))
+        self.assertEqual(metrics['phase_seconds.renderable']['count'], 1)
+
+    def test_disabled(self):
+        from django.core.exceptions import MiddlewareNotUsed
+        from core.middleware import BlockMetricsMiddleware
+
+        with self.settings(BLOCK_METRICS=None):
+            self.assertRaises(MiddlewareNotUsed, BlockMetricsMiddleware)
+
+
+class TestNewMemberTemplates(TestCase):
+    def test_not_inlined_in_page(self):
+        from core.views import PAGE_DEF
+
+        declarations = PAGE_DEF.all_html_declarations()
+        speakers_block = PAGE_DEF.child_blocks['speakers']
+        self.assertIn(speakers_block.new_member_template_url('child'), declarations)
+        self.assertNotIn(speakers_block.new_member_templates()['child'], declarations)
+
+    def test_serve_template(self):
+        from core.views import PAGE_DEF
+
+        content_block = PAGE_DEF.child_blocks['content']
+        url = content_block.new_member_template_url('heading')
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode('utf-8'), content_block.new_member_templates()['heading'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        etag = response['ETag']
+        self.assertEqual(etag, '"%s"' % content_block.new_member_template_versions()['heading'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # without the version in the URL, responses must be revalidated
+        response = self.client.get(url.split('?')[0])
+        self.assertIn('max-age=0', response['Cache-Control'])
+
+    def test_unknown_template(self):
+        from core.views import PAGE_DEF
+
+        definition_prefix = PAGE_DEF.child_blocks['content'].definition_prefix
+        self.assertEqual(self.client.get('/blocks/%s/newmember/nonexistent/' % definition_prefix).status_code, 404)
+        self.assertEqual(self.client.get('/blocks/nonexistent/newmember/child/').status_code, 404)
+
+
+class TestDefinitionPrefix(TestCase):
+    def make_definition(self, name_label='Name'):
+        from django import forms
+        from core.blocks import StructBlock, ListBlock, FieldBlock, TextInputBlock
+
+        return ListBlock(StructBlock([
+            ('name', FieldBlock(forms.CharField(), label=name_label)),
+            ('nicknames', ListBlock(TextInputBlock())),
+        ]))
+
+    def test_identical_definitions_share_prefix(self):
+        from django import forms
+
+        block = self.make_definition()
+        forms.CharField()  # creation order of form fields must not matter
+        other_block = self.make_definition()
+
+        self.assertEqual(block.definition_prefix, other_block.definition_prefix)
+        self.assertEqual(block.js_initializer(), other_block.js_initializer())
+        self.assertNotEqual(block.definition_prefix, self.make_definition('Full name').definition_prefix)
+
+    def test_field_options_distinguish_definitions(self):
+        from django import forms
+        from django.core.validators import MinLengthValidator
+        from core.blocks import FieldBlock
+
+        def prefix(field):
+            return FieldBlock(field).definition_prefix
+
+        self.assertNotEqual(prefix(forms.ChoiceField(choices=[('a', 'A')])),
+            prefix(forms.ChoiceField(choices=[('b', 'B')])))
+        self.assertNotEqual(prefix(forms.RegexField(r'^a')), prefix(forms.RegexField(r'^b')))
+        self.assertNotEqual(prefix(forms.CharField(validators=[MinLengthValidator(2)])),
+            prefix(forms.CharField(validators=[MinLengthValidator(3)])))
+        self.assertNotEqual(prefix(forms.CharField(widget=forms.TextInput(attrs={'size': 10}))),
+            prefix(forms.CharField(widget=forms.TextInput(attrs={'size': 20}))))
+        self.assertEqual(prefix(forms.ChoiceField(choices=[('a', 'A')])),
+            prefix(forms.ChoiceField(choices=[('a', 'A')])))
+
+    def test_non_json_default(self):
+        import datetime
+        from django import forms
+        from core.blocks import FieldBlock
+
+        block = FieldBlock(forms.DateField(), default=datetime.date(2015, 1, 1))
+        self.assertNotEqual(block.definition_prefix,
+            FieldBlock(forms.DateField(), default=datetime.date(2015, 1, 2)).definition_prefix)
+        self.assertTrue(FieldBlock(forms.CharField(), default=object()).definition_prefix)
+        self.assertEqual(FieldBlock(forms.CharField(), default=object()).definition_prefix,
+            FieldBlock(forms.CharField(), default=object()).definition_prefix)
+
+    def test_model_choice_field(self):
+        from django import forms
+        from core.blocks import FieldBlock
+
+        def make_block(queryset):
+            return FieldBlock(forms.ModelChoiceField(queryset=queryset))
+
+        with self.assertNumQueries(0):
+            block = make_block(StreamFieldTestPage.objects.all())
+            self.assertEqual(block.definition_prefix,
+                make_block(StreamFieldTestPage.objects.all()).definition_prefix)
+            self.assertNotEqual(block.definition_prefix,
+                make_block(StreamFieldTestPage.objects.filter(title='a')).definition_prefix)
+
+    def test_set_name(self):
+        from core.blocks import TextInputBlock
+
+        block = TextInputBlock()
+        unnamed_prefix = block.definition_prefix
+        block.set_name('heading')
+        self.assertNotEqual(block.definition_prefix, unnamed_prefix)
+
+    def test_lookup(self):
+        from core.blocks import get_block_definition
+
+        block = self.make_definition()
+        self.assertEqual(get_block_definition(block.definition_prefix).definition_fingerprint(),
+            block.definition_fingerprint())
+        self.assertIsNone(get_block_definition('blockdef-nonexistent'))
+
+    def test_declarations_not_duplicated(self):
+        from core.blocks import StructBlock
+
+        block = StructBlock([('first', self.make_definition()), ('second', self.make_definition())])
+        # 'first' and 'second' differ by name, but their 'nicknames' lists are identical
+        self.assertEqual(block.all_html_declarations().count('-newmember"'), 3)
+
+
+class TestWarmUp(TestCase):
+    def setUp(self):
+        self.frozen = set()
+
+    def tearDown(self):
+        # definitions such as core.views.PAGE_DEF are shared with other tests
+        for block in self.frozen:
+            block.unfreeze()
+
+    def test_warm_up(self):
+        from core.blocks import ListBlock, TextInputBlock, register_root_definition
+        from core.instrumentation import record_timings
+        from core.views import PAGE_DEF
+        from core.warmup import warm_up
+
+        child_block = TextInputBlock()
+        block = register_root_definition(ListBlock(child_block))
+        self.frozen = warm_up()
+
+        self.assertTrue(block.frozen and child_block.frozen and PAGE_DEF.frozen)
+        self.assertRaises(RuntimeError, child_block.set_name, 'renamed')
+        self.assertRaises(RuntimeError, setattr, block, 'window_size', 10)
+
+        # definition-level state has already been computed, so the new-member template isn't rendered again
+        with record_timings() as timings:
+            block.all_html_declarations()
+            block.js_initializer()
+        self.assertNotIn('render_list_member', [result['method'] for result in timings.results()])
+
+    def test_unregistered_definitions_not_frozen(self):
+        from core.blocks import StructBlock, TextInputBlock
+        from core.views import PAGE_DEF
+        from core.warmup import warm_up
+
+        shared_block = TextInputBlock()
+        self.frozen = warm_up()
+        self.assertFalse(shared_block.frozen)
+
+        # as in a module imported after warming up
+        StructBlock([('shared', shared_block)])
+        self.assertEqual(shared_block.name, 'shared')
+
+        # a frozen block can still be added under the name it already has
+        title_block = PAGE_DEF.child_blocks['title']
+        StructBlock([('title', title_block)])
+        self.assertRaises(RuntimeError, StructBlock, [('heading', title_block)])
+
+
+@unittest.skipIf(sys.version_info < (3, 4), "asyncio rendering requires Python 3.4+")
+class TestAsyncRendering(TestCase):
+    def test_same_output_as_sync_path(self):
+        from core.async_rendering import render_concurrently
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        self.assertEqual(render_concurrently(PAGE_DEF, PAGE_DATA), six.text_type(PAGE_DEF.renderable(PAGE_DATA)))
+
+    def test_io_bound_members_resolved_concurrently(self):
+        import threading
+        import time
+        from core.async_rendering import render_concurrently
+        from core.blocks import ListBlock, TextInputBlock
+
+        state = {'running': 0, 'max_running': 0}
+        lock = threading.Lock()
+
+        class SlowBlock(TextInputBlock):
+            def renderable_needs_io(self, value):
+                return True
+
+            def renderable(self, value):
+                with lock:
+                    state['running'] += 1
+                    state['max_running'] = max(state['max_running'], state['running'])
+                time.sleep(0.05)
+                with lock:
+                    state['running'] -= 1
+                return value.upper()
+
+        block = ListBlock(SlowBlock())
+        value = ['a', 'b', 'c', 'd', 'e', 'f']
+
+        start = time.time()
+        html = render_concurrently(block, value, max_concurrency=3)
+        elapsed = time.time() - start
+
+        self.assertEqual(html, "['A', 'B', 'C', 'D', 'E', 'F']")
+        self.assertEqual(state['max_running'], 3)
+        self.assertTrue(elapsed < 0.05 * len(value))
+
+    def test_coroutine_api(self):
+        import asyncio
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            html = loop.run_until_complete(PAGE_DEF.arender(PAGE_DATA))
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        self.assertEqual(html, six.text_type(PAGE_DEF.renderable(PAGE_DATA)))
+
+
+class TestValueMigrations(TestCase):
+    def test_operations(self):
+        from core.value_migrations import compile_operations, RenameChild, RemoveType, MapValue, WrapInList
+
+        value = [
+            {'type': 'speaker', 'value': {'name': 'Jim', 'image': 1}},
+            {'type': 'advert', 'value': 'Buy now'},
+            {'type': 'heading', 'value': ' Hello '},
+            {'type': 'speaker', 'value': {'name': 'Bob', 'image': 2}},
+        ]
+        transform = compile_operations([
+            RenameChild(['speaker'], 'image', 'photo'),
+            RemoveType([], 'advert'),
+            MapValue(['heading'], lambda heading: heading.strip()),
+            WrapInList(['speaker', 'name']),
+            MapValue(['speaker', 'name', '*'], lambda name: name.upper()),
+        ])
+        self.assertEqual(transform(value), [
+            {'type': 'speaker', 'value': {'name': ['JIM'], 'photo': 1}},
+            {'type': 'heading', 'value': 'Hello'},
+            {'type': 'speaker', 'value': {'name': ['BOB'], 'photo': 2}},
+        ])
+        # the original value is untouched
+        self.assertEqual(value[0], {'type': 'speaker', 'value': {'name': 'Jim', 'image': 1}})
+
+    def test_run_in_batches(self):
+        import json
+        from core.value_migrations import ValueMigration, RenameChild, MapValue
+
+        for i in range(5):
+            StreamFieldTestPage.objects.create(title='Page %d' % i, body=[
+                {'type': 'heading', 'value': 'Heading %d' % i},
+                {'type': 'paragraph', 'value': 'Paragraph %d' % i},
+            ])
+        StreamFieldTestPage.objects.create(title='Unchanged', body=[{'type': 'paragraph', 'value': 'x'}])
+
+        migration = ValueMigration('test', StreamFieldTestPage, 'body', [
+            MapValue(['heading'], lambda heading: heading.upper()),
+            RenameChild([], 'heading', 'title'),
+        ], batch_size=2)
+
+        # per batch: a select, plus an update if any rows have changed - and a final empty select; each within
+        # a savepoint (and its release), as the test runs in a transaction
+        with self.assertNumQueries((2 + 2 + 2 + 1) + 4 * 2):
+            stats = migration.run()
+        self.assertEqual(stats, {'scanned': 6, 'updated': 5})
+
+        raw_values = StreamFieldTestPage.objects.order_by('pk').values_list('body', flat=True)
+        self.assertEqual(json.loads(raw_values[0]), [
+            {'type': 'title', 'value': 'HEADING 0'},
+            {'type': 'paragraph', 'value': 'Paragraph 0'},
+        ])
+        self.assertEqual(json.loads(raw_values[5]), [{'type': 'paragraph', 'value': 'x'}])
+
+    def test_resume_from_checkpoint(self):
+        import os
+        import tempfile
+        from core.value_migrations import ValueMigration, FileCheckpoint, MapValue
+
+        pages = [
+            StreamFieldTestPage.objects.create(title='Page %d' % i, body=[{'type': 'heading', 'value': 'h%d' % i}])
+            for i in range(5)
+        ]
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(path)
+
+        migrated = []
+
+        def fail_on_fourth(heading):
+            if heading == 'h3':
+                raise ValueError('interrupted')
+            migrated.append(heading)
+            return heading.upper()
+
+        try:
+            migration = ValueMigration('upper', StreamFieldTestPage, 'body', [
+                MapValue(['heading'], fail_on_fourth),
+            ], batch_size=2, checkpoint=FileCheckpoint(path))
+            self.assertRaises(ValueError, migration.run)
+            self.assertEqual(FileCheckpoint(path).load('upper'), pages[1].pk)
+
+            def upper(heading):
+                migrated.append(heading)
+                return heading.upper()
+
+            migration = ValueMigration('upper', StreamFieldTestPage, 'body', [
+                MapValue(['heading'], upper),
+            ], batch_size=2, checkpoint=FileCheckpoint(path))
+            self.assertEqual(migration.run(), {'scanned': 3, 'updated': 3})
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+        # h2 was migrated in the interrupted batch, but not written back, so it is migrated again on resume
+        self.assertEqual(migrated, ['h0', 'h1', 'h2', 'h2', 'h3', 'h4'])
+        self.assertEqual(
+            [page.body[0]['value'] for page in StreamFieldTestPage.objects.order_by('pk')],
+            ['H0', 'H1', 'H2', 'H3', 'H4']
+        )
+
+
+class TestDatabaseCheckpoint(TransactionTestCase):
+    # not a TestCase, as each batch must be committed (or rolled back) in a transaction of its own
+
+    def test_batch_and_checkpoint_saved_together(self):
+        from core.value_migrations import ValueMigration, DatabaseCheckpoint, WrapInList
+
+        pages = [
+            StreamFieldTestPage.objects.create(title='Page %d' % i, body=[{'type': 'heading', 'value': 'h%d' % i}])
+            for i in range(5)
+        ]
+
+        class FailingCheckpoint(DatabaseCheckpoint):
+            def save(self, name, last_pk):
+                if last_pk == pages[3].pk:
+                    raise IOError('interrupted')
+                super(FailingCheckpoint, self).save(name, last_pk)
+
+        migration = ValueMigration('wrap', StreamFieldTestPage, 'body', [
+            WrapInList(['heading']),
+        ], batch_size=2, checkpoint=FailingCheckpoint())
+        self.assertRaises(IOError, migration.run)
+        self.assertEqual(DatabaseCheckpoint().load('wrap'), pages[1].pk)
+
+        # the second batch was rolled back along with its checkpoint, so it isn't wrapped twice on resume
+        migration = ValueMigration('wrap', StreamFieldTestPage, 'body', [
+            WrapInList(['heading']),
+        ], batch_size=2, checkpoint=DatabaseCheckpoint())
+        self.assertEqual(migration.run(), {'scanned': 3, 'updated': 3})
+        self.assertEqual(
+            [page.body[0]['value'] for page in StreamFieldTestPage.objects.order_by('pk')],
+            [['h0'], ['h1'], ['h2'], ['h3'], ['h4']]
+        )
+
+    def test_batch_read_in_write_transaction(self):
+        from django.db import connection
+        from core.value_migrations import ValueMigration, MapValue
+
+        for i in range(3):
+            StreamFieldTestPage.objects.create(title='Page %d' % i, body=[{'type': 'heading', 'value': 'h%d' % i}])
+        in_transaction = []
+
+        def upper(heading):
+            in_transaction.append(connection.in_atomic_block)
+            return heading.upper()
+
+        migration = ValueMigration('upper', StreamFieldTestPage, 'body', [MapValue(['heading'], upper)], batch_size=2)
+        self.assertEqual(migration.run(), {'scanned': 3, 'updated': 3})
+        self.assertEqual(in_transaction, [True, True, True])
+
+    def test_transactional(self):
+        from core.value_migrations import ValueMigration, DatabaseCheckpoint
+
+        checkpoint = DatabaseCheckpoint()
+        self.assertFalse(checkpoint.transactional)
+        ValueMigration('none', StreamFieldTestPage, 'body', [], checkpoint=checkpoint).run()
+        self.assertTrue(checkpoint.transactional)
+        checkpoint = DatabaseCheckpoint(using='other')
+        checkpoint.model = StreamFieldTestPage
+        self.assertFalse(checkpoint.transactional)
+
+
+
+class TestBulkValidation(TestCase):
+    def setUp(self):
+        self.valid_page = StreamFieldTestPage.objects.create(title='Valid', body=[
+            {'type': 'heading', 'value': 'Hello'},
+        ])
+        self.invalid_page = StreamFieldTestPage.objects.create(title='Invalid', body=[
+            {'type': 'heading', 'value': 'Hello'},
+        ])
+        # store a value with a block type that is not in the definition
+        StreamFieldTestPage.objects.filter(pk=self.invalid_page.pk).update(
+            body='[{"type": "heading", "value": "Hello"}, {"type": "quote", "value": "Hi"}]'
+        )
+
+    def test_error_paths(self):
+        from django import forms
+        from django.core.exceptions import ValidationError
+        from core.blocks import StructBlock, ListBlock, FieldBlock
+        from core.bulk_validation import error_paths
+
+        block = ListBlock(StructBlock([
+            ('name', FieldBlock(forms.CharField(max_length=5))),
+            ('age', FieldBlock(forms.IntegerField())),
+        ]))
+        try:
+            block.clean([{'name': 'Bob', 'age': '42'}, {'name': 'Robert', 'age': 'x'}])
+        except ValidationError as e:
+            paths = error_paths(e)
+        self.assertEqual(paths, [
+            ((1, 'age'), ['Enter a whole number.']),
+            ((1, 'name'), ['Ensure this value has at most 5 characters (it has 6).']),
+        ])
+
+    def test_validate_field(self):
+        from core.bulk_validation import validate_field
+
+        progress = []
+        failures = list(validate_field(
+            StreamFieldTestPage, 'body', batch_size=1, processes=1, progress=lambda stats: progress.append(dict(stats))
+        ))
+        self.assertEqual(len(failures), 1)
+        pk, errors = failures[0]
+        self.assertEqual(pk, self.invalid_page.pk)
+        self.assertEqual(errors[0][0], ())
+        self.assertEqual([stats['scanned'] for stats in progress], [1, 2])
+        self.assertEqual(progress[-1]['failed'], 1)
+
+    def test_validation_cache_bypassed(self):
+        from core.bulk_validation import validate_raw_value
+        from core.validation import get_validation_cache, validation_key
+
+        field = StreamFieldTestPage._meta.get_field('body')
+        key = validation_key(field.stream_block.child_blocks['heading'], 'Hello')
+        with self.settings(BLOCK_VALIDATION_CACHE={}):
+            self.assertEqual(validate_raw_value(field, '[{"type": "heading", "value": "Hello"}]'), [])
+            self.assertFalse(get_validation_cache().get(key))
+
+            field.stream_block.clean([{'type': 'heading', 'value': 'Hello'}])
+            self.assertTrue(get_validation_cache().get(key))
+
+    def test_command_with_process_pool(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        stdout = six.StringIO()
+        self.assertRaises(
+            CommandError, call_command, 'validate_streamblocks', 'core.StreamFieldTestPage.body',
+            processes=2, batch_size=1, stdout=stdout
+        )
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith('core.StreamFieldTestPage.body %d -: ' % self.invalid_page.pk))
+        self.assertTrue(lines[1].startswith('core.StreamFieldTestPage.body: 2 rows, 1 failed'))
+        self.assertTrue(lines[1].endswith('rows/s)'))
+
+
+class TestMemberCountLimits(TestCase):
+    def test_max_num_and_min_num(self):
+        from django.core.exceptions import ValidationError
+        from core.blocks import ListBlock, StreamBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock(), max_num=2, min_num=1)
+        self.assertEqual(block.clean(['a', 'b']), ['a', 'b'])
+        self.assertRaises(ValidationError, block.clean, ['a', 'b', 'c'])
+        self.assertRaises(ValidationError, block.clean, [])
+
+        stream_block = StreamBlock([('heading', TextInputBlock())], max_num=1)
+        try:
+            stream_block.clean([{'type': 'heading', 'value': 'a'}, {'type': 'heading', 'value': 'b'}])
+        except ValidationError as e:
+            error = e
+        self.assertEqual(error.code, 'max_num')
+
+        # the error is displayed above the members
+        html = stream_block.render_form(
+            [{'type': 'heading', 'value': 'a'}, {'type': 'heading', 'value': 'b'}], prefix='content', error=error
+        )
+        self.assertTrue(html.startswith('<ul class="errorlist"><li>Ensure there are no more than 1 items (it has 2)'))
+        self.assertTrue('value="b"' in html)
+
+    def test_oversized_count_rejected_before_reading_members(self):
+        from django.core.exceptions import ValidationError
+        from core.blocks import ListBlock, TextInputBlock
+        from django.test.utils import override_settings
+        from core.instrumentation import record_timings
+
+        block = ListBlock(TextInputBlock(), max_num=5)
+        data = {'list-count': '10000000', 'list-0-value': 'a', 'list-0-deleted': '', 'list-0-order': '0'}
+        with override_settings(BLOCK_MAX_SUBMITTED_MEMBERS=1000), record_timings() as timings:
+            value = block.value_from_datadict(data, {}, 'list')
+        self.assertEqual(value, [])
+        self.assertFalse([
+            key for key in timings.stats if key[2] == 'value_from_prefix_view' and 'TextInputBlock' in key[0]
+        ])
+
+        try:
+            block.clean(value)
+        except ValidationError as e:
+            self.assertEqual(e.code, 'too_many_members')
+        else:
+            self.fail("Oversized submission was not rejected")
+
+        # deleted members count towards the budget, but not towards max_num - however many there are
+        data = {'list-count': '17'}
+        for i in range(17):
+            data.update({
+                'list-%d-value' % i: 'x', 'list-%d-deleted' % i: '1' if i < 13 else '', 'list-%d-order' % i: i,
+            })
+        with override_settings(BLOCK_MAX_SUBMITTED_MEMBERS=1000):
+            self.assertEqual(block.clean(block.value_from_datadict(data, {}, 'list')), ['x', 'x', 'x', 'x'])
+
+    def test_invalid_count(self):
+        from django.core.exceptions import ValidationError
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock())
+        for data in [{}, {'list-count': 'lots'}, {'list-count': '-1'}]:
+            value = block.value_from_datadict(data, {}, 'list')
+            self.assertRaises(ValidationError, block.clean, value)
+
+    def test_malformed_members(self):
+        from django.core.exceptions import ValidationError
+        from django.utils.datastructures import MultiValueDict
+        from core.blocks import ListBlock, StreamBlock, TextInputBlock
+
+        list_block = ListBlock(TextInputBlock())
+        stream_block = StreamBlock([('heading', TextInputBlock())])
+        for block, data, code in [
+            (list_block, {'p-count': '1', 'p-0-order': '0', 'p-0-value': 'x'}, 'invalid_deleted'),
+            (stream_block, {'p-count': '1', 'p-0-order': '0', 'p-0-type': 'heading', 'p-0-value': 'x'},
+                'invalid_deleted'),
+            (stream_block, {'p-count': '1', 'p-0-deleted': '', 'p-0-order': '0', 'p-0-value': 'x'}, 'invalid_type'),
+            (stream_block, {'p-count': '1', 'p-0-deleted': '', 'p-0-order': '0', 'p-0-type': 'quote'},
+                'invalid_type'),
+            (stream_block, MultiValueDict({'p-count': ['1'], 'p-0-deleted': [''], 'p-0-order': ['0'], 'p-0-type': []}),
+                'invalid_type'),
+            (stream_block, {'p-members': 'm0', 'p-0-type': 'quote', 'p-0-value': 'x'}, 'invalid_type'),
+        ]:
+            value = block.value_from_datadict(data, {}, 'p')
+            with self.assertRaises(ValidationError) as cm:
+                block.clean(value)
+            self.assertEqual(cm.exception.code, code)
+
+    def test_member_budget(self):
+        from django.core.exceptions import ValidationError
+        from django.test.utils import override_settings
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(ListBlock(TextInputBlock()))
+        data = {'list-count': '2'}
+        for i in range(2):
+            data.update({'list-%d-deleted' % i: '', 'list-%d-order' % i: i, 'list-%d-value-count' % i: '3'})
+            for j in range(3):
+                data.update({
+                    'list-%d-value-%d-value' % (i, j): 'x', 'list-%d-value-%d-deleted' % (i, j): '',
+                    'list-%d-value-%d-order' % (i, j): j,
+                })
+
+        with override_settings(BLOCK_MAX_SUBMITTED_MEMBERS=8):
+            self.assertEqual(len(block.clean(block.value_from_datadict(data, {}, 'list'))), 2)
+
+        with override_settings(BLOCK_MAX_SUBMITTED_MEMBERS=7):
+            value = block.value_from_datadict(data, {}, 'list')
+            try:
+                block.clean(value)
+            except ValidationError as e:
+                self.assertEqual(e.params[0], None)
+                self.assertEqual(e.params[1].code, 'too_many_members')
+            else:
+                self.fail("Submission over the member budget was not rejected")
+
+
+class TestWindowedEditing(TestCase):
+    def get_post_data(self, html):
+        from core.benchmarks import form_data
+        return form_data(html)
+
+    def test_render_form(self):
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock(), window_size=3)
+        value = ['item %d' % i for i in range(10)]
+        html = block.render_form(value, prefix='list')
+
+        self.assertEqual(html.count('class="unloaded-member"'), 7)
+        self.assertTrue('value="item 2"' in html)
+        self.assertFalse('value="item 3"' in html)
+        self.assertTrue('<input type="hidden" name="list-count" id="list-count" value="10">' in html)
+
+        # short values, and forms with errors, are rendered in full
+        self.assertFalse('unloaded-member' in block.render_form(value[:3], prefix='list'))
+
+    def test_untouched_members_restored_from_stored_value(self):
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock(), window_size=3)
+        stored = ['item %d' % i for i in range(12)]
+        data = self.get_post_data(block.render_form(stored, prefix='list'))
+
+        # edit a loaded member, delete an unloaded one, and move another to the start
+        data['list-1-value'] = 'edited'
+        data['list-5-deleted'] = '1'
+        for i in range(11):
+            data['list-%d-order' % i] = str(i + 1)
+        data['list-11-order'] = '0'
+
+        self.assertEqual(block.value_from_datadict(data, {}, 'list', stored=stored), [
+            'item 11', 'item 0', 'edited', 'item 2', 'item 3', 'item 4', 'item 6', 'item 7', 'item 8', 'item 9',
+            'item 10',
+        ])
+
+        # without the stored value, unloaded members can't be restored
+        from django.core.exceptions import ValidationError
+        value = block.value_from_datadict(data, {}, 'list')
+        self.assertRaises(ValidationError, block.clean, value)
+
+    def test_nested_stream(self):
+        from core.blocks import StreamBlock, StructBlock, ListBlock, TextInputBlock
+
+        block = StructBlock([
+            ('content', StreamBlock([
+                ('heading', TextInputBlock()),
+                ('tags', ListBlock(TextInputBlock(), window_size=1)),
+            ], window_size=2)),
+        ])
+        stored = {'content': [
+            {'type': 'tags', 'value': ['a', 'b', 'c']},
+            {'type': 'heading', 'value': 'Hello'},
+            {'type': 'heading', 'value': 'World'},
+        ]}
+        data = self.get_post_data(block.render_form(stored, prefix='page'))
+        self.assertFalse('page-content-2-value' in data)
+        self.assertFalse('page-content-0-value-1-value' in data)
+
+        value = block.value_from_datadict(data, {}, 'page', stored=stored)
+        self.assertEqual(block.clean(value), stored)
+
+    def test_stale_stored_value_rejected(self):
+        from django.core.exceptions import ValidationError
+        from core.blocks import StreamBlock, TextInputBlock
+
+        block = StreamBlock([('heading', TextInputBlock())], window_size=1)
+        stored = [{'type': 'heading', 'value': 'h%d' % i} for i in range(3)]
+        data = self.get_post_data(block.render_form(stored, prefix='page'))
+        self.assertEqual(block.clean(block.value_from_datadict(data, {}, 'page', stored=stored)), stored)
+
+        # a member has been removed from the stored value since the form was rendered
+        value = block.value_from_datadict(data, {}, 'page', stored=stored[1:])
+        with self.assertRaises(ValidationError) as cm:
+            block.clean(value)
+        self.assertEqual(cm.exception.code, 'stale_stored_value')
+
+    def test_nested_lists_rendered_in_full_after_errors(self):
+        from django import forms
+        from django.core.exceptions import ValidationError
+        from core.blocks import ListBlock, StructBlock, FieldBlock, TextInputBlock
+
+        block = ListBlock(StructBlock([
+            ('name', FieldBlock(forms.CharField())),
+            ('tags', ListBlock(TextInputBlock(), window_size=1)),
+        ]))
+        stored = [{'name': 'Tim', 'tags': ['a', 'b', 'c']}]
+        data = self.get_post_data(block.render_form(stored, prefix='page'))
+        data['page-0-value-name'] = ''
+
+        value = block.value_from_datadict(data, {}, 'page', stored=stored)
+        with self.assertRaises(ValidationError) as cm:
+            block.clean(value)
+        # the tags have no errors of their own, but are now part of a submitted value rather than the stored one
+        html = block.bind(value, 'page', error=cm.exception, from_stored=False).render_form()
+        self.assertFalse('unloaded-member' in html)
+        self.assertFalse('page-0-value-tags-version' in html)
+        self.assertTrue('<input type="hidden" id="page-0-value-tags-1-id" name="page-0-value-tags-1-id" value="">'
+            in html)
+
+        data = self.get_post_data(html)
+        data['page-0-value-name'] = 'Tim B-L'
+        value = block.value_from_datadict(data, {}, 'page', stored=stored)
+        self.assertEqual(block.clean(value), [{'name': 'Tim B-L', 'tags': ['a', 'b', 'c']}])
+
+    def test_members_view(self):
+        import json
+        from django.http import Http404
+        from django.test.client import RequestFactory
+        from core.blocks import StructBlock, ListBlock, TextInputBlock
+        from core.views import members_response
+
+        block = StructBlock([('tags', ListBlock(TextInputBlock(), window_size=2))])
+        value = {'tags': ['a', 'b', 'c', 'd', 'e']}
+        version = self.get_post_data(block.render_form(value, prefix='page'))['page-tags-version']
+        factory = RequestFactory()
+
+        response = members_response(
+            factory.get('/', {'prefix': 'page-tags', 'start': '2', 'version': version}), block, value, 'page'
+        )
+        members = json.loads(response.content.decode('utf-8'))['members']
+        self.assertEqual([member['index'] for member in members], [2, 3])
+        self.assertTrue('id="page-tags-3-container"' in members[1]['html'])
+        self.assertTrue('value="d"' in members[1]['html'])
+
+        # the stored value has changed since the form was rendered
+        changed_value = {'tags': ['a', 'c', 'd', 'e']}
+        response = members_response(
+            factory.get('/', {'prefix': 'page-tags', 'start': '2', 'version': version}), block, changed_value, 'page'
+        )
+        self.assertEqual(response.status_code, 409)
+
+        for params in [{'prefix': 'page', 'start': '0'}, {'prefix': 'page-tags'}, {'prefix': 'page-x', 'start': '0'}]:
+            self.assertRaises(Http404, members_response, factory.get('/', params), block, value, 'page')
+
+    def test_resolve_prefix(self):
+        from core.prefixes import resolve_prefix
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        block, value = resolve_prefix(PAGE_DEF, PAGE_DATA, 'page', 'page-speakers-0-value-nicknames')
+        self.assertEqual(block, PAGE_DEF.child_blocks['speakers'].child_block.child_blocks['nicknames'])
+        self.assertEqual(value, ['Timmy', 'Bernie'])
+
+        block, value = resolve_prefix(PAGE_DEF, PAGE_DATA, 'page', 'page-content-1-value')
+        self.assertEqual(block, PAGE_DEF.child_blocks['content'].child_blocks['image'])
+        self.assertEqual(value, 42)
+
+        for prefix in ['pages', 'page-author', 'page-speakers-5-value', 'page-speakers-0', 'page-title-x']:
+            self.assertRaises(LookupError, resolve_prefix, PAGE_DEF, PAGE_DATA, 'page', prefix)
+
+    def test_members_reordered_numerically(self):
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock())
+        value = ['item %d' % i for i in range(12)]
+        data = self.get_post_data(block.render_form(value, prefix='list'))
+        self.assertEqual(block.value_from_datadict(data, {}, 'list', stored=value), value)
+
+
+class TestSubtreeRendering(TestCase):
+    def test_render_subtree(self):
+        from core.prefixes import render_subtree_form
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        html = render_subtree_form(PAGE_DEF, PAGE_DATA, 'page', 'page-speakers-1-value')
+        self.assertTrue('id="page-speakers-1-value-name"' in html)
+        self.assertTrue('value="Bono"' in html)
+        self.assertFalse('Tim Berners-Lee' in html)
+
+        # the same HTML as in the full form
+        self.assertTrue(html in PAGE_DEF.render_form(PAGE_DATA, 'page'))
+
+    def test_cost_proportional_to_subtree(self):
+        from core.instrumentation import record_timings
+        from core.prefixes import render_subtree_form
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        with record_timings() as timings:
+            render_subtree_form(PAGE_DEF, PAGE_DATA, 'page', 'page-content-0-value')
+        render_form_calls = sum(
+            stats[1] for (key, stats) in timings.stats.items() if key[2] == 'render_form'
+        )
+        self.assertEqual(render_form_calls, 1)
+
+    def test_submitted_subtree_with_errors(self):
+        from core.prefixes import render_subtree_form
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        data = {
+            'page-speakers-0-value-name': '',
+            'page-speakers-0-value-job_title': 'Web developer',
+            'page-speakers-0-value-nicknames-count': '0',
+        }
+        html = render_subtree_form(PAGE_DEF, PAGE_DATA, 'page', 'page-speakers-0-value', data=data)
+        self.assertTrue('This field is required.' in html)
+        self.assertTrue('value="Web developer"' in html)
+
+    def test_fragment_view(self):
+        from django.core.urlresolvers import reverse
+
+        response = self.client.get(reverse('edit_fragment'), {'prefix': 'page-content-2-value'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b'Earlyish Bird tickets available now' in response.content)
+
+        response = self.client.get(reverse('edit_fragment'), {'prefix': 'page-content-9-value'})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestDeltaSubmissions(TestCase):
+    def test_member_ids(self):
+        from django.core.exceptions import ValidationError
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock(), max_num=1)
+        html = block.render_form(['a', 'b'], prefix='list')
+        self.assertTrue('<input type="hidden" id="list-1-id" name="list-1-id" value="1">' in html)
+        self.assertTrue('name="__PREFIX__-id" value=""' in block.new_member_templates()['child'])
+
+        # forms with errors are not rendered from the stored value, so their members have no ids
+        try:
+            block.clean(['a', 'b'])
+        except ValidationError as e:
+            html = block.render_form(['a', 'b'], prefix='list', error=e)
+        self.assertTrue('<input type="hidden" id="list-1-id" name="list-1-id" value="">' in html)
+
+    def test_delta(self):
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock())
+        stored = ['a', 'b', 'c', 'd']
+        # 'b' deleted, 'c' edited and moved to the start, and a new item added at the end
+        data = {
+            'list-version': block.stored_version(stored),
+            'list-members': 'm2,s0,s3,m4',
+            'list-2-id': '2', 'list-2-value': 'C',
+            'list-4-id': '', 'list-4-value': 'e',
+        }
+        self.assertEqual(block.value_from_datadict(data, {}, 'list', stored=stored), ['C', 'a', 'd', 'e'])
+
+        self.assertEqual(block.value_from_datadict({'list-members': ''}, {}, 'list', stored=stored), [])
+        # new members only, as submitted by a form that was not rendered from the stored value
+        self.assertEqual(
+            block.value_from_datadict({'list-members': 'm0', 'list-0-value': 'x'}, {}, 'list', stored=stored), ['x']
+        )
+
+    def test_stale_stored_value(self):
+        from django.core.exceptions import ValidationError
+        from core.blocks import ListBlock, StreamBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock())
+        rendered = ['one', 'two']
+        self.assertTrue(
+            'name="list-version" value="%s"' % block.stored_version(rendered) in block.render_form(rendered, 'list')
+        )
+
+        # the stored value has had an item inserted at the start since the form was rendered, so 's1' would now
+        # refer to 'one' rather than 'two'
+        stored = ['zero', 'one', 'two']
+        version = block.stored_version(rendered)
+        for data in [
+            {'list-version': version, 'list-members': 's1'},
+            {'list-version': version, 'list-members': 'm0', 'list-0-id': '1', 'list-0-value': 'TWO'},
+            {'list-version': version, 'list-count': '1', 'list-0-deleted': '', 'list-0-order': '0',
+                'list-0-id': '1', 'list-0-value': 'TWO'},
+            # a submission referring to stored members must say which version of the stored value it refers to
+            {'list-members': 's1'},
+            {'list-members': 'm0', 'list-0-id': '1', 'list-0-value': 'TWO'},
+            {'list-count': '1', 'list-0-deleted': '', 'list-0-order': '0', 'list-0-stored': '1'},
+        ]:
+            value = block.value_from_datadict(data, {}, 'list', stored=stored)
+            with self.assertRaises(ValidationError) as cm:
+                block.clean(value)
+            self.assertEqual(cm.exception.code, 'stale_stored_value')
+
+        block = StreamBlock([('heading', TextInputBlock())])
+        rendered = [{'type': 'heading', 'value': 'one'}, {'type': 'heading', 'value': 'two'}]
+        stored = [{'type': 'heading', 'value': 'zero'}] + rendered
+        for data in [
+            {'p-version': block.stored_version(rendered), 'p-members': 's1'},
+            {'p-members': 'm0', 'p-0-id': '1', 'p-0-type': 'heading', 'p-0-value': 'TWO'},
+        ]:
+            value = block.value_from_datadict(data, {}, 'p', stored=stored)
+            with self.assertRaises(ValidationError) as cm:
+                block.clean(value)
+            self.assertEqual(cm.exception.code, 'stale_stored_value')
+
+    def test_nested_delta(self):
+        from core.blocks import StreamBlock, StructBlock, ListBlock, TextInputBlock
+
+        block = StreamBlock([
+            ('heading', TextInputBlock()),
+            ('speaker', StructBlock([('name', TextInputBlock()), ('nicknames', ListBlock(TextInputBlock()))])),
+        ])
+        stored = [
+            {'type': 'heading', 'value': 'Speakers'},
+            {'type': 'speaker', 'value': {'name': 'Tim', 'nicknames': ['Timmy', 'Bernie']}},
+        ]
+        # a nickname added to the speaker; the heading and the speaker's other fields are unchanged
+        data = {
+            'page-version': block.stored_version(stored),
+            'page-members': 's0,m1',
+            'page-1-id': '1', 'page-1-type': 'speaker',
+            'page-1-value-name': 'Tim',
+            'page-1-value-nicknames-version':
+                block.child_blocks['speaker'].child_blocks['nicknames'].stored_version(['Timmy', 'Bernie']),
+            'page-1-value-nicknames-members': 's1,m2',
+            'page-1-value-nicknames-2-value': 'TBL',
+        }
+        value = block.value_from_datadict(data, {}, 'page', stored=stored)
+        self.assertEqual(block.clean(value), [
+            {'type': 'heading', 'value': 'Speakers'},
+            {'type': 'speaker', 'value': {'name': 'Tim', 'nicknames': ['Bernie', 'TBL']}},
+        ])
+
+    def test_nested_deletion(self):
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(ListBlock(TextInputBlock()))
+        stored = [['a', 'b'], ['c', 'd'], ['e', 'f']]
+        # 'c' deleted: the enclosing member is submitted as changed (see core/jstests/handler_count.js),
+        # with the nested list as a delta of its own
+        data = {
+            'page-version': block.stored_version(stored),
+            'page-members': 's0,m1,s2',
+            'page-1-id': '1',
+            'page-1-value-version': block.child_block.stored_version(['c', 'd']),
+            'page-1-value-members': 's1',
+        }
+        value = block.value_from_datadict(data, {}, 'page', stored=stored)
+        self.assertEqual(block.clean(value), [['a', 'b'], ['d'], ['e', 'f']])
+
+    def test_edit_view_with_errors(self):
+        from core.views import PAGE_DEF, PAGE_DATA
+
+        # the speakers and content are unchanged, but the (required) title has been cleared
+        response = self.client.post('/edit/', {
+            'page-title': '',
+            'page-speakers-version': PAGE_DEF.child_blocks['speakers'].stored_version(PAGE_DATA['speakers']),
+            'page-speakers-members': 's0,s1',
+            'page-content-version': PAGE_DEF.child_blocks['content'].stored_version(PAGE_DATA['content']),
+            'page-content-members': 's0,s1,s2,s3',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'This field is required.')
+        self.assertContains(response, 'Tim Berners-Lee')
+
+    def test_invalid_delta(self):
+        from django.core.exceptions import ValidationError
+        from core.blocks import ListBlock, TextInputBlock
+
+        block = ListBlock(TextInputBlock(), max_num=2)
+        stored = ['a', 'b']
+        for members, code in [
+            ('s0,x1', 'invalid_members'), ('s-1', 'invalid_members'), ('s0,,s1', 'invalid_members'),
+            ('s2', 'invalid_stored_member'), ('s0,s1,s0,s1,s0', 'max_num'),
+        ]:
+            data = {'list-version': block.stored_version(stored), 'list-members': members}
+            value = block.value_from_datadict(data, {}, 'list', stored=stored)
+            with self.assertRaises(ValidationError) as cm:
+                block.clean(value)
+            self.assertEqual(cm.exception.code, code)
+
+
+class TestLazyInitialization(TestCase):
+    def test_js_initializer(self):
+        from core.blocks import StreamBlock, ListBlock, TextInputBlock
+
+        self.assertFalse('lazy' in ListBlock(TextInputBlock()).js_initializer())
+        self.assertTrue("'lazy': (true)" in ListBlock(TextInputBlock(), lazy_initialization=True).js_initializer())
+        self.assertTrue(
+            "'lazy': (true)" in StreamBlock([('heading', TextInputBlock())], lazy_initialization=True).js_initializer()
+        )
+
+    def test_js_handlers(self):
+        import os
+        import subprocess
+        from distutils.spawn import find_executable
+
+        node = find_executable('node') or find_executable('nodejs')
+        if not node:
+            raise unittest.SkipTest("node is required to run the JS tests")
+
+        script = os.path.join(os.path.dirname(__file__), 'jstests', 'handler_count.js')
+        process = subprocess.Popen([node, script], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        self.assertEqual(process.returncode, 0, output.decode('utf-8'))
@@ -0,0 +1,111 @@
+"""
+Incremental validation: list and stream members that are unchanged since they were last validated are not
+cleaned again.
+
+Each member is identified by a fingerprint of its child block definition and its content. Whenever a member
+is cleaned successfully, the fingerprint of the cleaned value is recorded; a later submission of a member
+with the same fingerprint - such as an untouched member of a saved value being resubmitted from the editing
+form - is therefore known to be clean already, and is returned as-is without calling the child block's clean.
+Members that have been edited (or whose submitted form differs from their cleaned form, e.g. '5' for 5) or
+can't be fingerprinted, and all members after a change to the block definition, are validated in full.
+
+Fingerprints are computed on the server from the submitted content, not taken from the submitted form data,
+so a client can't cause an unvalidated value to be accepted. They distinguish the exact types within the
+value (see core.fragment_cache.typed_value), so a submitted string is never taken for the date, Decimal
+and so on that it cleans to. This assumes that a block's clean method only depends on the value, and
+returns values that it would itself accept unchanged.
+
+Known-clean fingerprints are held in an in-process LRU cache only, configured through the
+BLOCK_VALIDATION_CACHE setting:
+
+    BLOCK_VALIDATION_CACHE = {
+        'MAX_ENTRIES': 10000,  # maximum number of fingerprints to hold
+        'TIMEOUT': 86400,  # expiry time, in seconds
+    }
+
+There is no shared tier: a block definition's fingerprint covers its configuration, but not the code of its
+clean method or of its fields' validators, so entries recorded by one deployment could not be trusted by
+the next. The in-process cache starts empty whenever new code is loaded.
+
+If BLOCK_VALIDATION_CACHE is not set (or None), every member is validated on every submission. Code that
+must validate in full regardless, such as core.bulk_validation, does so within full_validation().
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.signals import setting_changed
+
+from core.fragment_cache import FragmentCache, value_fingerprint
+
+
+_validation_cache = None
+_state = threading.local()
+
+
+def get_validation_cache():
+    """
+    Return the FragmentCache instance (with only its in-process tier) holding known-clean member
+    fingerprints, as configured by the BLOCK_VALIDATION_CACHE setting, or None if incremental validation
+    is disabled (or bypassed by full_validation).
+    """
+    global _validation_cache
+    if getattr(_state, 'full_validation', False):
+        return None
+    if _validation_cache is None:
+        config = getattr(settings, 'BLOCK_VALIDATION_CACHE', None)
+        if config is None:
+            return None
+        _validation_cache = FragmentCache(
+            max_entries=config.get('MAX_ENTRIES', 10000),
+            timeout=config.get('TIMEOUT', 86400),
+        )
+    return _validation_cache
+
+
+def reset_validation_cache(**kwargs):
+    global _validation_cache
+    if kwargs.get('setting', 'BLOCK_VALIDATION_CACHE') == 'BLOCK_VALIDATION_CACHE':
+        _validation_cache = None
+
+setting_changed.connect(reset_validation_cache)
+
+
+@contextmanager
+def full_validation():
+    """Context manager within which get_validation_cache returns None on this thread"""
+    previous = getattr(_state, 'full_validation', False)
+    _state.full_validation = True
+    try:
+        yield
+    finally:
+        _state.full_validation = previous
+
+
+def validation_key(block, value):
+    fingerprint = value_fingerprint(block, value)
+    if fingerprint is None:
+        return None
+    return 'blockvalid:%s' % fingerprint
+
+
+def clean_member(block, value, cache):
+    """
+    Return block.clean(value), or 'value' itself if it is known to be clean according to 'cache'
+    (the result of get_validation_cache(), which may be None to always clean in full).
+    Raises ValidationError if validation fails, as per block.clean.
+    """
+    if cache is None:
+        return block.clean(value)
+
+    key = validation_key(block, value)
+    if key is not None and cache.get(key):
+        return value
+
+    cleaned_value = block.clean(value)
+
+    if cleaned_value is not value:
+        key = validation_key(block, cleaned_value)
+    if key is not None:
+        cache.set(key, True)
+    return cleaned_value
@@ -0,0 +1,341 @@
+"""
+Rewriting of stored block values after a change to a block definition - e.g. renaming a struct child,
+dropping a stream block type, or changing the value format of a child block.
+
+A ValueMigration applies a list of operations to every value of one model field, in batches:
+
+    migration = ValueMigration('rename-speaker-image', Page, 'body', [
+        RenameChild(['speaker'], 'image', 'photo'),
+        RemoveType([], 'advert'),
+        MapValue(['heading'], lambda value: value.strip()),
+    ], checkpoint=DatabaseCheckpoint())
+    migration.run()
+
+Operations address a location within the value by a path, from the root of the field's value: in a stream,
+a path segment selects the members of that block type; in a struct, the child of that name; in a list,
+the segment '*' selects every item. The operations are compiled into a single function over the decoded
+JSON, so each row is decoded, transformed and encoded once.
+
+Rows are read in primary key order, a batch at a time, with each batch a separate bounded query (keyset
+pagination) rather than one long-running cursor, and only rows whose value has changed are written back -
+with one UPDATE statement per batch. Each batch is read (with SELECT ... FOR UPDATE, where the database
+supports it) and written in one transaction, so a value saved by someone else in the meantime is not
+overwritten. The last primary key processed is saved to the checkpoint along with each batch, so an
+interrupted migration resumes from where it left off when run again. With a DatabaseCheckpoint in the same
+database as the model, the checkpoint is written in the batch's transaction, so a batch is never applied
+twice. Other checkpoints are saved after the batch is committed, so a crash in between means that the batch
+is migrated again on resume - which is only safe if all of the operations are idempotent (as WrapInList, for
+one, is not).
+"""
+import json
+
+from django.db import connections, router, transaction
+
+from core.values import BlockJSONEncoder
+
+
+# Operations
+
+class Operation(object):
+    """
+    Base class for operations on block values. Subclasses implement transform, which receives the
+    (decoded JSON) value at 'path' and returns the new value.
+    """
+    def __init__(self, path):
+        self.path = list(path)
+
+    def transform(self, value):
+        raise NotImplementedError('%s.transform' % self.__class__)
+
+    def compile(self):
+        """Return a function taking a whole field value and returning the transformed version"""
+        return compile_path(self.path, self.transform)
+
+
+def compile_path(path, func):
+    """
+    Return a function that applies 'func' to the part(s) of a value located by 'path' (as described above),
+    returning the new value. Values are not modified in place.
+    """
+    if not path:
+        return func
+
+    segment = path[0]
+    apply_rest = compile_path(path[1:], func)
+
+    if segment == '*':
+        def apply_to_items(value):
+            if not isinstance(value, list):
+                return value
+            return [apply_rest(item) for item in value]
+        return apply_to_items
+
+    def apply_to_child(value):
+        if isinstance(value, dict):
+            # struct value
+            if segment not in value:
+                return value
+            value = dict(value)
+            value[segment] = apply_rest(value[segment])
+            return value
+        elif isinstance(value, list):
+            # stream value
+            return [
+                dict(member, value=apply_rest(member.get('value'))) if member.get('type') == segment else member
+                for member in value
+            ]
+        return value
+    return apply_to_child
+
+
+class RenameChild(Operation):
+    """Rename the child 'old_name' of the struct value(s) at 'path' - or the block type, for a stream"""
+    def __init__(self, path, old_name, new_name):
+        super(RenameChild, self).__init__(path)
+        self.old_name = old_name
+        self.new_name = new_name
+
+    def transform(self, value):
+        if isinstance(value, dict):
+            if self.old_name not in value:
+                return value
+            value = dict(value)
+            value[self.new_name] = value.pop(self.old_name)
+            return value
+        elif isinstance(value, list):
+            return [
+                dict(member, type=self.new_name) if member.get('type') == self.old_name else member
+                for member in value
+            ]
+        return value
+
+
+class RemoveType(Operation):
+    """Remove all members of type 'type_name' from the stream value(s) at 'path' (or that child, for a struct)"""
+    def __init__(self, path, type_name):
+        super(RemoveType, self).__init__(path)
+        self.type_name = type_name
+
+    def transform(self, value):
+        if isinstance(value, dict):
+            value = dict(value)
+            value.pop(self.type_name, None)
+            return value
+        elif isinstance(value, list):
+            return [member for member in value if member.get('type') != self.type_name]
+        return value
+
+
+class MapValue(Operation):
+    """Replace the value(s) at 'path' with the result of passing them to 'func'"""
+    def __init__(self, path, func):
+        super(MapValue, self).__init__(path)
+        self.func = func
+
+    def transform(self, value):
+        return self.func(value)
+
+
+class WrapInList(Operation):
+    """
+    Replace the value(s) at 'path' with a single-item list containing it - e.g. when a block becomes a ListBlock.
+    Not idempotent, so only to be resumed from a DatabaseCheckpoint.
+    """
+    def transform(self, value):
+        return [value]
+
+
+def compile_operations(operations):
+    """Return a function applying all of 'operations', in order, to a field value"""
+    functions = [operation.compile() for operation in operations]
+
+    def apply_operations(value):
+        for func in functions:
+            value = func(value)
+        return value
+    return apply_operations
+
+
+# Checkpoints
+
+class Checkpoint(object):
+    """
+    Records the progress of value migrations, as the last primary key processed for each migration name.
+    This base class keeps it in memory only; subclasses persist it.
+    """
+    # whether save() writes to the database of 'model', and so can be part of the transaction writing a batch
+    transactional = False
+    # the model whose values are being migrated - set by ValueMigration.run
+    model = None
+
+    def __init__(self):
+        self.positions = {}
+
+    def load(self, name):
+        return self.positions.get(name)
+
+    def save(self, name, last_pk):
+        self.positions[name] = last_pk
+
+
+class FileCheckpoint(Checkpoint):
+    """
+    Records progress in a JSON file at 'path'. This is saved after each batch is committed, rather than with
+    it, so should only be used for migrations whose operations are idempotent.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def load(self, name):
+        return self.read().get(name)
+
+    def save(self, name, last_pk):
+        positions = self.read()
+        positions[name] = last_pk
+        with open(self.path, 'w') as f:
+            json.dump(positions, f)
+
+
+class DatabaseCheckpoint(Checkpoint):
+    """
+    Records progress in the ValueMigrationCheckpoint table of the database 'using' (by default, the one that
+    the router picks for that model). When that is the database of the model being migrated, the checkpoint
+    is saved in the same transaction as each batch.
+    """
+    def __init__(self, using=None):
+        self.using = using
+
+    @property
+    def db_alias(self):
+        from core.models import ValueMigrationCheckpoint
+        return self.using or router.db_for_write(ValueMigrationCheckpoint)
+
+    @property
+    def transactional(self):
+        return self.model is not None and self.db_alias == router.db_for_write(self.model)
+
+    def queryset(self):
+        from core.models import ValueMigrationCheckpoint
+        return ValueMigrationCheckpoint._default_manager.using(self.db_alias)
+
+    def load(self, name):
+        raw_last_pk = self.queryset().filter(name=name).values_list('last_pk', flat=True).first()
+        return json.loads(raw_last_pk) if raw_last_pk is not None else None
+
+    def save(self, name, last_pk):
+        self.queryset().update_or_create(name=name, defaults={'last_pk': json.dumps(last_pk)})
+
+
+# Migration engine
+
+def raw_value_batch(queryset, field_name, batch_size, after_pk=None):
+    """
+    Return a list of up to 'batch_size' (pk, stored JSON) pairs for the 'field_name' field of the instances
+    in 'queryset' with a primary key greater than 'after_pk', in primary key order.
+    """
+    attname = queryset.model._meta.get_field(field_name).attname
+    queryset = queryset.order_by('pk')
+    if after_pk is not None:
+        queryset = queryset.filter(pk__gt=after_pk)
+    return list(queryset.values_list('pk', attname)[:batch_size])
+
+
+def raw_value_batches(model, field_name, batch_size, after_pk=None):
+    """
+    Yield lists of up to 'batch_size' (pk, stored JSON) pairs for the 'field_name' field of all 'model'
+    instances with a primary key greater than 'after_pk', in primary key order. Each batch is fetched by its
+    own query, starting after the last primary key of the previous batch.
+    """
+    while True:
+        rows = raw_value_batch(model._default_manager.all(), field_name, batch_size, after_pk)
+        if not rows:
+            return
+        yield rows
+        after_pk = rows[-1][0]
+
+
+class ValueMigration(object):
+    def __init__(self, name, model, field_name, operations, batch_size=1000, checkpoint=None):
+        self.name = name
+        self.model = model
+        self.field = model._meta.get_field(field_name)
+        self.transform = compile_operations(operations)
+        self.batch_size = batch_size
+        self.checkpoint = checkpoint if checkpoint is not None else Checkpoint()
+
+    def migrate_value(self, raw_value):
+        """Return the migrated version of the stored JSON 'raw_value', or None if it is unchanged"""
+        if not raw_value:
+            return None
+        value = json.loads(raw_value)
+        new_value = self.transform(value)
+        if new_value == value:
+            return None
+        return json.dumps(new_value, cls=BlockJSONEncoder)
+
+    def write_batch(self, updates):
+        """Write the (pk, new raw value) pairs in 'updates' back to the database, in one UPDATE statement"""
+        db_alias = router.db_for_write(self.model)
+        connection = connections[db_alias]
+        quote_name = connection.ops.quote_name
+
+        pk_column = quote_name(self.model._meta.pk.column)
+        sql = 'UPDATE %s SET %s = CASE %s END WHERE %s IN (%s)' % (
+            quote_name(self.model._meta.db_table), quote_name(self.field.column),
+            ' '.join(['WHEN %s = %%s THEN %%s' % pk_column] * len(updates)),
+            pk_column, ', '.join(['%s'] * len(updates))
+        )
+        params = []
+        for pk, raw_value in updates:
+            params += [pk, raw_value]
+        params += [pk for (pk, raw_value) in updates]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def run(self, progress=None):
+        """
+        Migrate all rows after the checkpointed position. Returns a dict of the number of rows 'scanned' and
+        'updated' in this run. 'progress', if given, is called with the same dict after each batch.
+        """
+        stats = {'scanned': 0, 'updated': 0}
+        self.checkpoint.model = self.model
+        last_pk = self.checkpoint.load(self.name)
+        db_alias = router.db_for_write(self.model)
+        queryset = self.model._default_manager.using(db_alias).select_for_update()
+
+        while True:
+            # the batch is read, locking its rows, and written in one transaction (or savepoint, if run within
+            # a transaction, so that a failing operation doesn't break the caller's transaction)
+            with transaction.atomic(using=db_alias):
+                rows = raw_value_batch(queryset, self.field.name, self.batch_size, last_pk)
+                if not rows:
+                    break
+
+                updates = []
+                for pk, raw_value in rows:
+                    new_raw_value = self.migrate_value(raw_value)
+                    if new_raw_value is not None:
+                        updates.append((pk, new_raw_value))
+
+                last_pk = rows[-1][0]
+                if updates:
+                    self.write_batch(updates)
+                if self.checkpoint.transactional:
+                    self.checkpoint.save(self.name, last_pk)
+            if not self.checkpoint.transactional:
+                self.checkpoint.save(self.name, last_pk)
+
+            stats['scanned'] += len(rows)
+            stats['updated'] += len(updates)
+            if progress:
+                progress(stats)
+
+        return stats
@@ -0,0 +1,103 @@
+"""
+Compact value types for block values.
+"""
+from array import array
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class StreamValue(object):
+    """
+    The value of a StreamBlock, held as parallel arrays of block types (as indexes into the block_types
+    tuple, which is shared by all values of the same StreamBlock) and values, rather than as a list of
+    {'type': ..., 'value': ...} dicts.
+
+    For compatibility, this also behaves as a read-only sequence of such dicts (constructed on access),
+    and compares equal to the equivalent list. Code that only needs the types and values should
+    use items() to avoid those allocations.
+    """
+    __slots__ = ['block_types', 'type_indexes', 'values']
+
+    def __init__(self, block_types, type_indexes=None, values=None):
+        self.block_types = block_types
+        self.type_indexes = type_indexes if type_indexes is not None else array('H')
+        self.values = values if values is not None else []
+
+    @classmethod
+    def from_items(cls, block_types, items, type_index_lookup=None):
+        """
+        Construct a StreamValue from an iterable of (block type name, value) pairs
+        """
+        if type_index_lookup is None:
+            type_index_lookup = dict((name, i) for (i, name) in enumerate(block_types))
+
+        stream_value = cls(block_types)
+        type_indexes = stream_value.type_indexes
+        values = stream_value.values
+        for block_type, value in items:
+            type_indexes.append(type_index_lookup[block_type])
+            values.append(value)
+        return stream_value
+
+    def items(self):
+        """Return a list of (block type name, value) pairs"""
+        block_types = self.block_types
+        return [(block_types[i], value) for (i, value) in zip(self.type_indexes, self.values)]
+
+    def get_block_type(self, index):
+        return self.block_types[self.type_indexes[index]]
+
+    def as_list(self):
+        """Return the value in its list-of-dicts form"""
+        return [{'type': block_type, 'value': value} for (block_type, value) in self.items()]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.as_list()[index]
+        return {'type': self.get_block_type(index), 'value': self.values[index]}
+
+    def __iter__(self):
+        for block_type, value in self.items():
+            yield {'type': block_type, 'value': value}
+
+    def __eq__(self, other):
+        if isinstance(other, StreamValue):
+            return self.items() == other.items()
+        if isinstance(other, list):
+            return self.as_list() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __reduce__(self):
+        return (StreamValue, (self.block_types, self.type_indexes, self.values))
+
+    def __repr__(self):
+        return 'StreamValue(%r)' % self.as_list()
+
+
+def stream_items(value):
+    """
+    Return the (block type name, value) pairs of a stream value, which may be either a StreamValue or a
+    list of {'type': ..., 'value': ...} dicts
+    """
+    if isinstance(value, StreamValue):
+        return value.items()
+    return [(item['type'], item['value']) for item in value]
+
+
+class BlockJSONEncoder(DjangoJSONEncoder):
+    """JSON encoder that also understands StreamValues (encoded in their list-of-dicts form)"""
+    def default(self, o):
+        if isinstance(o, StreamValue):
+            return o.as_list()
+        return super(BlockJSONEncoder, self).default(o)
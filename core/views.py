@@ -1,9 +1,17 @@
 from django.shortcuts import render
 from django import forms
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse, Http404
 from django.core.exceptions import ValidationError
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 
-from core.blocks import TextInputBlock, ChooserBlock, StructBlock, ListBlock, StreamBlock, FieldBlock
+from core.blocks import (
+    TextInputBlock, ChooserBlock, StructBlock, ListBlock, StreamBlock, FieldBlock, get_block_definition,
+    register_root_definition
+)
+from core.streaming import stream_template
+from core.prefixes import resolve_prefix, render_subtree_form
+from core.instrumentation import is_recording
 
 class SpeakerBlock(StructBlock):
     name = FieldBlock(forms.CharField(), label='Full name')
@@ -22,13 +30,13 @@ class ExpertSpeakerBlock(SpeakerBlock):
     image = None
     specialist_subject = TextInputBlock()
 
-PAGE_DEF = StructBlock([
+PAGE_DEF = register_root_definition(StructBlock([
     ('title', FieldBlock(forms.CharField(), label='Title')),
     ('speakers', ListBlock(SpeakerBlock(), label='Speakers')),
     ('content', ContentBlock([
         ('speaker', ExpertSpeakerBlock([('another_specialist_subject', TextInputBlock())], label='Featured speaker')),
-    ])),
-])
+    ], lazy_initialization=True)),
+]))
 
 PAGE_DATA = {
     'title': 'My lovely event',
@@ -46,17 +54,22 @@ PAGE_DATA = {
 
 def show(request):
     page = PAGE_DEF.renderable(PAGE_DATA)
-    return render(request, 'core/show.html', {'self': page})
+    if is_recording():
+        # render within the request, so that the rendering shows up in the recorded block timings
+        return render(request, 'core/show.html', {'self': page})
+    return StreamingHttpResponse(stream_template('core/show.html', {'self': page}, request=request))
 
 def edit(request):
     if request.method == 'POST':
-        value = PAGE_DEF.value_from_datadict(request.POST, request.FILES, 'page')
+        # members of windowed lists / streams that were never loaded into the form, and unchanged members
+        # left out of delta submissions, are restored from PAGE_DATA
+        value = PAGE_DEF.value_from_datadict(request.POST, request.FILES, 'page', stored=PAGE_DATA)
         try:
             clean_value = PAGE_DEF.clean(value)
         except ValidationError as e:
-            page = PAGE_DEF.bind(value, prefix='page', error=e)
+            page = PAGE_DEF.bind(value, prefix='page', error=e, from_stored=False)
 
-            return render(request, 'core/home.html', {
+            return render(request, 'core/edit.html', {
                 'media': PAGE_DEF.all_media(),
                 'html_declarations': PAGE_DEF.all_html_declarations(),
                 'initializer': PAGE_DEF.js_initializer(),
@@ -74,3 +87,79 @@ def edit(request):
             'initializer': PAGE_DEF.js_initializer(),
             'page': page,
         })
+
+
+def new_member_template_version(request, definition_id, child_name):
+    block = get_block_definition(definition_id)
+    if block is None:
+        return None
+    return block.new_member_template_versions().get(child_name)
+
+@condition(etag_func=new_member_template_version)
+def new_member_template(request, definition_id, child_name):
+    """
+    Serve the HTML for a new member of a list / stream block, as returned by Block.new_member_templates
+    """
+    block = get_block_definition(definition_id)
+    if block is None:
+        raise Http404
+    try:
+        html = block.new_member_templates()[child_name]
+    except KeyError:
+        raise Http404
+
+    response = HttpResponse(html, content_type='text/html; charset=utf-8')
+    if request.GET.get('v') == block.new_member_template_versions()[child_name]:
+        # the URL identifies this exact version of the HTML, so it can be cached indefinitely
+        patch_cache_control(response, public=True, max_age=31536000)
+    else:
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+    return response
+
+
+def members_response(request, block, value, root_prefix):
+    """
+    Return a JSON response containing the form HTML for the next page of members of a windowed list / stream
+    within 'value' (a value of 'block', rendered with the prefix 'root_prefix'), as requested by sequence.js:
+    the 'prefix' parameter identifies the list / stream, 'start' the index of the first member to return, and
+    'version' the version of the stored value that the form was rendered from. If that is no longer the
+    current one, the placeholders in the form don't correspond to its members, and a 409 response is returned.
+    """
+    try:
+        sequence_block, sequence_value = resolve_prefix(block, value, root_prefix, request.GET.get('prefix', ''))
+        start = int(request.GET['start'])
+    except (LookupError, ValueError):
+        raise Http404
+    if getattr(sequence_block, 'window_size', None) is None or start < 0:
+        raise Http404
+    if request.GET.get('version') != sequence_block.stored_version(sequence_value):
+        return HttpResponse(status=409)
+
+    members = sequence_block.render_list_members(sequence_value, request.GET['prefix'], start)
+    return JsonResponse({'members': [{'index': index, 'html': html} for (index, html) in members]})
+
+
+def edit_members(request):
+    """Serve members of windowed lists / streams in the edit view's form as they are loaded"""
+    return members_response(request, PAGE_DEF, PAGE_DATA, 'page')
+
+
+def fragment_response(request, block, value, root_prefix):
+    """
+    Return an HTML response containing the form HTML for the part of 'value' (a value of 'block', rendered
+    with the prefix 'root_prefix') identified by the 'prefix' parameter - on a POST request, as read from the
+    submitted form data and validated, along with any errors
+    """
+    try:
+        html = render_subtree_form(
+            block, value, root_prefix, request.GET.get('prefix', ''),
+            data=request.POST if request.method == 'POST' else None, files=request.FILES
+        )
+    except LookupError:
+        raise Http404
+    return HttpResponse(html, content_type='text/html; charset=utf-8')
+
+
+def edit_fragment(request):
+    """Serve the form HTML for part of the edit view's form"""
+    return fragment_response(request, PAGE_DEF, PAGE_DATA, 'page')
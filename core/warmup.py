@@ -0,0 +1,45 @@
+"""
+Up-front preparation of block definitions for long-running server processes.
+
+Block definitions are built at import time, but much of their derived state (fingerprints, media, HTML
+declarations, Javascript initializers, new-member templates, compiled form templates) is only computed
+the first time it is needed. warm_up() computes all of it immediately for the definitions in use - those
+registered with core.blocks.register_root_definition (by model fields, views and the like), and their
+descendants - and freezes them. Other definitions are left alone, as they may still be incorporated into
+new definitions, such as those of a module that is imported later. Called from the WSGI module of an app
+server that loads the application before forking worker processes (e.g. gunicorn --preload), this means
+that workers start with that state already in place - shared copy-on-write with the master process,
+rather than rebuilt in every worker - and the first request to each worker doesn't pay for building it.
+"""
+import gc
+
+from django.core.urlresolvers import get_resolver
+
+from core.blocks import root_block_definitions
+
+
+def warm_up(import_views=True):
+    """
+    Finalise and freeze the registered root block definitions of this process and all of their descendants.
+    If import_views is true, first import every view in the URLconf, so that definitions registered when
+    view modules are imported (such as core.views.PAGE_DEF) are included. Returns the set of definitions
+    frozen.
+    """
+    if import_views:
+        # populating the resolver's reverse lookup table imports all view functions
+        get_resolver(None).reverse_dict
+
+    blocks = set()
+    for root in root_block_definitions():
+        blocks |= root.all_blocks()
+    for block in blocks:
+        block.freeze()
+
+    # collect now, so that the remaining objects are in their final place before forking; and where
+    # available, exempt them from future collections, which would otherwise write to (and so unshare)
+    # the memory pages holding them
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+    return blocks
@@ -113,6 +113,7 @@ MIDDLEWARE_CLASSES = (
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 
     #'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.middleware.BlockMetricsMiddleware',
 )
 
 ROOT_URLCONF = 'wagtailstreamfield.urls'
@@ -153,6 +154,26 @@ INTERNAL_IPS = ('127.0.0.1', '10.0.2.2')
 DEBUG_TOOLBAR_CONFIG = {
     'INTERCEPT_REDIRECTS': False,
 }
+DEBUG_TOOLBAR_PANELS = [
+    'debug_toolbar.panels.versions.VersionsPanel',
+    'debug_toolbar.panels.timer.TimerPanel',
+    'debug_toolbar.panels.settings.SettingsPanel',
+    'debug_toolbar.panels.headers.HeadersPanel',
+    'debug_toolbar.panels.request.RequestPanel',
+    'debug_toolbar.panels.sql.SQLPanel',
+    'debug_toolbar.panels.staticfiles.StaticFilesPanel',
+    'debug_toolbar.panels.templates.TemplatesPanel',
+    'debug_toolbar.panels.cache.CachePanel',
+    'debug_toolbar.panels.signals.SignalsPanel',
+    'debug_toolbar.panels.logging.LoggingPanel',
+    'debug_toolbar.panels.redirects.RedirectsPanel',
+    'core.panels.BlockTimingPanel',
+]
+
+# core.blocks settings
+# Build list / stream form HTML from pre-compiled templates rather than rendering the
+# block_forms templates once per member; turn off if those templates have been customised.
+COMPILED_BLOCK_FORMS = False
 
 # django-compressor settings
 COMPRESS_PRECOMPILERS = (
@@ -178,7 +199,11 @@ LOGGING = {
             'level': 'ERROR',
             'filters': ['require_debug_false'],
             'class': 'django.utils.log.AdminEmailHandler'
-        }
+        },
+        'console': {
+            'level': 'INFO',
+            'class': 'logging.StreamHandler',
+        },
     },
     'loggers': {
         'django.request': {
@@ -186,5 +211,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'core.metrics': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     }
 }
@@ -2,6 +2,23 @@ from .base import *
 
 DEBUG = False
 
+# Cache the rendered HTML of struct blocks in-process; see core.fragment_cache
+BLOCK_FRAGMENT_CACHE = {
+    'MAX_ENTRIES': 1000,
+}
+
+BLOCK_VALIDATION_CACHE = {
+    'MAX_ENTRIES': 10000,
+}
+
+# Record block metrics for 1% of requests, logged every minute by core.metrics.LogExporter
+BLOCK_METRICS = {
+    'SAMPLE_RATE': 0.01,
+}
+
+# Reject block form submissions claiming more than this many list / stream members in total; see core.prefix_view
+BLOCK_MAX_SUBMITTED_MEMBERS = 10000
+
 try:
 	from .local import *
 except ImportError:
@@ -15,4 +15,8 @@ urlpatterns = patterns('',
 
     url(r'^$', 'core.views.show', name='show'),
     url(r'^edit/$', 'core.views.edit', name='edit'),
+    url(r'^edit/members/$', 'core.views.edit_members', name='edit_members'),
+    url(r'^edit/fragment/$', 'core.views.edit_fragment', name='edit_fragment'),
+    url(r'^blocks/(?P<definition_id>[\w-]+)/newmember/(?P<child_name>\w+)/$', 'core.views.new_member_template',
+        name='block_new_member_template'),
 )
@@ -23,6 +23,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "wagtailstreamfield.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+# Build and freeze the block definitions in use now, rather than in each worker on its first request;
+# run gunicorn with --preload so that this happens once, before workers are forked.
+from core.warmup import warm_up
+warm_up()
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)